@@ -1,6 +1,6 @@
 # SpermAnalyzerAI - Database Package
 from .connection import get_db, get_db_session, DatabaseManager, engine, SessionLocal
-from .models import AnalysisRecord, SystemStats, UserSession, Base
+from .models import AnalysisRecord, SystemStats, UserSession, WebhookDelivery, Base
 
 __all__ = [
     "get_db",
@@ -11,5 +11,6 @@ __all__ = [
     "AnalysisRecord",
     "SystemStats", 
     "UserSession",
+    "WebhookDelivery",
     "Base"
 ]
\ No newline at end of file
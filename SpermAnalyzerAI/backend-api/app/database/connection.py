@@ -1,10 +1,11 @@
 # SpermAnalyzerAI - Database Connection Management
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 from contextlib import contextmanager
 from typing import Generator
 import os
+import threading
 from loguru import logger
 
 from .models import Base
@@ -27,6 +28,10 @@ engine = create_engine(
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# StaticPool shares one SQLite connection across threads, so transactions
+# from different threads must not interleave on it
+_session_lock = threading.RLock()
+
 def create_tables():
     """Create all database tables"""
     try:
@@ -36,6 +41,31 @@ def create_tables():
         logger.error(f"Error creating database tables: {e}")
         raise
 
+def migrate_tables():
+    """Add columns and indexes introduced after a table was first created"""
+    try:
+        inspector = inspect(engine)
+        with engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    ))
+                    logger.info(f"Added column {table.name}.{column.name}")
+                
+                for index in table.indexes:
+                    index.create(bind=connection, checkfirst=True)
+    except Exception as e:
+        logger.error(f"Error migrating database tables: {e}")
+        raise
+
 def get_db() -> Generator[Session, None, None]:
     """
     Dependency function to get database session
@@ -58,17 +88,20 @@ def get_db_session() -> Generator[Session, None, None]:
     Usage: 
     with get_db_session() as db:
         # use db session
+    
+    Transactions are serialized across threads (one shared connection).
     """
-    db = SessionLocal()
-    try:
-        yield db
-        db.commit()
-    except Exception as e:
-        logger.error(f"Database transaction error: {e}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    with _session_lock:
+        db = SessionLocal()
+        try:
+            yield db
+            db.commit()
+        except Exception as e:
+            logger.error(f"Database transaction error: {e}")
+            db.rollback()
+            raise
+        finally:
+            db.close()
 
 class DatabaseManager:
     """Database management utilities"""
@@ -79,11 +112,12 @@ class DatabaseManager:
         try:
             # Create tables
             create_tables()
+            migrate_tables()
             
             # Create necessary directories
             os.makedirs(settings.UPLOAD_PATH, exist_ok=True)
             os.makedirs(settings.RESULTS_PATH, exist_ok=True)
-            os.makedirs(os.path.dirname(settings.DATABASE_PATH), exist_ok=True)
+            os.makedirs(os.path.dirname(settings.DATABASE_PATH) or ".", exist_ok=True)
             
             logger.info("Database initialized successfully")
             
@@ -95,7 +129,7 @@ class DatabaseManager:
     def cleanup_old_records(days: int = 30):
         """Remove analysis records older than specified days"""
         from datetime import datetime, timedelta
-        from .models import AnalysisRecord
+        from .models import AnalysisRecord, WebhookDelivery
         
         try:
             cutoff_date = datetime.now() - timedelta(days=days)
@@ -121,6 +155,14 @@ class DatabaseManager:
                 
                 logger.info(f"Cleaned up {deleted_count} old analysis records")
                 
+                # Delete finished webhook deliveries
+                deleted_deliveries = db.query(WebhookDelivery).filter(
+                    WebhookDelivery.status != "pending",
+                    WebhookDelivery.created_at < cutoff_date
+                ).delete()
+                
+                logger.info(f"Cleaned up {deleted_deliveries} old webhook deliveries")
+                
         except Exception as e:
             logger.error(f"Cleanup failed: {e}")
     
@@ -19,10 +19,22 @@ class AnalysisRecord(Base):
     file_size = Column(Integer, nullable=False)
     
     # Analysis status
-    status = Column(String, default="pending")  # pending, processing, completed, failed
+    status = Column(String, default="pending", index=True)  # pending, processing, completed, failed
     progress = Column(Float, default=0.0)
+    progress_message = Column(Text, nullable=True)  # latest stage message, shared with other workers
+    progress_eta = Column(Integer, nullable=True)  # estimated seconds remaining
     error_message = Column(Text, nullable=True)
     
+    # Job queue
+    worker_id = Column(String, nullable=True)  # worker currently holding the job
+    attempts = Column(Integer, default=0)
+    heartbeat_at = Column(DateTime, nullable=True)
+    estimated_memory_mb = Column(Float, nullable=True)  # admission estimate from frame count x resolution
+    priority = Column(String, default="standard")  # interactive, standard, batch
+    estimated_cost = Column(Float, nullable=True)  # estimated processing seconds
+    schedule_key = Column(Float, nullable=True, index=True)  # priority class + cost, aged by enqueue time
+    webhook_url = Column(Text, nullable=True)  # completion callback registered by the client
+    
     # Timestamps
     created_at = Column(DateTime, default=func.now())
     started_at = Column(DateTime, nullable=True)
@@ -64,8 +76,26 @@ class AnalysisRecord(Base):
     sample_quality = Column(String, nullable=True)  # excellent, good, poor
     confidence_score = Column(Float, nullable=True)
     
-    # Additional metadata
-    metadata = Column(JSON, nullable=True)
+    # Additional metadata ("metadata" is reserved by SQLAlchemy's declarative base)
+    extra_metadata = Column("metadata", JSON, nullable=True)
+
+class WebhookDelivery(Base):
+    """Outbox of webhook notifications, kept until delivered so restarts don't drop them"""
+    __tablename__ = "webhook_deliveries"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))  # sent as the delivery id
+    analysis_id = Column(String, nullable=False, index=True)
+    event = Column(String, nullable=False)  # analysis.completed, analysis.failed, analysis.cancelled
+    url = Column(Text, nullable=False)
+    payload = Column(JSON, nullable=False)
+    
+    # Delivery state
+    status = Column(String, default="pending", index=True)  # pending, delivered, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, index=True)  # also the in-flight lease
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    delivered_at = Column(DateTime, nullable=True)
 
 class SystemStats(Base):
     """Database model for storing system performance statistics"""
@@ -92,7 +122,7 @@ class SystemStats(Base):
     avg_processing_time = Column(Float, nullable=True)
     
     # Additional metrics
-    metadata = Column(JSON, nullable=True)
+    extra_metadata = Column("metadata", JSON, nullable=True)
 
 class UserSession(Base):
     """Database model for tracking user sessions (optional)"""
@@ -13,7 +13,10 @@ import logging
 
 from .routes import analysis, results, status
 from .services.sperm_analyzer import SpermAnalyzer
-from .models.analysis_models import AnalysisResult, AnalysisStatus
+from .services.analysis_worker import AnalysisWorker
+from .services.webhooks import WebhookDispatcher, WebhookOutbox
+from .services.job_queue import JobQueue
+from .models.analysis_models import AnalysisRequest, AnalysisResult, AnalysisStatus
 from .utils.config import settings
 from .utils.logger import setup_logger
 from .database import DatabaseManager
@@ -69,6 +72,40 @@ async def startup_event():
         await sperm_analyzer.initialize()
         logger.info("✅ تم تحميل نموذج YOLOv8 بنجاح")
         
+        # مشاركة المحلل المهيأ (النموذج ومجمع المتتبعات) مع مسارات التحليل
+        analysis.analyzer = sperm_analyzer
+        
+        # مرسل إشعارات webhook (يستأنف الإشعارات المعلقة في الصندوق)
+        webhook_config = settings.get_webhook_config()
+        analysis.webhooks = WebhookDispatcher(
+            WebhookOutbox(),
+            secret_key=webhook_config['secret_key'],
+            default_url=webhook_config['default_url'],
+            timeout=webhook_config['timeout'],
+            max_concurrency=webhook_config['max_concurrency'],
+            max_attempts=webhook_config['max_attempts'],
+            backoff_base=webhook_config['backoff_base'],
+            backoff_max=webhook_config['backoff_max'],
+            allowed_hosts=webhook_config['allowed_hosts']
+        )
+        await analysis.webhooks.start()
+        
+        # عامل طابور التحليلات (يستأنف أيضاً المهام المعلقة قبل إعادة التشغيل)؛
+        # عقد API المنفصلة (WORKER_ENABLED=false) تدرج المهام فقط
+        queue_config = settings.get_queue_config()
+        if queue_config['worker_enabled']:
+            analysis.worker = AnalysisWorker(
+                sperm_analyzer,
+                analysis.get_job_queue(),
+                concurrency=queue_config['concurrency'],
+                poll_interval=queue_config['poll_interval'],
+                heartbeat_interval=queue_config['heartbeat_interval'],
+                progress_flush_interval=queue_config['progress_flush_interval'],
+                interactive_slots=queue_config['interactive_slots'],
+                webhooks=analysis.webhooks
+            )
+            await analysis.worker.start()
+        
     except Exception as e:
         logger.error(f"❌ فشل في التهيئة: {e}")
         # يمكن للتطبيق العمل بدون النموذج للاختبار
@@ -78,6 +115,12 @@ async def startup_event():
 async def shutdown_event():
     """تنظيف الموارد عند الإغلاق"""
     logger.info("🛑 إيقاف تشغيل Sperm Analyzer AI API")
+    
+    if analysis.worker is not None:
+        await analysis.worker.stop()
+    
+    if analysis.webhooks is not None:
+        await analysis.webhooks.stop()
 
 # تضمين المسارات
 app.include_router(analysis.router, prefix="/api/v1", tags=["Analysis"])
@@ -159,49 +202,19 @@ async def upload_file(file: UploadFile = File(...)):
         logger.error(f"خطأ في رفع الملف: {e}")
         raise HTTPException(status_code=500, detail="فشل في رفع الملف")
 
-@app.post("/analyze", response_class=JSONResponse)
-async def analyze_sample(analysis_id: str):
-    """تحليل العينة"""
-    try:
-        # البحث عن الملف
-        file_path = None
-        for ext in [".jpg", ".jpeg", ".png", ".bmp", ".mp4", ".avi", ".mov", ".mkv"]:
-            potential_path = f"uploads/{analysis_id}{ext}"
-            if os.path.exists(potential_path):
-                file_path = potential_path
-                break
-        
-        if not file_path:
-            raise HTTPException(
-                status_code=404,
-                detail="الملف غير موجود"
-            )
-        
-        # التحقق من وجود المحلل
-        if sperm_analyzer is None:
-            # محاكاة التحليل للاختبار
-            logger.warning("محاكاة التحليل - النموذج غير محمل")
-            result = await simulate_analysis(analysis_id, file_path)
-        else:
-            # التحليل الفعلي
-            logger.info(f"بدء تحليل العينة: {analysis_id}")
-            result = await sperm_analyzer.analyze_sample(file_path, analysis_id)
-        
-        # حفظ النتائج
-        result_path = f"results/{analysis_id}.json"
-        with open(result_path, "w", encoding="utf-8") as f:
-            import json
-            json.dump(result.dict(), f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"تم تحليل العينة بنجاح: {analysis_id}")
-        
-        return result
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"خطأ في التحليل: {e}")
-        raise HTTPException(status_code=500, detail="فشل في تحليل العينة")
+@app.post("/analyze", response_class=JSONResponse, status_code=202,
+          dependencies=[Depends(analysis.enforce_rate_limit)])
+async def analyze_sample(
+    request: AnalysisRequest,
+    queue: JobQueue = Depends(analysis.get_job_queue)
+):
+    """تحليل العينة (مسار قديم)
+
+    يُدرج التحليل في طابور /api/v1/analyze نفسه ويُرجع 202؛ التحليل ينفذه
+    العامل (النبض والإلغاء وحفظ النتيجة الذري) ولا يعمل داخل الطلب، ويخضع
+    لنفس حد الطلبات وفحص الوسائط وميزانية الذاكرة والتزامن.
+    """
+    return await analysis.analyze_sample(request, queue)
 
 @app.get("/results/{analysis_id}", response_class=JSONResponse)
 async def get_results(analysis_id: str):
@@ -266,56 +279,6 @@ async def export_results(analysis_id: str, format: str = "json"):
         logger.error(f"خطأ في التصدير: {e}")
         raise HTTPException(status_code=500, detail="فشل في التصدير")
 
-async def simulate_analysis(analysis_id: str, file_path: str) -> AnalysisResult:
-    """محاكاة التحليل للاختبار"""
-    import random
-    from .models.analysis_models import (
-        AnalysisResult, CasaParameters, SpermMorphology, 
-        VelocityDataPoint, AnalysisMetadata
-    )
-    
-    # محاكاة وقت التحليل
-    await asyncio.sleep(2)
-    
-    # إنتاج بيانات محاكاة واقعية
-    return AnalysisResult(
-        id=analysis_id,
-        fileName=os.path.basename(file_path),
-        fileSize=os.path.getsize(file_path),
-        analysisDate=datetime.now(),
-        spermCount=random.randint(20, 80),
-        motility=random.uniform(40, 85),
-        concentration=random.uniform(15, 40),
-        casaParameters=CasaParameters(
-            vcl=random.uniform(60, 120),
-            vsl=random.uniform(30, 80),
-            vap=random.uniform(45, 95),
-            lin=random.uniform(40, 80),
-            str=random.uniform(60, 90),
-            wob=random.uniform(50, 85),
-            alh=random.uniform(2, 8),
-            bcf=random.uniform(8, 25),
-            mot=random.uniform(40, 85)
-        ),
-        morphology=SpermMorphology(
-            normal=random.uniform(60, 90),
-            abnormal=random.uniform(10, 40),
-            headDefects=random.uniform(5, 20),
-            tailDefects=random.uniform(3, 15),
-            neckDefects=random.uniform(1, 8)
-        ),
-        velocityDistribution=[
-            VelocityDataPoint(timePoint=i, velocity=random.uniform(40, 80))
-            for i in range(10)
-        ],
-        metadata=AnalysisMetadata(
-            modelVersion="YOLOv8-mock",
-            confidence=random.uniform(0.85, 0.98),
-            processingTime=random.randint(1500, 3000),
-            additionalData={"simulation": True}
-        )
-    )
-
 async def convert_to_csv(json_path: str, csv_path: str):
     """تحويل JSON إلى CSV"""
     import json
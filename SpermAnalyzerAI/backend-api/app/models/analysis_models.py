@@ -5,12 +5,14 @@ from enum import Enum
 
 class AnalysisStatus(str, Enum):
     """حالات التحليل"""
+    UPLOADED = "uploaded"
     PENDING = "pending"
     UPLOADING = "uploading" 
     PROCESSING = "processing"
     ANALYZING = "analyzing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class AnalysisQuality(str, Enum):
     """جودة التحليل"""
@@ -63,6 +65,10 @@ class VelocityDataPoint(BaseModel):
     """نقطة بيانات السرعة"""
     time_point: int = Field(..., description="النقطة الزمنية (ثانية)")
     velocity: float = Field(..., description="السرعة (μm/s)")
+    vsl: Optional[float] = Field(None, description="متوسط السرعة المستقيمة في النافذة (μm/s)")
+    vap: Optional[float] = Field(None, description="متوسط سرعة المسار في النافذة (μm/s)")
+    motility: Optional[float] = Field(None, description="نسبة الحركة في النافذة (%)")
+    track_count: Optional[int] = Field(None, description="عدد المسارات في النافذة")
 
 class SpermTrackingData(BaseModel):
     """بيانات تتبع الحيوان المنوي"""
@@ -72,6 +78,16 @@ class SpermTrackingData(BaseModel):
     displacement: float = Field(..., description="الإزاحة")
     duration: float = Field(..., description="المدة الزمنية")
 
+class CasaDistribution(BaseModel):
+    """توزيع مؤشر CASA عبر جميع المسارات"""
+    bin_start: float = Field(..., description="بداية الفئة الأولى")
+    bin_width: float = Field(..., description="عرض الفئة")
+    counts: List[int] = Field(..., description="عدد المسارات في كل فئة")
+    p10: float = Field(..., description="المئين العاشر")
+    p50: float = Field(..., description="الوسيط")
+    p90: float = Field(..., description="المئين التسعون")
+    count: int = Field(..., description="عدد المسارات")
+
 class AnalysisMetadata(BaseModel):
     """معلومات إضافية عن التحليل"""
     model_version: str = Field(..., description="إصدار النموذج")
@@ -80,6 +96,8 @@ class AnalysisMetadata(BaseModel):
     frame_count: Optional[int] = Field(None, description="عدد الإطارات (للفيديو)")
     fps: Optional[float] = Field(None, description="معدل الإطارات")
     resolution: Optional[str] = Field(None, description="دقة الصورة/الفيديو")
+    partial: bool = Field(False, description="نتيجة جزئية بسبب انتهاء مهلة التحليل")
+    frames_processed: Optional[int] = Field(None, description="عدد الإطارات المعالجة")
     additional_data: Dict[str, Any] = Field(default_factory=dict, description="بيانات إضافية")
 
 class AnalysisResult(BaseModel):
@@ -89,6 +107,7 @@ class AnalysisResult(BaseModel):
     file_size: int = Field(..., description="حجم الملف بالبايت")
     analysis_date: datetime = Field(..., description="تاريخ التحليل")
     status: AnalysisStatus = Field(default=AnalysisStatus.COMPLETED, description="حالة التحليل")
+    provisional: bool = Field(False, description="نتيجة أولية سريعة تُستبدل بالنتيجة النهائية")
     
     # النتائج الأساسية
     sperm_count: int = Field(..., description="عدد الحيوانات المنوية")
@@ -99,6 +118,7 @@ class AnalysisResult(BaseModel):
     casa_parameters: CasaParameters = Field(..., description="مؤشرات CASA")
     morphology: SpermMorphology = Field(..., description="تحليل الشكل")
     velocity_distribution: List[VelocityDataPoint] = Field(..., description="توزيع السرعة")
+    casa_distributions: Optional[Dict[str, CasaDistribution]] = Field(None, description="توزيعات مؤشرات CASA عبر المسارات")
     
     # بيانات التتبع (اختيارية)
     tracking_data: Optional[List[SpermTrackingData]] = Field(None, description="بيانات التتبع")
@@ -195,6 +215,7 @@ class AnalysisRequest(BaseModel):
     """طلب التحليل"""
     analysis_id: str = Field(..., description="معرف التحليل")
     file_path: Optional[str] = Field(None, description="مسار الملف")
+    priority: Optional[str] = Field(None, description="فئة الأولوية: interactive (للصور فقط), standard, batch")
     parameters: Optional[Dict[str, Any]] = Field(default_factory=dict, description="معاملات إضافية")
 
 class AnalysisProgress(BaseModel):
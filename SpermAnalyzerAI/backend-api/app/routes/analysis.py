@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, BackgroundTasks
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, Request, Query, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Dict, List, Optional
 import os
+import json
+import struct
 import uuid
 import asyncio
 from datetime import datetime
@@ -9,9 +11,16 @@ import logging
 
 from ..models.analysis_models import (
     AnalysisResult, AnalysisRequest, AnalysisProgress, 
-    SuccessResponse, ErrorResponse
+    AnalysisStatus, SuccessResponse, ErrorResponse
 )
 from ..services.sperm_analyzer import SpermAnalyzer
+from ..services.job_queue import JobQueue, create_job_queue
+from ..services.admission import AdmissionRejected, RateLimiter
+from ..services.analysis_worker import AnalysisWorker
+from ..services.webhooks import WebhookDispatcher, WebhookURLRejected, check_webhook_url
+from ..services.progress_broker import FINAL_STATUSES, ProgressThrottle, stream_progress
+from ..services.live_analysis import LiveAnalysisSession
+from ..utils.config import settings
 from ..utils.file_utils import validate_file, save_upload_file
 
 router = APIRouter()
@@ -20,6 +29,19 @@ logger = logging.getLogger(__name__)
 # متغير شامل للمحلل (سيتم حقنه)
 analyzer: Optional[SpermAnalyzer] = None
 
+# طابور التحليلات وعامل العملية الحالية (سيتم حقنهما عند البدء)
+job_queue: Optional[JobQueue] = None
+worker: Optional[AnalysisWorker] = None
+
+# مرسل إشعارات webhook (سيتم حقنه عند البدء)
+webhooks: Optional[WebhookDispatcher] = None
+
+# محدد معدل طلبات الإرسال لكل عميل (api_rate_limit طلب في الدقيقة)
+rate_limiter: Optional[RateLimiter] = None
+
+# جلسات التحليل المباشر المفتوحة في هذه العملية
+live_sessions: Dict[str, LiveAnalysisSession] = {}
+
 def get_analyzer():
     """الحصول على محلل الحيوانات المنوية"""
     global analyzer
@@ -27,10 +49,35 @@ def get_analyzer():
         analyzer = SpermAnalyzer()
     return analyzer
 
-@router.post("/upload", response_model=SuccessResponse)
+def get_job_queue():
+    """الحصول على طابور التحليلات"""
+    global job_queue
+    if job_queue is None:
+        job_queue = create_job_queue(
+            settings.get_queue_config(),
+            detect_interval=settings.get_tracking_config()['detect_interval']
+        )
+    return job_queue
+
+def enforce_rate_limit(request: Request):
+    """رفض طلبات الإرسال التي تتجاوز حد العميل بـ 429"""
+    global rate_limiter
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(settings.api_rate_limit, max_clients=settings.cache_max_size)
+    
+    client_id = request.client.host if request.client else "unknown"
+    allowed, retry_after = rate_limiter.acquire(client_id)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="تم تجاوز حد الطلبات، يرجى المحاولة لاحقاً",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+@router.post("/upload", response_model=SuccessResponse, dependencies=[Depends(enforce_rate_limit)])
 async def upload_file_for_analysis(
     file: UploadFile = File(...),
-    analyzer: SpermAnalyzer = Depends(get_analyzer)
+    queue: JobQueue = Depends(get_job_queue)
 ):
     """
     رفع ملف للتحليل
@@ -54,6 +101,11 @@ async def upload_file_for_analysis(
         # حفظ الملف
         file_path = await save_upload_file(file, analysis_id)
         
+        # تسجيل خصائص الوسائط المقروءة أثناء التحقق لتقدير كلفة التحليل
+        job = await asyncio.to_thread(
+            queue.register_upload, analysis_id, file_path, validation_result.get('media')
+        )
+        
         logger.info(f"تم رفع الملف بنجاح: {file.filename} -> {analysis_id}")
         
         return SuccessResponse(
@@ -62,7 +114,8 @@ async def upload_file_for_analysis(
                 "analysis_id": analysis_id,
                 "filename": file.filename,
                 "file_size": validation_result['size'],
-                "file_type": validation_result['type']
+                "file_type": validation_result['type'],
+                "estimated_cost": job['estimated_cost']
             }
         )
         
@@ -75,17 +128,17 @@ async def upload_file_for_analysis(
             detail="فشل في رفع الملف"
         )
 
-@router.post("/analyze", response_model=AnalysisResult)
+@router.post("/analyze", response_model=SuccessResponse, status_code=202,
+             dependencies=[Depends(enforce_rate_limit)])
 async def analyze_sample(
     request: AnalysisRequest,
-    background_tasks: BackgroundTasks,
-    analyzer: SpermAnalyzer = Depends(get_analyzer)
+    queue: JobQueue = Depends(get_job_queue)
 ):
     """
     تحليل عينة الحيوانات المنوية
     
-    يستخدم نموذج YOLOv8 المتقدم لكشف وتتبع الحيوانات المنوية
-    وحساب جميع مؤشرات CASA المطلوبة
+    يُدرج التحليل في الطابور ويُرجع 202 فوراً؛ يتابع العميل التقدم عبر
+    /analyze/{analysis_id}/progress ثم يجلب النتيجة من /results/{analysis_id}
     """
     try:
         analysis_id = request.analysis_id
@@ -98,24 +151,18 @@ async def analyze_sample(
                 detail="الملف غير موجود"
             )
         
-        # بدء التحليل
-        logger.info(f"بدء تحليل العينة: {analysis_id}")
-        
         try:
-            # التحليل الفعلي
-            result = await analyzer.analyze_sample(file_path, analysis_id)
-            
-            # حفظ النتائج في الخلفية
-            background_tasks.add_task(_save_results, analysis_id, result)
-            
-            return result
-            
-        except Exception as analysis_error:
-            logger.error(f"خطأ في تحليل العينة {analysis_id}: {analysis_error}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"فشل في تحليل العينة: {str(analysis_error)}"
-            )
+            job = await asyncio.to_thread(queue.enqueue, analysis_id, file_path, request.priority)
+        except AdmissionRejected as rejected:
+            raise _too_many_requests(rejected)
+        _notify_worker()
+        
+        logger.info(f"تم إدراج العينة في طابور التحليل: {analysis_id}")
+        
+        return SuccessResponse(
+            message="تم قبول طلب التحليل",
+            data=_job_response(job)
+        )
         
     except HTTPException:
         raise
@@ -129,15 +176,17 @@ async def analyze_sample(
 @router.get("/analyze/{analysis_id}/progress", response_model=AnalysisProgress)
 async def get_analysis_progress(
     analysis_id: str,
-    analyzer: SpermAnalyzer = Depends(get_analyzer)
+    analyzer: SpermAnalyzer = Depends(get_analyzer),
+    queue: JobQueue = Depends(get_job_queue)
 ):
     """
     جلب تقدم التحليل الحالي
     """
     try:
-        progress = analyzer.get_analysis_progress(analysis_id)
+        job = await asyncio.to_thread(queue.get, analysis_id)
+        progress = _current_progress(job, analyzer.get_analysis_progress(analysis_id))
         
-        if not progress:
+        if progress is None:
             raise HTTPException(
                 status_code=404,
                 detail="التحليل غير موجود"
@@ -154,11 +203,181 @@ async def get_analysis_progress(
             detail="فشل في جلب تقدم التحليل"
         )
 
-@router.post("/analyze/batch", response_model=SuccessResponse)
+@router.post("/analyze/progress", response_model=SuccessResponse)
+async def get_analyses_progress(
+    analysis_ids: list[str],
+    analyzer: SpermAnalyzer = Depends(get_analyzer),
+    queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    جلب تقدم عدة تحليلات في طلب واحد
+    
+    التحليلات الجارية في هذه العملية تُقرأ من الذاكرة، والبقية بقراءة
+    واحدة من الطابور بدلاً من طلب لكل تحليل
+    """
+    try:
+        analysis_ids = list(dict.fromkeys(analysis_ids))
+        max_ids = settings.get_progress_stream_config()['bulk_max_ids']
+        if not analysis_ids or len(analysis_ids) > max_ids:
+            raise HTTPException(
+                status_code=400,
+                detail=f"يجب تحديد 1 إلى {max_ids} تحليل"
+            )
+        
+        local = {analysis_id: analyzer.get_analysis_progress(analysis_id) for analysis_id in analysis_ids}
+        progress = {}
+        for analysis_id, state in local.items():
+            # النتيجة لا تُحفظ إلا بعد اكتمال التحليل في الذاكرة، فالحالة النهائية من الطابور
+            if state is not None and state.status not in FINAL_STATUSES:
+                progress[analysis_id] = state
+        
+        missing = [analysis_id for analysis_id in analysis_ids if analysis_id not in progress]
+        jobs = await asyncio.to_thread(queue.get_many, missing) if missing else {}
+        for analysis_id in missing:
+            current = _current_progress(jobs.get(analysis_id), local[analysis_id])
+            if current is not None:
+                progress[analysis_id] = current
+        
+        not_found = [analysis_id for analysis_id in analysis_ids if analysis_id not in progress]
+        
+        return SuccessResponse(
+            message=f"تم جلب تقدم {len(progress)} تحليل",
+            data={
+                "progress": [progress[analysis_id].dict() for analysis_id in analysis_ids if analysis_id in progress],
+                "not_found": not_found
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطأ في جلب تقدم التحليلات: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="فشل في جلب تقدم التحليلات"
+        )
+
+@router.get("/analyze/progress/stream")
+async def stream_analyses_progress(
+    ids: List[str] = Query(..., description="معرفات التحليلات (مكررة أو مفصولة بفواصل)"),
+    analyzer: SpermAnalyzer = Depends(get_analyzer),
+    queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    بث تقدم عدة تحليلات عبر اتصال واحد (Server-Sent Events)
+    
+    الأحداث: progress (AnalysisProgress عند التغييرات المهمة فقط)، result
+    (معرف النتيجة عند انتهاء كل تحليل)، error (تحليل غير موجود). يُغلق البث
+    عند انتهاء جميع التحليلات
+    """
+    analysis_ids = list(dict.fromkeys(
+        analysis_id.strip() for value in ids for analysis_id in value.split(",") if analysis_id.strip()
+    ))
+    max_ids = settings.get_progress_stream_config()['max_ids']
+    if not analysis_ids or len(analysis_ids) > max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"يجب تحديد 1 إلى {max_ids} تحليل"
+        )
+    return _progress_stream_response(analysis_ids, analyzer, queue)
+
+@router.get("/analyze/{analysis_id}/progress/stream")
+async def stream_analysis_progress(
+    analysis_id: str,
+    analyzer: SpermAnalyzer = Depends(get_analyzer),
+    queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    بث تقدم تحليل واحد (Server-Sent Events) بدلاً من الاستطلاع
+    """
+    return _progress_stream_response([analysis_id], analyzer, queue)
+
+@router.websocket("/analyze/live")
+async def live_analysis(websocket: WebSocket):
+    """
+    تحليل مباشر لإطارات الكاميرا عبر WebSocket
+    
+    العميل يرسل رسائل ثنائية: طابع زمني (float64 big-endian بالثواني) يليه
+    إطار مضغوط (JPEG/PNG)، أو {"type": "stop"} لإنهاء الجلسة. الخادم يرسل
+    {"type": "estimate"} كل live_update_interval ثانية و{"type": "summary"}
+    عند الإنهاء. الإطارات التي تصل أثناء معالجة إطار سابق تُسقط عدا أحدثها
+    """
+    config = settings.get_live_config()
+    await websocket.accept()
+    
+    if len(live_sessions) >= config['max_sessions']:
+        await websocket.send_json({"type": "error", "detail": "تم بلوغ الحد الأقصى لجلسات التحليل المباشر"})
+        await websocket.close(code=1013)
+        return
+    
+    session = LiveAnalysisSession(get_analyzer(), str(uuid.uuid4()), config['window_seconds'])
+    live_sessions[session.session_id] = session
+    logger.info(f"بدء جلسة تحليل مباشر: {session.session_id}")
+    
+    connected = True
+    close_code = 1000
+    processing = asyncio.create_task(session.run())
+    sender = None
+    try:
+        await websocket.send_json({
+            "type": "session",
+            "session_id": session.session_id,
+            "update_interval": config['update_interval'],
+            "window_seconds": config['window_seconds'],
+            "max_frame_size": config['max_frame_size']
+        })
+        sender = asyncio.create_task(
+            _send_live_estimates(websocket, session, config['update_interval'])
+        )
+        
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                connected = False
+                break
+            
+            data = message.get('bytes')
+            if data is not None:
+                if len(data) > config['max_frame_size']:
+                    close_code = 1009
+                    break
+                if len(data) <= 8:
+                    session.invalid += 1
+                    continue
+                timestamp, = struct.unpack_from(">d", data)
+                session.submit(timestamp, data[8:])
+            elif message.get('text'):
+                try:
+                    command = json.loads(message['text'])
+                except ValueError:
+                    continue
+                if isinstance(command, dict) and command.get('type') == 'stop':
+                    break
+                
+    except Exception as e:
+        logger.error(f"خطأ في جلسة التحليل المباشر {session.session_id}: {e}")
+        close_code = 1011
+    finally:
+        tasks = [task for task in (processing, sender) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        live_sessions.pop(session.session_id, None)
+        session.close()
+    
+    logger.info(f"انتهت جلسة التحليل المباشر {session.session_id}: {session.stats()}")
+    if connected:
+        try:
+            await websocket.send_json({"type": "summary", "session_id": session.session_id, **session.estimate()})
+            await websocket.close(code=close_code)
+        except Exception:
+            pass
+
+@router.post("/analyze/batch", response_model=SuccessResponse, status_code=202,
+             dependencies=[Depends(enforce_rate_limit)])
 async def analyze_batch(
     analysis_ids: list[str],
-    background_tasks: BackgroundTasks,
-    analyzer: SpermAnalyzer = Depends(get_analyzer)
+    queue: JobQueue = Depends(get_job_queue)
 ):
     """
     تحليل دفعة من العينات
@@ -178,17 +397,30 @@ async def analyze_batch(
                 detail="لم يتم العثور على أي ملفات صالحة"
             )
         
-        # بدء التحليل في الخلفية
+        # إدراج العينات في الطابور حتى امتلائه
+        accepted, rejected = [], []
+        last_rejection = None
         for analysis_id, file_path in valid_files:
-            background_tasks.add_task(_analyze_in_background, analyzer, file_path, analysis_id)
+            try:
+                await asyncio.to_thread(queue.enqueue, analysis_id, file_path, 'batch')
+                accepted.append(analysis_id)
+            except AdmissionRejected as e:
+                rejected.append(analysis_id)
+                last_rejection = e
+        
+        if not accepted:
+            raise _too_many_requests(last_rejection)
+        _notify_worker()
         
-        logger.info(f"بدء تحليل دفعة من {len(valid_files)} عينة")
+        logger.info(f"تم إدراج دفعة من {len(accepted)} عينة في الطابور")
         
         return SuccessResponse(
-            message=f"تم بدء تحليل {len(valid_files)} عينة",
+            message=f"تم قبول تحليل {len(accepted)} عينة",
             data={
-                "total_files": len(valid_files),
-                "analysis_ids": [aid for aid, _ in valid_files]
+                "total_files": len(accepted),
+                "analysis_ids": accepted,
+                "rejected_ids": rejected,
+                "retry_after": last_rejection.retry_after if last_rejection else None
             }
         )
         
@@ -204,12 +436,21 @@ async def analyze_batch(
 @router.delete("/analyze/{analysis_id}", response_model=SuccessResponse)
 async def cancel_analysis(
     analysis_id: str,
-    analyzer: SpermAnalyzer = Depends(get_analyzer)
+    analyzer: SpermAnalyzer = Depends(get_analyzer),
+    queue: JobQueue = Depends(get_job_queue)
 ):
     """
     إلغاء تحليل جاري
+    
+    تُعلَّم المهمة cancelled فوراً (فتتحرر سعتها)، ويتوقف التحليل الجاري
+    خلال إطار واحد؛ في عملية أخرى يتوقف عند نبضها التالي
     """
     try:
+        previous_status = await asyncio.to_thread(queue.cancel, analysis_id)
+        stopped = analyzer.cancel_analysis(analysis_id)
+        if previous_status is not None:
+            await _publish_finished(analysis_id, queue, analyzer)
+        
         # مسح ذاكرة التخزين المؤقت
         analyzer.clear_analysis_cache(analysis_id)
         
@@ -220,7 +461,11 @@ async def cancel_analysis(
         
         return SuccessResponse(
             message="تم إلغاء التحليل بنجاح",
-            data={"analysis_id": analysis_id}
+            data={
+                "analysis_id": analysis_id,
+                "previous_status": previous_status,
+                "stopped": stopped
+            }
         )
         
     except Exception as e:
@@ -241,30 +486,114 @@ async def _find_uploaded_file(analysis_id: str) -> Optional[str]:
     
     return None
 
-async def _save_results(analysis_id: str, result: AnalysisResult):
-    """حفظ نتائج التحليل"""
+async def _publish_finished(analysis_id: str, queue: JobQueue,
+                            analyzer: Optional[SpermAnalyzer] = None):
+    """نشر انتهاء التحليل لاتصالات البث وحفظ إشعار webhook"""
     try:
-        import json
-        
-        os.makedirs("results", exist_ok=True)
-        result_path = f"results/{analysis_id}.json"
-        
-        with open(result_path, "w", encoding="utf-8") as f:
-            json.dump(result.dict(), f, ensure_ascii=False, indent=2, default=str)
-        
-        logger.info(f"تم حفظ نتائج التحليل: {analysis_id}")
-        
+        job = await asyncio.to_thread(queue.get, analysis_id)
+        if job is None:
+            return
+        if analyzer is not None:
+            analyzer.progress_broker.finish(job)
+        if webhooks is not None:
+            await webhooks.publish(job)
     except Exception as e:
-        logger.error(f"خطأ في حفظ النتائج: {e}")
+        logger.error(f"خطأ في حفظ إشعار التحليل {analysis_id}: {e}")
 
-async def _analyze_in_background(analyzer: SpermAnalyzer, file_path: str, analysis_id: str):
-    """تحليل في الخلفية"""
-    try:
-        result = await analyzer.analyze_sample(file_path, analysis_id)
-        await _save_results(analysis_id, result)
-        
-    except Exception as e:
-        logger.error(f"خطأ في التحليل الخلفي للعينة {analysis_id}: {e}")
+def _notify_worker():
+    """إيقاظ عامل العملية الحالية بدلاً من انتظار دورة الاستطلاع"""
+    if worker is not None:
+        worker.notify()
+
+def _too_many_requests(rejected: AdmissionRejected) -> HTTPException:
+    """استجابة 429 عند تشبع طابور التحليل"""
+    return HTTPException(
+        status_code=429,
+        detail=str(rejected),
+        headers={"Retry-After": str(rejected.retry_after)}
+    )
+
+def _job_response(job: dict) -> dict:
+    """بيانات استجابة 202 لمهمة في الطابور"""
+    analysis_id = job['analysis_id']
+    return {
+        "analysis_id": analysis_id,
+        "status": job['status'],
+        "progress_url": f"/api/v1/analyze/{analysis_id}/progress",
+        "result_url": f"/api/v1/results/{analysis_id}"
+    }
+
+def _progress_stream_response(analysis_ids: List[str], analyzer: SpermAnalyzer,
+                              queue: JobQueue) -> StreamingResponse:
+    """استجابة SSE لتقدم التحليلات"""
+    config = settings.get_progress_stream_config()
+    
+    async def fetch_jobs(ids: List[str]) -> dict:
+        return await asyncio.to_thread(queue.get_many, ids)
+    
+    async def events():
+        # إعادة الاتصال التلقائي في EventSource بعد 3 ثوان
+        yield "retry: 3000\n\n"
+        async for event, data in stream_progress(
+            analysis_ids,
+            analyzer.progress_broker,
+            fetch_jobs,
+            analyzer.get_analysis_progress,
+            _job_progress,
+            ProgressThrottle(config['min_delta'], config['min_interval']),
+            poll_interval=config['poll_interval'],
+            keepalive=config['keepalive']
+        ):
+            if event == "keepalive":
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _current_progress(job: Optional[dict], progress: Optional[AnalysisProgress]) -> Optional[AnalysisProgress]:
+    """تقدم التحليل من ذاكرة المحلل أو من حالة مهمته في الطابور؛ None إن لم يوجد"""
+    # ذاكرة العملية المنفذة أحدث من آخر دفعة كُتبت في الطابور
+    if job is None or (progress and job['status'] == AnalysisStatus.PROCESSING.value):
+        return progress
+    return _job_progress(job)
+
+async def _send_live_estimates(websocket: WebSocket, session: LiveAnalysisSession, interval: float):
+    """إرسال تقدير CASA المتجدد كل interval ثانية عند معالجة إطارات جديدة"""
+    sent = None
+    while True:
+        await asyncio.sleep(interval)
+        if session.processed != sent:
+            sent = session.processed
+            await websocket.send_json({"type": "estimate", "session_id": session.session_id, **session.estimate()})
+
+def _job_progress(job: dict) -> AnalysisProgress:
+    """تقدم التحليل من سجل الطابور"""
+    messages = {
+        AnalysisStatus.UPLOADED.value: "تم رفع الملف ولم يُرسل للتحليل",
+        AnalysisStatus.PENDING.value: "في انتظار عامل التحليل",
+        AnalysisStatus.PROCESSING.value: "جاري التحليل",
+        AnalysisStatus.COMPLETED.value: "تم إكمال التحليل",
+        AnalysisStatus.FAILED.value: f"فشل التحليل: {job['error_message'] or ''}",
+        AnalysisStatus.CANCELLED.value: "تم إلغاء التحليل"
+    }
+    message = messages.get(job['status'], job['status'])
+    estimated_time_remaining = None
+    if job['status'] == AnalysisStatus.PROCESSING.value:
+        # التقدم التفصيلي الذي كتبه العامل المنفذ في الطابور المشترك
+        message = job.get('progress_message') or message
+        estimated_time_remaining = job.get('estimated_time_remaining')
+    return AnalysisProgress(
+        analysis_id=job['analysis_id'],
+        status=job['status'],
+        progress=job['progress'],
+        message=message,
+        estimated_time_remaining=estimated_time_remaining
+    )
 
 async def _cleanup_analysis_files(analysis_id: str):
     """تنظيف ملفات التحليل"""
@@ -283,18 +612,68 @@ async def _cleanup_analysis_files(analysis_id: str):
         csv_file = f"results/{analysis_id}.csv"
         if os.path.exists(csv_file):
             os.remove(csv_file)
+        
+        # حذف النتيجة الأولية إن وجدت
+        provisional_file = os.path.join(
+            settings.get_analysis_config()['provisional_directory'], f"{analysis_id}.json"
+        )
+        if os.path.exists(provisional_file):
+            os.remove(provisional_file)
             
     except Exception as e:
         logger.warning(f"خطأ في تنظيف الملفات: {e}")
 
 # Webhooks للإشعارات
-@router.post("/analyze/{analysis_id}/webhook")
-async def analysis_webhook(analysis_id: str, webhook_url: str):
+@router.post("/analyze/{analysis_id}/webhook", response_model=SuccessResponse)
+async def analysis_webhook(
+    analysis_id: str,
+    webhook_url: str,
+    queue: JobQueue = Depends(get_job_queue)
+):
     """
     تسجيل webhook للإشعار عند اكتمال التحليل
+    
+    يُرسل POST موقّع (X-Webhook-Signature: sha256=HMAC(secret_key, "{timestamp}.{body}"))
+    عند اكتمال التحليل أو فشله أو إلغائه؛ وإن كان قد انتهى يُرسل فوراً.
+    
+    الروابط التي تشير إلى عناوين داخلية تُرفض، أو يُقبل فقط المضيفون في
+    WEBHOOK_ALLOWED_HOSTS إن حُددت.
     """
-    # TODO: تطبيق نظام webhooks
-    return SuccessResponse(
-        message="سيتم إضافة نظام الـ webhooks في الإصدار القادم",
-        data={"analysis_id": analysis_id, "webhook_url": webhook_url}
-    )
\ No newline at end of file
+    try:
+        try:
+            await asyncio.to_thread(
+                check_webhook_url, webhook_url, settings.get_webhook_config()['allowed_hosts']
+            )
+        except WebhookURLRejected as rejected:
+            raise HTTPException(status_code=400, detail=str(rejected))
+        
+        job = await asyncio.to_thread(queue.set_webhook, analysis_id, webhook_url)
+        if job is None:
+            raise HTTPException(
+                status_code=404,
+                detail="التحليل غير موجود"
+            )
+        
+        # التحليل انتهى قبل التسجيل
+        if job['status'] in (
+            AnalysisStatus.COMPLETED.value, AnalysisStatus.FAILED.value, AnalysisStatus.CANCELLED.value
+        ):
+            await _publish_finished(analysis_id, queue)
+        
+        return SuccessResponse(
+            message="تم تسجيل الـ webhook بنجاح",
+            data={
+                "analysis_id": analysis_id,
+                "webhook_url": webhook_url,
+                "status": job['status']
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطأ في تسجيل webhook: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="فشل في تسجيل الـ webhook"
+        )
@@ -1,22 +1,32 @@
-from fastapi import APIRouter, HTTPException, Response
-from fastapi.responses import JSONResponse, FileResponse
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from typing import Callable, Optional, List
 import os
 import json
+import asyncio
 import csv
 import io
 from datetime import datetime
 import logging
 
 from ..models.analysis_models import AnalysisResult, SuccessResponse
+from ..services.result_cache import CachedResult, ResultCache
+from ..utils.config import settings
+from ..utils.http_cache import IDENTITY, entity_tag, etag_matches, negotiate_encoding
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# النتائج المحللة المشتركة بين المسارات (تُبطل عند تغير الملف)
+_cache_config = settings.get_cache_config()
+result_cache = ResultCache(max_size=_cache_config['result_max_size'], ttl=_cache_config['ttl'])
+
 @router.get("/results/{analysis_id}", response_model=AnalysisResult)
-async def get_analysis_results(analysis_id: str):
+async def get_analysis_results(analysis_id: str, request: Request):
     """
     جلب نتائج التحليل بالمعرف
+    
+    يدعم If-None-Match (304 إن لم تتغير النتيجة) والضغط حسب Accept-Encoding
     """
     try:
         result_path = f"results/{analysis_id}.json"
@@ -27,24 +37,42 @@ async def get_analysis_results(analysis_id: str):
                 detail="نتائج التحليل غير موجودة"
             )
         
-        with open(result_path, "r", encoding="utf-8") as f:
-            result_data = json.load(f)
+        return await _cached_response(request, result_path, "result", _result_body, "application/json")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطأ في جلب النتائج: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="فشل في جلب نتائج التحليل"
+        )
+
+@router.get("/results/{analysis_id}/provisional", response_model=AnalysisResult)
+async def get_provisional_results(analysis_id: str, request: Request):
+    """
+    جلب النتيجة الأولية السريعة (أول ثوانٍ من الفيديو)
+    
+    تُنشر قبل اكتمال التحليل وتبقى متاحة بعد صدور النتيجة النهائية
+    """
+    try:
+        result_path = _provisional_path(analysis_id)
         
-        # تحويل التاريخ من string إلى datetime إذا لزم الأمر
-        if isinstance(result_data.get('analysis_date'), str):
-            result_data['analysis_date'] = datetime.fromisoformat(
-                result_data['analysis_date'].replace('Z', '+00:00')
+        if not os.path.exists(result_path):
+            raise HTTPException(
+                status_code=404,
+                detail="لا توجد نتيجة أولية لهذا التحليل"
             )
         
-        return AnalysisResult(**result_data)
+        return await _cached_response(request, result_path, "result", _result_body, "application/json")
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"خطأ في جلب النتائج: {e}")
+        logger.error(f"خطأ في جلب النتيجة الأولية: {e}")
         raise HTTPException(
             status_code=500,
-            detail="فشل في جلب نتائج التحليل"
+            detail="فشل في جلب النتيجة الأولية"
         )
 
 @router.get("/results", response_model=List[dict])
@@ -116,7 +144,7 @@ async def list_all_results(
         )
 
 @router.get("/results/{analysis_id}/summary")
-async def get_results_summary(analysis_id: str):
+async def get_results_summary(analysis_id: str, request: Request):
     """
     ملخص نتائج التحليل
     """
@@ -129,41 +157,63 @@ async def get_results_summary(analysis_id: str):
                 detail="نتائج التحليل غير موجودة"
             )
         
-        with open(result_path, "r", encoding="utf-8") as f:
-            result_data = json.load(f)
+        return await _cached_response(
+            request, result_path, "summary",
+            lambda entry: _json_body(_summary(analysis_id, entry.data)),
+            "application/json"
+        )
         
-        # استخراج الملخص
-        summary = {
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطأ في جلب ملخص النتائج: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="فشل في جلب ملخص النتائج"
+        )
+
+@router.get("/results/{analysis_id}/distributions")
+async def get_results_distributions(analysis_id: str, parameters: Optional[str] = None):
+    """
+    توزيعات مؤشرات CASA (مدرجات تكرارية ومئينات) بدون بيانات التتبع الكاملة
+
+    parameters: قائمة مؤشرات مفصولة بفواصل (مثال: vcl,vsl,lin)
+    """
+    try:
+        result_path = f"results/{analysis_id}.json"
+
+        if not os.path.exists(result_path):
+            raise HTTPException(
+                status_code=404,
+                detail="نتائج التحليل غير موجودة"
+            )
+
+        result_data = await asyncio.to_thread(result_cache.load, result_path)
+
+        distributions = result_data.get("casa_distributions") or {}
+        if parameters:
+            requested = {p.strip().lower() for p in parameters.split(",") if p.strip()}
+            distributions = {k: v for k, v in distributions.items() if k in requested}
+
+        return {
             "analysis_id": analysis_id,
-            "file_name": result_data.get("file_name", "غير معروف"),
-            "analysis_date": result_data.get("analysis_date"),
             "sperm_count": result_data.get("sperm_count", 0),
-            "motility": result_data.get("motility", 0),
-            "concentration": result_data.get("concentration", 0),
-            "normal_morphology": result_data.get("morphology", {}).get("normal", 0),
-            "quality_assessment": _assess_quality(result_data),
-            "key_casa_parameters": {
-                "vcl": result_data.get("casa_parameters", {}).get("vcl", 0),
-                "vsl": result_data.get("casa_parameters", {}).get("vsl", 0),
-                "lin": result_data.get("casa_parameters", {}).get("lin", 0),
-                "mot": result_data.get("casa_parameters", {}).get("mot", 0)
-            }
+            "distributions": distributions
         }
-        
-        return summary
-        
+
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"خطأ في جلب ملخص النتائج: {e}")
+        logger.error(f"خطأ في جلب توزيعات النتائج: {e}")
         raise HTTPException(
             status_code=500,
-            detail="فشل في جلب ملخص النتائج"
+            detail="فشل في جلب توزيعات النتائج"
         )
 
 @router.get("/results/{analysis_id}/export")
 async def export_results(
     analysis_id: str,
+    request: Request,
     format: str = "json",
     include_metadata: bool = True
 ):
@@ -187,16 +237,31 @@ async def export_results(
         format = format.lower()
         
         if format == "json":
-            return await _export_json(result_path, analysis_id, include_metadata)
+            view = "export-json" if include_metadata else "export-json-simplified"
+            build = lambda entry: _export_json(entry.data, include_metadata)
+            media_type = "application/json"
+            filename = f"analysis_{analysis_id}.json" if include_metadata else f"analysis_{analysis_id}_simplified.json"
         elif format == "csv":
-            return await _export_csv(result_path, analysis_id)
+            view = "export-csv"
+            build = lambda entry: _export_csv(entry.data)
+            media_type = "text/csv"
+            filename = f"analysis_{analysis_id}.csv"
         elif format == "txt":
-            return await _export_txt(result_path, analysis_id)
+            view = "export-txt"
+            build = lambda entry: _export_txt(entry.data, analysis_id)
+            media_type = "text/plain"
+            filename = f"analysis_report_{analysis_id}.txt"
         else:
             raise HTTPException(
                 status_code=400,
                 detail="صيغة التصدير غير مدعومة. الصيغ المدعومة: json, csv, txt"
             )
+        
+        # يُولّد التصدير في الذاكرة مرة واحدة لكل إصدار من النتيجة دون ملفات مؤقتة
+        return await _cached_response(
+            request, result_path, view, build, media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
             
     except HTTPException:
         raise
@@ -215,17 +280,24 @@ async def delete_analysis_results(analysis_id: str):
     try:
         result_path = f"results/{analysis_id}.json"
         csv_path = f"results/{analysis_id}.csv"
+        provisional_path = _provisional_path(analysis_id)
         
         deleted_files = []
         
         if os.path.exists(result_path):
             os.remove(result_path)
             deleted_files.append("JSON")
+        result_cache.invalidate(result_path)
         
         if os.path.exists(csv_path):
             os.remove(csv_path)
             deleted_files.append("CSV")
         
+        if os.path.exists(provisional_path):
+            os.remove(provisional_path)
+            deleted_files.append("PROVISIONAL")
+        result_cache.invalidate(provisional_path)
+        
         if not deleted_files:
             raise HTTPException(
                 status_code=404,
@@ -267,12 +339,10 @@ async def compare_results(analysis_ids: List[str]):
         for analysis_id in analysis_ids:
             result_path = f"results/{analysis_id}.json"
             if os.path.exists(result_path):
-                with open(result_path, "r", encoding="utf-8") as f:
-                    result_data = json.load(f)
-                    results.append({
-                        "analysis_id": analysis_id,
-                        "data": result_data
-                    })
+                results.append({
+                    "analysis_id": analysis_id,
+                    "data": await asyncio.to_thread(result_cache.load, result_path)
+                })
         
         if len(results) < 2:
             raise HTTPException(
@@ -294,42 +364,82 @@ async def compare_results(analysis_ids: List[str]):
             detail="فشل في مقارنة النتائج"
         )
 
-async def _export_json(result_path: str, analysis_id: str, include_metadata: bool) -> FileResponse:
+def _provisional_path(analysis_id: str) -> str:
+    """مسار ملف النتيجة الأولية"""
+    return os.path.join(settings.get_analysis_config()['provisional_directory'], f"{analysis_id}.json")
+
+def _summary(analysis_id: str, result_data: dict) -> dict:
+    """استخراج ملخص النتائج"""
+    return {
+        "analysis_id": analysis_id,
+        "file_name": result_data.get("file_name", "غير معروف"),
+        "analysis_date": result_data.get("analysis_date"),
+        "sperm_count": result_data.get("sperm_count", 0),
+        "motility": result_data.get("motility", 0),
+        "concentration": result_data.get("concentration", 0),
+        "normal_morphology": result_data.get("morphology", {}).get("normal", 0),
+        "quality_assessment": _assess_quality(result_data),
+        "key_casa_parameters": {
+            "vcl": result_data.get("casa_parameters", {}).get("vcl", 0),
+            "vsl": result_data.get("casa_parameters", {}).get("vsl", 0),
+            "lin": result_data.get("casa_parameters", {}).get("lin", 0),
+            "mot": result_data.get("casa_parameters", {}).get("mot", 0)
+        }
+    }
+
+async def _cached_response(request: Request, result_path: str, view: str,
+                           build: Callable[[CachedResult], bytes], media_type: str,
+                           headers: Optional[dict] = None) -> Response:
+    """استجابة بوسم ETag قوي من بصمة النتيجة، مضغوطة حسب Accept-Encoding
+
+    التمثيلات المرمزة والمضغوطة محفوظة مع النتيجة في الذاكرة المؤقتة، و304
+    دون محتوى إن طابق If-None-Match الإصدار الحالي. قراءة الملف وبصمته
+    والترميز والضغط تُنفذ في خيط فلا تحجب حلقة الأحداث عند تغير النتيجة.
+    """
+    config = settings.get_response_config()
+    version, encoding, body = await asyncio.to_thread(
+        result_cache.representation,
+        result_path, view, negotiate_encoding(request.headers.get("accept-encoding")), build,
+        min_size=config['compression_min_size'],
+        gzip_level=config['gzip_level'],
+        brotli_quality=config['brotli_quality']
+    )
+    
+    response_headers = {
+        "ETag": entity_tag(version, encoding),
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    if etag_matches(request.headers.get("if-none-match"), version):
+        return Response(status_code=304, headers=response_headers)
+    
+    response_headers.update(headers or {})
+    if encoding != IDENTITY:
+        response_headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=response_headers)
+
+def _json_body(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+
+def _result_body(entry: CachedResult) -> bytes:
+    """AnalysisResult بصيغة JSON (بدلاً من تحويل response_model لكل طلب)"""
+    return entry.model().json(ensure_ascii=False).encode("utf-8")
+
+def _export_json(data: dict, include_metadata: bool) -> bytes:
     """تصدير JSON"""
     if not include_metadata:
-        # إزالة البيانات الإضافية
-        with open(result_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        # إزالة البيانات غير الأساسية
-        data.pop("metadata", None)
-        data.pop("tracking_data", None)
-        
-        # حفظ نسخة مبسطة
-        simplified_path = f"results/{analysis_id}_simplified.json"
-        with open(simplified_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-        
-        return FileResponse(
-            simplified_path,
-            media_type="application/json",
-            filename=f"analysis_{analysis_id}_simplified.json"
-        )
+        # إزالة البيانات غير الأساسية (نسخة لا تعدّل النتيجة المخزنة مؤقتاً)
+        data = {
+            key: value for key, value in data.items()
+            if key not in ("metadata", "tracking_data")
+        }
     
-    return FileResponse(
-        result_path,
-        media_type="application/json",
-        filename=f"analysis_{analysis_id}.json"
-    )
+    # بنفس تنسيق ملف النتيجة المحفوظ
+    return json.dumps(data, ensure_ascii=False, indent=2, default=str).encode("utf-8")
 
-async def _export_csv(result_path: str, analysis_id: str) -> FileResponse:
+def _export_csv(data: dict) -> bytes:
     """تصدير CSV"""
-    with open(result_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    csv_path = f"results/{analysis_id}.csv"
-    
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+    with io.StringIO(newline="") as f:
         writer = csv.writer(f)
         
         # العناوين
@@ -363,21 +473,12 @@ async def _export_csv(result_path: str, analysis_id: str) -> FileResponse:
         writer.writerow(["Head_Defects", f"{morphology.get('head_defects', 0):.1f}", "%", "<20%"])
         writer.writerow(["Tail_Defects", f"{morphology.get('tail_defects', 0):.1f}", "%", "<15%"])
         writer.writerow(["Neck_Defects", f"{morphology.get('neck_defects', 0):.1f}", "%", "<10%"])
-    
-    return FileResponse(
-        csv_path,
-        media_type="text/csv",
-        filename=f"analysis_{analysis_id}.csv"
-    )
+        
+        return f.getvalue().encode("utf-8")
 
-async def _export_txt(result_path: str, analysis_id: str) -> FileResponse:
+def _export_txt(data: dict, analysis_id: str) -> bytes:
     """تصدير تقرير نصي"""
-    with open(result_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    txt_path = f"results/{analysis_id}.txt"
-    
-    with open(txt_path, "w", encoding="utf-8") as f:
+    with io.StringIO() as f:
         f.write("تقرير تحليل الحيوانات المنوية\n")
         f.write("="*50 + "\n\n")
         
@@ -418,12 +519,8 @@ async def _export_txt(result_path: str, analysis_id: str) -> FileResponse:
         f.write("\n" + "="*50 + "\n")
         f.write("تم إنشاء هذا التقرير بواسطة Sperm Analyzer AI\n")
         f.write("المطور: يوسف الشتيوي\n")
-    
-    return FileResponse(
-        txt_path,
-        media_type="text/plain",
-        filename=f"analysis_report_{analysis_id}.txt"
-    )
+        
+        return f.getvalue().encode("utf-8")
 
 def _assess_quality(data: dict) -> str:
     """تقييم جودة العينة"""
@@ -7,6 +7,8 @@ from datetime import datetime, timedelta
 import logging
 from typing import Dict, Any
 
+from . import analysis, results
+
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
@@ -121,12 +123,19 @@ async def get_performance_metrics():
             "packets_recv": network.packets_recv
         }
         
+        # عدادات الذاكرة المؤقتة (الإصابات والإخفاقات والإخراج)
+        caches = {}
+        if analysis.analyzer is not None:
+            caches["analysis_progress"] = analysis.analyzer.analysis_cache.stats()
+        caches["results"] = results.result_cache.stats()
+        
         return {
             "timestamp": datetime.now().isoformat(),
             "cpu": cpu_info,
             "memory": memory_info,
             "disk": disk_info,
-            "network": network_info
+            "network": network_info,
+            "caches": caches
         }
         
     except Exception as e:
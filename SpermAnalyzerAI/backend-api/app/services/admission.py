@@ -0,0 +1,81 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+import cv2
+
+# تقدير الذاكرة: حمل ثابت للنموذج والمتتبع + نسخ العمل من الإطار + حالة التتبع لكل إطار
+ANALYSIS_BASE_MEMORY_MB = 150.0
+FRAME_WORKING_COPIES = 8        # الإطار، الرمادي، مدخل النموذج، القصاصات...
+TRACK_STATE_BYTES_PER_FRAME = 8 * 1024
+
+
+class AdmissionRejected(Exception):
+    """رفض قبول طلب تحليل بسبب التشبع (يُحوَّل إلى 429 مع Retry-After)"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after))
+
+
+def probe_media(file_path: str, file_type: str) -> Dict[str, Any]:
+    """قراءة عدد الإطارات والأبعاد دون فك ترميز الفيديو كاملاً"""
+    if file_type == 'video':
+        cap = cv2.VideoCapture(file_path)
+        try:
+            return {
+                "frame_count": max(1, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))),
+                "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                "fps": cap.get(cv2.CAP_PROP_FPS)
+            }
+        finally:
+            cap.release()
+
+    image = cv2.imread(file_path)
+    height, width = image.shape[:2] if image is not None else (0, 0)
+    return {"frame_count": 1, "width": width, "height": height, "fps": None}
+
+
+def estimate_analysis_memory_mb(frame_count: int, width: int, height: int) -> float:
+    """تقدير ذاكرة التحليل من عدد الإطارات والدقة
+
+    الإطارات تُعالج بالتتابع، فالدقة تحدد ذاكرة العمل لكل إطار بينما يحدد
+    عدد الإطارات حجم حالة التتبع المتراكمة.
+    """
+    frame_bytes = width * height * 3 * FRAME_WORKING_COPIES
+    track_bytes = frame_count * TRACK_STATE_BYTES_PER_FRAME
+    return ANALYSIS_BASE_MEMORY_MB + (frame_bytes + track_bytes) / (1024 * 1024)
+
+
+class RateLimiter:
+    """محدد معدل لكل عميل بدلو رموز (rate طلب في الدقيقة)"""
+
+    def __init__(self, rate_per_minute: int, max_clients: int = 10000):
+        self.capacity = float(max(1, rate_per_minute))
+        self.refill_rate = self.capacity / 60.0
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client_id: str) -> Tuple[bool, int]:
+        """استهلاك رمز للعميل؛ يُرجع (مسموح، ثواني الانتظار)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client_id, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate)
+
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[client_id] = (tokens, now)
+
+            # حذف أقدم العملاء الخاملين
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+        if allowed:
+            return True, 0
+        return False, math.ceil((1.0 - tokens) / self.refill_rate)
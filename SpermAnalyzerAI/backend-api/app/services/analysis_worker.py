@@ -0,0 +1,281 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..models.analysis_models import AnalysisResult
+from ..utils.config import settings
+from .job_queue import JobQueue
+from .cancellation import AnalysisCancelled
+from .sperm_analyzer import SpermAnalyzer
+from .webhooks import PROVISIONAL_EVENT, WebhookDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def result_file_path(analysis_id: str, provisional: bool = False) -> str:
+    """مسار ملف النتيجة النهائية أو الأولية"""
+    if provisional:
+        directory = settings.get_analysis_config()['provisional_directory']
+    else:
+        directory = settings.results_directory
+    return os.path.join(directory, f"{analysis_id}.json")
+
+
+def save_result_file(analysis_id: str, result: AnalysisResult, provisional: bool = False):
+    """حفظ نتيجة التحليل في مجلد النتائج"""
+    result_path = result_file_path(analysis_id, provisional)
+    os.makedirs(os.path.dirname(result_path), exist_ok=True)
+
+    # كتابة ذرية: القارئ لا يرى ملفاً مكتوباً جزئياً
+    tmp_path = f"{result_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result.dict(), f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, result_path)
+
+
+def remove_result_file(analysis_id: str):
+    """حذف نتيجة تحليل أُلغي ونتيجته الأولية"""
+    for provisional in (False, True):
+        result_path = result_file_path(analysis_id, provisional)
+        if os.path.exists(result_path):
+            os.remove(result_path)
+
+
+class AnalysisWorker:
+    """عامل يسحب التحليلات من الطابور وينفذها داخل عملية الخادم
+
+    يعمل concurrency تحليلاً بالتوازي، ويحدّث نبض المهام الجارية دورياً،
+    ويعيد المهام المتوقفة لعمال آخرين إلى الطابور. خانات interactive_slots
+    إضافية تحجز الطلبات التفاعلية فقط حتى لا تنتظر خلف فيديوهات طويلة.
+
+    التقدم التفصيلي يُكتب في الطابور المشترك كل progress_flush_interval ثانية
+    (كتابة مؤجلة لما تغير فقط، دفعة واحدة لجميع المهام)، فتخدم أي عملية
+    API استعلام التقدم دون أن تكون هي المنفذة للتحليل.
+    """
+
+    def __init__(self, analyzer: SpermAnalyzer, queue: JobQueue,
+                 concurrency: int = 2, poll_interval: float = 2.0,
+                 heartbeat_interval: int = 10, interactive_slots: int = 1,
+                 webhooks: Optional[WebhookDispatcher] = None,
+                 progress_flush_interval: float = 1.0):
+        self.analyzer = analyzer
+        self.queue = queue
+        self.webhooks = webhooks
+        self.concurrency = concurrency
+        self.interactive_slots = interactive_slots
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.progress_flush_interval = progress_flush_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._active: Set[str] = set()
+        self._interrupted: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flushed: Dict[str, Tuple[Any, ...]] = {}
+
+    async def start(self):
+        """بدء حلقات التنفيذ وحلقة النبض"""
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._run_slot(None)) for _ in range(self.concurrency)
+        ]
+        self._tasks += [
+            asyncio.create_task(self._run_slot(['interactive'])) for _ in range(self.interactive_slots)
+        ]
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+        self._tasks.append(asyncio.create_task(self._progress_loop()))
+        logger.info(f"بدء عامل التحليل {self.worker_id} ({self.concurrency} تحليلات متزامنة)")
+
+    async def stop(self):
+        """إيقاف العامل وإعادة المهام غير المكتملة إلى الطابور
+
+        يستأنفها عامل آخر من آخر نقطة استئناف دون انتظار انتهاء نبضها.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        interrupted, self._interrupted = list(self._interrupted), set()
+        try:
+            released = await asyncio.to_thread(self.queue.release, interrupted, self.worker_id)
+            if released:
+                logger.info(f"أعيدت {released} مهام غير مكتملة إلى الطابور")
+        except Exception as e:
+            logger.error(f"خطأ في إعادة المهام غير المكتملة: {e}")
+
+    def cancel(self, analysis_id: str) -> bool:
+        """إيقاف تحليل يعمل في هذه العملية"""
+        return self.analyzer.cancel_analysis(analysis_id)
+
+    def notify(self):
+        """إيقاظ حلقات التنفيذ عند إدراج مهمة جديدة"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @property
+    def active_jobs(self) -> List[str]:
+        """التحليلات الجارية في هذا العامل"""
+        return list(self._active)
+
+    async def _run_slot(self, priorities: Optional[List[str]]):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id, priorities)
+            except Exception as e:
+                logger.error(f"خطأ في حجز مهمة من الطابور: {e}")
+                job = None
+
+            if job is None:
+                await self._wait_for_work()
+                continue
+
+            await self._process(job)
+
+    async def _wait_for_work(self):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _process(self, job: Dict):
+        analysis_id = job['analysis_id']
+        self._active.add(analysis_id)
+        logger.info(f"بدء تحليل المهمة {analysis_id} (محاولة {job['attempts']})")
+
+        try:
+            result = await self.analyzer.analyze_sample(
+                job['file_path'], analysis_id,
+                on_preview=functools.partial(self._publish_preview, analysis_id)
+            )
+            await asyncio.to_thread(save_result_file, analysis_id, result)
+            if await asyncio.to_thread(self.queue.complete, analysis_id, result):
+                logger.info(f"اكتمل تحليل المهمة {analysis_id}")
+                await self._publish(analysis_id, self._summary(result))
+            else:
+                # أُلغيت المهمة بعد انتهاء الإطارات: لا نترك نتيجة يتيمة
+                await asyncio.to_thread(remove_result_file, analysis_id)
+        except AnalysisCancelled:
+            logger.info(f"أوقف العامل المهمة الملغاة {analysis_id}")
+        except asyncio.CancelledError:
+            # إيقاف الخادم: تُعاد المهمة إلى الطابور في stop()
+            self._interrupted.add(analysis_id)
+            raise
+        except Exception as e:
+            logger.error(f"فشل تحليل المهمة {analysis_id}: {e}")
+            await asyncio.to_thread(self.queue.fail, analysis_id, str(e))
+            await self._publish(analysis_id)
+        finally:
+            self._active.discard(analysis_id)
+            # تحرير سعة قد تسمح بحجز مهمة كانت تنتظر حدود التزامن أو الذاكرة
+            self.notify()
+
+    async def _publish(self, analysis_id: str, data: Optional[Dict] = None):
+        """نشر انتهاء المهمة لاتصالات البث وحفظ إشعار webhook (لا يؤثر فشلهما على حالة المهمة)"""
+        try:
+            job = await asyncio.to_thread(self.queue.get, analysis_id)
+            if job is None:
+                return
+            self.analyzer.progress_broker.finish(job)
+            if self.webhooks is not None:
+                await self.webhooks.publish(job, data)
+        except Exception as e:
+            logger.error(f"خطأ في حفظ إشعار المهمة {analysis_id}: {e}")
+
+    async def _publish_preview(self, analysis_id: str, result: AnalysisResult):
+        """حفظ النتيجة الأولية ونشرها لاتصالات البث وwebhook قبل اكتمال التحليل"""
+        await asyncio.to_thread(save_result_file, analysis_id, result, True)
+        data = self._summary(result)
+        self.analyzer.progress_broker.provisional(analysis_id, data)
+        if self.webhooks is not None:
+            job = await asyncio.to_thread(self.queue.get, analysis_id)
+            if job is not None:
+                await self.webhooks.publish(job, data, event=PROVISIONAL_EVENT)
+        logger.info(f"نُشرت النتيجة الأولية للمهمة {analysis_id}")
+
+    @staticmethod
+    def _summary(result: AnalysisResult) -> Dict:
+        """ملخص النتيجة المرسل في الإشعارات"""
+        return {
+            "sperm_count": result.sperm_count,
+            "motility": result.motility,
+            "concentration": result.concentration,
+            "sample_quality": result.get_quality().value,
+            "partial": result.metadata.partial if result.metadata else False,
+            "provisional": result.provisional
+        }
+
+    def _sweep_checkpoints(self):
+        """حذف نقاط استئناف المهام المكتملة أو الفاشلة أو الملغاة"""
+        checkpoints = self.analyzer.checkpoints
+        stored = checkpoints.stored_ids() if checkpoints is not None else []
+        if not stored:
+            return
+        resumable = set(self.queue.resumable_ids())
+        for analysis_id in stored:
+            if analysis_id not in resumable:
+                self.analyzer.discard_checkpoint(analysis_id)
+
+    def _progress_updates(self) -> Dict[str, Dict[str, Any]]:
+        """التقدم الذي تغير منذ آخر كتابة للمهام الجارية"""
+        updates = {}
+        for analysis_id in self.active_jobs:
+            state = self.analyzer.get_analysis_progress(analysis_id)
+            if state is None:
+                continue
+            snapshot = (state.progress, state.message, state.estimated_time_remaining)
+            if self._flushed.get(analysis_id) != snapshot:
+                updates[analysis_id] = {
+                    "progress": state.progress,
+                    "message": state.message,
+                    "estimated_time_remaining": state.estimated_time_remaining
+                }
+                self._flushed[analysis_id] = snapshot
+        for analysis_id in set(self._flushed) - self._active:
+            del self._flushed[analysis_id]
+        return updates
+
+    async def _progress_loop(self):
+        while True:
+            await asyncio.sleep(self.progress_flush_interval)
+            updates = self._progress_updates()
+            if not updates:
+                continue
+            try:
+                await asyncio.to_thread(self.queue.publish_progress, self.worker_id, updates)
+            except Exception as e:
+                # تُعاد المحاولة في الدورة التالية
+                for analysis_id in updates:
+                    self._flushed.pop(analysis_id, None)
+                logger.error(f"خطأ في كتابة تقدم المهام: {e}")
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                progress = {}
+                for analysis_id in self.active_jobs:
+                    # آخر قيمة كُتبت مع رسالتها حتى لا يسبق التقدم رسالته المشتركة
+                    flushed = self._flushed.get(analysis_id)
+                    state = self.analyzer.get_analysis_progress(analysis_id)
+                    progress[analysis_id] = flushed[0] if flushed else (state.progress if state else 0.0)
+                cancelled = await asyncio.to_thread(self.queue.heartbeat, self.worker_id, progress)
+
+                # إلغاء طُلب عبر عملية أخرى
+                for analysis_id in cancelled:
+                    self.cancel(analysis_id)
+
+                if await asyncio.to_thread(self.queue.requeue_stale):
+                    self.notify()
+
+                await asyncio.to_thread(self._sweep_checkpoints)
+                self.analyzer.analysis_cache.purge_expired()
+            except Exception as e:
+                logger.error(f"خطأ في تحديث نبض المهام: {e}")
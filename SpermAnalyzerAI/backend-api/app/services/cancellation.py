@@ -0,0 +1,25 @@
+import threading
+
+
+class AnalysisCancelled(Exception):
+    """أُلغي التحليل أثناء تنفيذه"""
+
+
+class CancellationToken:
+    """إشارة إلغاء مشتركة بين حلقة الإطارات ومهام المنفذ (آمنة للخيوط)"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """طلب إيقاف التحليل"""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """رفع AnalysisCancelled إن طُلب الإلغاء"""
+        if self._event.is_set():
+            raise AnalysisCancelled("تم إلغاء التحليل")
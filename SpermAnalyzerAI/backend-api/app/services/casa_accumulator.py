@@ -0,0 +1,448 @@
+import json
+import math
+import os
+from typing import Dict, List, Tuple, Any, Optional, Iterator
+
+import numpy as np
+
+from .casa_kernels import track_chunk
+
+# ترتيب أعمدة مصفوفة نتائج CASA لكل مسار منتهٍ
+CASA_FIELDS = ('vcl', 'vsl', 'vap', 'lin', 'str', 'wob', 'alh', 'bcf')
+
+# فئات المدرجات التكرارية الثابتة لكل مؤشر: (البداية، عرض الفئة، عدد الفئات)
+CASA_HISTOGRAM_BINS = {
+    'vcl': (0.0, 10.0, 20),
+    'vsl': (0.0, 10.0, 20),
+    'vap': (0.0, 10.0, 20),
+    'lin': (0.0, 10.0, 10),
+    'str': (0.0, 10.0, 10),
+    'wob': (0.0, 10.0, 10),
+    'alh': (0.0, 1.0, 10),
+    'bcf': (0.0, 5.0, 10),
+}
+
+
+class TrackAccumulator:
+    """مجمّع CASA متزايد لمسار نشط واحد
+
+    يحدّث طول المسار والإزاحة والمسار المنعّم (متوسط متحرك) وعدد مرات
+    عبور المسار الفعلي للمسار المنعّم مع وصول الإطارات، دون الحاجة لحفظ
+    جميع نقاط المسار. تُجمع النقاط في دفعات صغيرة تعالجها نواة
+    track_chunk دفعة واحدة.
+    """
+
+    __slots__ = (
+        'track_id', 'first_frame', 'last_frame', 'num_points',
+        'start_x', 'start_y', 'last_x', 'last_y', 'path_length',
+        'smoothing_window', 'chunk_size', '_buf_x', '_buf_y', '_tail_x', '_tail_y',
+        'smooth_x', 'smooth_y', 'smoothed_length', 'lateral_sum', 'crossings', '_last_side',
+        'points', 'window_frames', '_segment', 'pending_segments'
+    )
+
+    def __init__(self, track_id: str, frame_idx: int, x: float, y: float,
+                 smoothing_window: int = 5, keep_points: bool = False,
+                 window_frames: int = 0, chunk_size: int = 32):
+        self.track_id = track_id
+        self.first_frame = frame_idx
+        self.last_frame = frame_idx
+        self.num_points = 1
+
+        self.start_x, self.start_y = x, y
+        self.last_x, self.last_y = x, y
+        self.path_length = 0.0
+
+        # نقاط بانتظار المعالجة وذيل نافذة المتوسط المتحرك (آخر window - 1 نقطة)
+        self.smoothing_window = max(1, smoothing_window)
+        self.chunk_size = max(1, chunk_size)
+        self._buf_x: List[float] = []
+        self._buf_y: List[float] = []
+        tail = [x] if self.smoothing_window > 1 else []
+        self._tail_x = np.array(tail, dtype=np.float64)
+        self._tail_y = np.array([y] if tail else [], dtype=np.float64)
+
+        # المسار المنعّم
+        self.smooth_x, self.smooth_y = x, y
+        self.smoothed_length = 0.0
+
+        # الإزاحة الجانبية وعبور المسار المنعّم (لحساب ALH و BCF)
+        self.lateral_sum = 0.0
+        self.crossings = 0
+        self._last_side = 0
+
+        self.points: Optional[List[Tuple[int, float, float]]] = (
+            [(frame_idx, x, y)] if keep_points else None
+        )
+
+        # مقطع النافذة الزمنية الحالية:
+        # [النافذة، الخطوات، طول المسار، بداية x، بداية y، طول المسار المنعّم]
+        self.window_frames = window_frames
+        self._segment = (
+            [frame_idx // window_frames, 0, 0.0, x, y, 0.0] if window_frames > 0 else None
+        )
+        # مقاطع مغلقة بانتظار بلوغ المسار الحد الأدنى للطول
+        self.pending_segments: List[Tuple[int, int, float, float, float]] = []
+
+    def update(self, frame_idx: int, x: float, y: float) -> Optional[Tuple[int, int, float, float, float]]:
+        """إضافة نقطة جديدة للمسار
+
+        يُرجع مقطع النافذة الزمنية السابقة إذا انتقلت النقطة إلى نافذة جديدة.
+        """
+        closed_segment = None
+        segment = self._segment
+        if segment is not None and frame_idx // self.window_frames != segment[0]:
+            # الدفعة لا تتجاوز حدود النافذة الزمنية
+            self.flush()
+            closed_segment = self.close_segment()
+            # المقطع الجديد يبدأ من آخر نقطة في النافذة السابقة
+            self._segment = [
+                frame_idx // self.window_frames, 0, 0.0, self.last_x, self.last_y, 0.0
+            ]
+
+        self._buf_x.append(x)
+        self._buf_y.append(y)
+        self.last_frame = frame_idx
+        self.num_points += 1
+
+        if self.points is not None:
+            self.points.append((frame_idx, x, y))
+
+        if len(self._buf_x) >= self.chunk_size:
+            self.flush()
+
+        return closed_segment
+
+    def flush(self):
+        """معالجة النقاط المعلقة دفعة واحدة"""
+        if not self._buf_x:
+            return
+
+        xs = np.array(self._buf_x, dtype=np.float64)
+        ys = np.array(self._buf_y, dtype=np.float64)
+        (path_length, smoothed_length, lateral_sum, crossings,
+         self._last_side, self.smooth_x, self.smooth_y) = track_chunk(
+            xs, ys, self._tail_x, self._tail_y, self.smoothing_window,
+            self.last_x, self.last_y, self.smooth_x, self.smooth_y, self._last_side
+        )
+
+        self.path_length += path_length
+        self.smoothed_length += smoothed_length
+        self.lateral_sum += lateral_sum
+        self.crossings += crossings
+
+        segment = self._segment
+        if segment is not None:
+            segment[1] += len(xs)
+            segment[2] += path_length
+            segment[5] += smoothed_length
+
+        keep = self.smoothing_window - 1
+        if keep > 0:
+            self._tail_x = np.concatenate((self._tail_x, xs))[-keep:]
+            self._tail_y = np.concatenate((self._tail_y, ys))[-keep:]
+
+        self.last_x, self.last_y = self._buf_x[-1], self._buf_y[-1]
+        self._buf_x.clear()
+        self._buf_y.clear()
+
+    def close_segment(self) -> Optional[Tuple[int, int, float, float, float]]:
+        """إغلاق مقطع النافذة الحالية
+
+        يُرجع (النافذة، الخطوات، طول المسار، الإزاحة، طول المسار المنعّم) بالبكسل.
+        """
+        self.flush()
+        segment = self._segment
+        if segment is None or segment[1] == 0:
+            return None
+        window, steps, path, start_x, start_y, smoothed = segment
+        segment[1] = 0
+        displacement = math.hypot(self.last_x - start_x, self.last_y - start_y)
+        return window, steps, path, displacement, smoothed
+
+    @property
+    def displacement(self) -> float:
+        """الإزاحة المستقيمة بين أول وآخر نقطة (بكسل)"""
+        self.flush()
+        return math.hypot(self.last_x - self.start_x, self.last_y - self.start_y)
+
+    def finalize(self, fps: float, pixel_to_micron_ratio: float) -> Dict[str, float]:
+        """حساب مؤشرات CASA النهائية للمسار"""
+        self.flush()
+        time_interval = 1.0 / fps if fps > 0 else 1.0
+        duration = self.num_points * time_interval
+
+        total_distance = self.path_length * pixel_to_micron_ratio
+        displacement = self.displacement * pixel_to_micron_ratio
+        # المسار المنعّم يتأخر عن النقطة الأخيرة بنصف النافذة تقريباً
+        smoothed_distance = (
+            self.smoothed_length
+            + math.hypot(self.last_x - self.smooth_x, self.last_y - self.smooth_y)
+        ) * pixel_to_micron_ratio
+
+        vcl = total_distance / duration if duration > 0 else 0  # السرعة المنحنية
+        vsl = displacement / duration if duration > 0 else 0  # السرعة المستقيمة
+        vap = smoothed_distance / duration if duration > 0 else 0  # سرعة المسار المتوسط
+
+        # متوسط الإزاحة الجانبية مضروباً في 2 (سعة الإزاحة)
+        alh = (2 * self.lateral_sum / self.num_points) * pixel_to_micron_ratio
+
+        return {
+            'vcl': vcl,
+            'vsl': vsl,
+            'vap': vap,
+            'lin': (vsl / vcl * 100) if vcl > 0 else 0,  # الخطية
+            'str': (vsl / vap * 100) if vap > 0 else 0,  # الاستقامة
+            'wob': (vap / vcl * 100) if vcl > 0 else 0,  # التذبذب
+            'alh': alh,
+            'bcf': self.crossings / duration if duration > 0 else 0,
+            'total_distance': total_distance,
+            'displacement': displacement,
+            'duration': duration
+        }
+
+
+class TrackStore:
+    """مخزن مسارات على القرص (سطر JSON لكل مسار منتهٍ)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def append(self, track_id: str, points: List[Tuple[int, float, float]]):
+        """إضافة نقاط مسار منتهٍ إلى المخزن"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({
+            'track_id': track_id,
+            'points': [[frame, round(x, 2), round(y, 2)] for frame, x, y in points]
+        }) + '\n')
+
+    def iter_tracks(self) -> Iterator[Dict[str, Any]]:
+        """قراءة المسارات المخزنة واحداً تلو الآخر"""
+        self.flush()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def __getstate__(self):
+        """حالة نقطة الاستئناف: مسار الملف وحجم ما كُتب فيه حتى الآن"""
+        self.flush()
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {'path': self.path, 'size': size}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._file = None
+        # حذف المسارات المكتوبة بعد نقطة الاستئناف (ستُكتب مجدداً)
+        if os.path.exists(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(state['size'])
+
+    def close(self, delete: bool = False):
+        """إغلاق المخزن وحذف الملف عند الطلب"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if delete and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CasaTimeSeries:
+    """سلاسل CASA زمنية بنوافذ ثابتة العرض تُجمع تزايدياً
+
+    كل مقطع (مسار × نافذة) يضيف سرعاته إلى مجاميع نافذته، فتُستخرج
+    سلاسل VCL/VSL/VAP والحركة دون مرور ثانٍ على المسارات.
+    """
+
+    def __init__(self, fps: float, pixel_to_micron_ratio: float,
+                 window_seconds: int = 1, motile_vcl_threshold: float = 5.0):
+        self.fps = fps if fps > 0 else 1.0
+        self.pixel_to_micron_ratio = pixel_to_micron_ratio
+        self.window_seconds = max(1, window_seconds)
+        self.window_frames = max(1, int(round(self.fps * self.window_seconds)))
+        self.motile_vcl_threshold = motile_vcl_threshold
+
+        # النافذة -> [عدد المقاطع، مجموع VCL، مجموع VSL، مجموع VAP، المقاطع المتحركة]
+        self._windows: Dict[int, List[float]] = {}
+
+    def add_segment(self, segment: Tuple[int, int, float, float, float]):
+        """إضافة مساهمة مقطع مسار واحد إلى نافذته"""
+        window, steps, path, displacement, smoothed = segment
+        scale = self.pixel_to_micron_ratio * self.fps / steps
+
+        vcl = path * scale
+        totals = self._windows.get(window)
+        if totals is None:
+            totals = self._windows[window] = [0, 0.0, 0.0, 0.0, 0]
+        totals[0] += 1
+        totals[1] += vcl
+        totals[2] += displacement * scale
+        totals[3] += smoothed * scale
+        if vcl >= self.motile_vcl_threshold:
+            totals[4] += 1
+
+    def emit(self) -> List[Dict[str, float]]:
+        """السلاسل الزمنية مرتبة حسب النافذة"""
+        series = []
+        for window in sorted(self._windows):
+            count, vcl_sum, vsl_sum, vap_sum, motile = self._windows[window]
+            series.append({
+                'time_point': window * self.window_seconds,
+                'velocity': vcl_sum / count,
+                'vsl': vsl_sum / count,
+                'vap': vap_sum / count,
+                'motility': motile / count * 100,
+                'track_count': count
+            })
+        return series
+
+
+class OnlineCasaAccumulator:
+    """إدارة مجمّعات CASA للمسارات النشطة مع إخراج المسارات المفقودة
+
+    تعتمد الذاكرة على عدد المسارات المتزامنة وليس على طول الفيديو:
+    عند تجاوز المسار للعمر الأقصى دون تحديث تُحسب قيمه النهائية وتُضاف
+    إلى مصفوفة النتائج، وتُحذف نقاطه أو تُنقل إلى مخزن المسارات.
+    """
+
+    def __init__(self, fps: float, pixel_to_micron_ratio: float,
+                 min_track_length: int = 5, max_age: int = 30,
+                 smoothing_window: int = 5, track_store: Optional[TrackStore] = None,
+                 time_series: Optional[CasaTimeSeries] = None, chunk_size: int = 32):
+        self.fps = fps
+        self.pixel_to_micron_ratio = pixel_to_micron_ratio
+        self.min_track_length = min_track_length
+        self.max_age = max_age
+        self.smoothing_window = smoothing_window
+        self.chunk_size = chunk_size
+        self.track_store = track_store
+        self.time_series = time_series
+        self._window_frames = time_series.window_frames if time_series is not None else 0
+
+        self.active: Dict[str, TrackAccumulator] = {}
+        self.total_tracks = 0
+
+        # مصفوفة نتائج CASA للمسارات المنتهية (تتضاعف سعتها عند الحاجة)
+        self._casa = np.empty((64, len(CASA_FIELDS)), dtype=np.float64)
+        self._finalized_count = 0
+
+        # ملخص المسارات المنتهية لبيانات التتبع
+        self.track_summaries: List[Dict[str, Any]] = []
+
+    def update(self, frame_idx: int, observations: List[Tuple[str, float, float]]):
+        """تحديث المسارات بنقاط الإطار الحالي ثم إخراج المسارات المفقودة"""
+        for track_id, x, y in observations:
+            accumulator = self.active.get(track_id)
+            if accumulator is None:
+                self.active[track_id] = TrackAccumulator(
+                    track_id, frame_idx, x, y,
+                    smoothing_window=self.smoothing_window,
+                    keep_points=self.track_store is not None,
+                    window_frames=self._window_frames,
+                    chunk_size=self.chunk_size
+                )
+                self.total_tracks += 1
+            else:
+                segment = accumulator.update(frame_idx, x, y)
+                if segment is not None:
+                    self._add_segment(accumulator, segment)
+
+        self.evict(frame_idx)
+
+    def evict(self, frame_idx: int):
+        """إنهاء المسارات التي تجاوزت العمر الأقصى"""
+        expired = [
+            track_id for track_id, accumulator in self.active.items()
+            if frame_idx - accumulator.last_frame > self.max_age
+        ]
+        for track_id in expired:
+            self._finalize_track(self.active.pop(track_id))
+
+    def finalize_all(self):
+        """إنهاء جميع المسارات النشطة (نهاية الفيديو)"""
+        for accumulator in self.active.values():
+            self._finalize_track(accumulator)
+        self.active.clear()
+        if self.track_store is not None:
+            self.track_store.flush()
+
+    def _add_segment(self, accumulator: TrackAccumulator, segment: Tuple[int, int, float, float, float]):
+        """تمرير مقطع نافذة إلى السلسلة الزمنية بعد بلوغ المسار الحد الأدنى للطول"""
+        if accumulator.num_points < self.min_track_length:
+            accumulator.pending_segments.append(segment)
+            return
+        for pending in accumulator.pending_segments:
+            self.time_series.add_segment(pending)
+        accumulator.pending_segments.clear()
+        self.time_series.add_segment(segment)
+
+    def _finalize_track(self, accumulator: TrackAccumulator):
+        if accumulator.num_points < self.min_track_length:
+            return
+
+        if self.time_series is not None:
+            segment = accumulator.close_segment()
+            if segment is not None:
+                self._add_segment(accumulator, segment)
+
+        values = accumulator.finalize(self.fps, self.pixel_to_micron_ratio)
+
+        if self._finalized_count == len(self._casa):
+            self._casa = np.resize(self._casa, (len(self._casa) * 2, len(CASA_FIELDS)))
+        self._casa[self._finalized_count] = [values[field] for field in CASA_FIELDS]
+        self._finalized_count += 1
+
+        self.track_summaries.append({
+            'track_id': accumulator.track_id,
+            'total_distance': values['total_distance'],
+            'displacement': values['displacement'],
+            'duration': values['duration']
+        })
+
+        if self.track_store is not None and accumulator.points is not None:
+            self.track_store.append(accumulator.track_id, accumulator.points)
+
+    @property
+    def motile_count(self) -> int:
+        """عدد المسارات المنتهية التي تحقق الحد الأدنى للطول"""
+        return self._finalized_count
+
+    def casa_arrays(self) -> Dict[str, np.ndarray]:
+        """قيم CASA لكل مسار منتهٍ كمصفوفات منفصلة لكل مؤشر"""
+        values = self._casa[:self._finalized_count]
+        return {field: values[:, i] for i, field in enumerate(CASA_FIELDS)}
+
+
+def casa_distributions(casa_values: Dict[str, np.ndarray]) -> Dict[str, Dict[str, Any]]:
+    """مدرجات تكرارية بفئات ثابتة ومئينات (p10/p50/p90) لكل مؤشر CASA
+
+    القيم خارج المدى تُحسب في الفئة الأولى أو الأخيرة.
+    """
+    distributions = {}
+    for field, (start, width, bins) in CASA_HISTOGRAM_BINS.items():
+        values = casa_values.get(field)
+        if values is None or len(values) == 0:
+            continue
+
+        edges = start + width * np.arange(bins + 1)
+        counts, _ = np.histogram(np.clip(values, edges[0], edges[-1]), bins=edges)
+        p10, p50, p90 = np.percentile(values, [10, 50, 90])
+
+        distributions[field] = {
+            'bin_start': start,
+            'bin_width': width,
+            'counts': counts.tolist(),
+            'p10': round(float(p10), 2),
+            'p50': round(float(p50), 2),
+            'p90': round(float(p90), 2),
+            'count': int(len(values))
+        }
+    return distributions
@@ -0,0 +1,243 @@
+import logging
+from typing import Tuple
+
+import numpy as np
+
+from ..utils.config import settings
+
+# يتم استيرادها عند التوفر
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# تنفيذ NumPy (المسار الافتراضي والاحتياطي)
+# ---------------------------------------------------------------------------
+
+def _track_chunk_numpy(xs: np.ndarray, ys: np.ndarray, tail_x: np.ndarray, tail_y: np.ndarray,
+                       window: int, last_x: float, last_y: float,
+                       smooth_x: float, smooth_y: float, last_side: int) -> Tuple:
+    """معالجة دفعة نقاط متتالية لمسار واحد
+
+    tail_x/tail_y: آخر (window - 1) نقطة قبل الدفعة على الأكثر.
+    يُرجع (طول المسار، طول المسار المنعّم، مجموع الإزاحة الجانبية،
+    عدد العبور، آخر جهة، آخر نقطة منعّمة x، آخر نقطة منعّمة y).
+    """
+    if len(xs) == 0:
+        return 0.0, 0.0, 0.0, 0, last_side, smooth_x, smooth_y
+
+    # المسار الفعلي
+    path_x = np.concatenate(([last_x], xs))
+    path_y = np.concatenate(([last_y], ys))
+    path_length = float(np.hypot(np.diff(path_x), np.diff(path_y)).sum())
+
+    # المتوسط المتحرك عبر مجاميع تراكمية تشمل ذيل الدفعة السابقة
+    all_x = np.concatenate((tail_x, xs))
+    all_y = np.concatenate((tail_y, ys))
+    # NaN (نقاط مفقودة) لا يدخل المجاميع التراكمية حتى لا يفسد ما بعده؛
+    # النافذة التي تحتوي NaN متوسطها NaN كما في الجمع المباشر
+    missing = np.isnan(all_x) | np.isnan(all_y)
+    cumsum_x = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, all_x))))
+    cumsum_y = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, all_y))))
+    cumsum_missing = np.concatenate(([0], np.cumsum(missing)))
+    ends = len(tail_x) + np.arange(1, len(xs) + 1)
+    counts = np.minimum(window, ends)
+    starts = ends - counts
+    gaps = (cumsum_missing[ends] - cumsum_missing[starts]) > 0
+    avg_x = np.where(gaps, np.nan, (cumsum_x[ends] - cumsum_x[starts]) / counts)
+    avg_y = np.where(gaps, np.nan, (cumsum_y[ends] - cumsum_y[starts]) / counts)
+
+    dx = np.diff(np.concatenate(([smooth_x], avg_x)))
+    dy = np.diff(np.concatenate(([smooth_y], avg_y)))
+    steps = np.hypot(dx, dy)
+    smoothed_length = float(steps.sum())
+
+    # الانحراف الجانبي وجهة العبور
+    cross = dx * (ys - avg_y) - dy * (xs - avg_x)
+    moving = steps > 0
+    lateral_sum = float((np.abs(cross[moving]) / steps[moving]).sum())
+
+    # NaN (نقاط مفقودة) بلا جهة، مثل المقارنة نقطة بنقطة
+    sides = np.where(cross > 0, 1, np.where(cross < 0, -1, 0))
+    sides = sides[sides != 0]
+    if last_side != 0:
+        sides = np.concatenate(([last_side], sides))
+    crossings = int(np.count_nonzero(np.diff(sides)))
+    if len(sides):
+        last_side = int(sides[-1])
+
+    return (path_length, smoothed_length, lateral_sum, crossings, last_side,
+            float(avg_x[-1]), float(avg_y[-1]))
+
+
+def _greedy_match_numpy(previous: np.ndarray, current: np.ndarray,
+                        max_distance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """ربط جشع لأقرب الأزواج (مسار سابق، كشف حالي) ضمن مسافة قصوى"""
+    if len(previous) == 0 or len(current) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    distances = np.hypot(
+        previous[:, None, 0] - current[None, :, 0],
+        previous[:, None, 1] - current[None, :, 1]
+    )
+    rows, cols = np.nonzero(distances <= max_distance)
+    order = np.argsort(distances[rows, cols], kind='mergesort')
+
+    used_rows = np.zeros(len(previous), dtype=np.bool_)
+    used_cols = np.zeros(len(current), dtype=np.bool_)
+    matched_rows, matched_cols = [], []
+    for k in order:
+        row, col = rows[k], cols[k]
+        if used_rows[row] or used_cols[col]:
+            continue
+        used_rows[row] = True
+        used_cols[col] = True
+        matched_rows.append(row)
+        matched_cols.append(col)
+
+    return np.array(matched_rows, dtype=np.int64), np.array(matched_cols, dtype=np.int64)
+
+
+# ---------------------------------------------------------------------------
+# تنفيذ Numba (اختياري، USE_NUMBA=true)
+# ---------------------------------------------------------------------------
+
+if NUMBA_AVAILABLE:
+
+    @njit(cache=True)
+    def _track_chunk_numba(xs, ys, tail_x, tail_y, window, last_x, last_y,
+                           smooth_x, smooth_y, last_side):
+        n_tail = tail_x.shape[0]
+        n = xs.shape[0]
+        all_x = np.empty(n_tail + n)
+        all_y = np.empty(n_tail + n)
+        all_x[:n_tail] = tail_x
+        all_y[:n_tail] = tail_y
+        all_x[n_tail:] = xs
+        all_y[n_tail:] = ys
+
+        path_length = 0.0
+        smoothed_length = 0.0
+        lateral_sum = 0.0
+        crossings = 0
+        prev_x, prev_y = last_x, last_y
+
+        for i in range(n):
+            x = xs[i]
+            y = ys[i]
+            path_length += np.hypot(x - prev_x, y - prev_y)
+            prev_x, prev_y = x, y
+
+            end = n_tail + i + 1
+            count = min(window, end)
+            sum_x = 0.0
+            sum_y = 0.0
+            for j in range(end - count, end):
+                sum_x += all_x[j]
+                sum_y += all_y[j]
+            avg_x = sum_x / count
+            avg_y = sum_y / count
+
+            dx = avg_x - smooth_x
+            dy = avg_y - smooth_y
+            step = np.hypot(dx, dy)
+            smoothed_length += step
+            smooth_x, smooth_y = avg_x, avg_y
+
+            cross = dx * (y - avg_y) - dy * (x - avg_x)
+            if step > 0:
+                lateral_sum += abs(cross) / step
+
+            side = 1 if cross > 0 else (-1 if cross < 0 else 0)
+            if side != 0:
+                if last_side != 0 and side != last_side:
+                    crossings += 1
+                last_side = side
+
+        return (path_length, smoothed_length, lateral_sum, crossings, last_side,
+                smooth_x, smooth_y)
+
+    @njit(cache=True)
+    def _greedy_match_numba(previous, current, max_distance):
+        n_prev = previous.shape[0]
+        n_curr = current.shape[0]
+
+        # الأزواج المرشحة بترتيب الصفوف كما في مسار NumPy
+        candidate_rows = np.empty(n_prev * n_curr, dtype=np.int64)
+        candidate_cols = np.empty(n_prev * n_curr, dtype=np.int64)
+        candidate_dist = np.empty(n_prev * n_curr)
+        k = 0
+        for r in range(n_prev):
+            for c in range(n_curr):
+                d = np.hypot(previous[r, 0] - current[c, 0], previous[r, 1] - current[c, 1])
+                if d <= max_distance:
+                    candidate_rows[k] = r
+                    candidate_cols[k] = c
+                    candidate_dist[k] = d
+                    k += 1
+
+        order = np.argsort(candidate_dist[:k], kind='mergesort')
+        used_rows = np.zeros(n_prev, dtype=np.bool_)
+        used_cols = np.zeros(n_curr, dtype=np.bool_)
+        matched_rows = np.empty(min(n_prev, n_curr), dtype=np.int64)
+        matched_cols = np.empty(min(n_prev, n_curr), dtype=np.int64)
+        m = 0
+        for idx in order:
+            r = candidate_rows[idx]
+            c = candidate_cols[idx]
+            if used_rows[r] or used_cols[c]:
+                continue
+            used_rows[r] = True
+            used_cols[c] = True
+            matched_rows[m] = r
+            matched_cols[m] = c
+            m += 1
+
+        return matched_rows[:m], matched_cols[:m]
+
+
+# ---------------------------------------------------------------------------
+# الواجهة العامة
+# ---------------------------------------------------------------------------
+
+USE_NUMBA = settings.use_numba and NUMBA_AVAILABLE
+
+if settings.use_numba and not NUMBA_AVAILABLE:
+    logger.warning("Numba غير متوفر - سيتم استخدام نوى NumPy")
+
+
+def track_chunk(xs: np.ndarray, ys: np.ndarray, tail_x: np.ndarray, tail_y: np.ndarray,
+                window: int, last_x: float, last_y: float,
+                smooth_x: float, smooth_y: float, last_side: int) -> Tuple:
+    """معالجة دفعة نقاط لمسار واحد (Numba عند التفعيل، وإلا NumPy)"""
+    if USE_NUMBA:
+        return _track_chunk_numba(xs, ys, tail_x, tail_y, window, last_x, last_y,
+                                  smooth_x, smooth_y, last_side)
+    return _track_chunk_numpy(xs, ys, tail_x, tail_y, window, last_x, last_y,
+                              smooth_x, smooth_y, last_side)
+
+
+def greedy_match(previous: np.ndarray, current: np.ndarray,
+                 max_distance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """ربط جشع بين المسارات السابقة والكشوفات الحالية (Numba عند التفعيل، وإلا NumPy)"""
+    if USE_NUMBA:
+        return _greedy_match_numba(
+            np.ascontiguousarray(previous, dtype=np.float64).reshape(-1, 2),
+            np.ascontiguousarray(current, dtype=np.float64).reshape(-1, 2),
+            float(max_distance)
+        )
+    return _greedy_match_numpy(previous, current, max_distance)
+
+
+def warmup():
+    """تجميع نوى Numba مسبقاً (أو تحميلها من ذاكرة التخزين المؤقت على القرص)"""
+    if not USE_NUMBA:
+        return
+    points = np.array([1.0, 2.0, 3.0])
+    track_chunk(points, points, points[:1], points[:1], 5, 0.0, 0.0, 0.0, 0.0, 0)
+    greedy_match(np.zeros((1, 2)), np.ones((1, 2)), 5.0)
@@ -0,0 +1,69 @@
+import logging
+import os
+import pickle
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """نقاط استئناف تحليلات الفيديو على القرص
+
+    كل تحليل له ملف واحد يُستبدل ذرياً (كتابة ملف مؤقت ثم os.replace)، فلا
+    يُقرأ أبداً ملف نصف مكتوب إذا توقفت العملية أثناء الحفظ.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, analysis_id: str) -> str:
+        return os.path.join(self.directory, f"{analysis_id}.ckpt")
+
+    @staticmethod
+    def snapshot(state: Dict[str, Any]) -> bytes:
+        """تجميد حالة التحليل (المتتبع والمجمّع حيّان يتغيران مع كل إطار)
+
+        تُستدعى في خيط التحليل نفسه، فتُكتب لاحقاً في خيط آخر دون أن تختلط
+        بتعديلات الإطارات التالية أو بتحرير المتتبع عند الإلغاء.
+        """
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def write(self, analysis_id: str, data: bytes):
+        """كتابة حالة مجمّدة بـ snapshot"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(analysis_id)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def save(self, analysis_id: str, state: Dict[str, Any]):
+        """حفظ حالة التحليل"""
+        self.write(analysis_id, self.snapshot(state))
+
+    def load(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """تحميل آخر نقطة استئناف (None إن لم توجد أو كانت تالفة)"""
+        path = self.path(analysis_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning(f"تعذر تحميل نقطة الاستئناف {analysis_id}: {e}")
+            self.delete(analysis_id)
+            return None
+
+    def delete(self, analysis_id: str):
+        """حذف نقطة الاستئناف عند انتهاء التحليل"""
+        for path in (self.path(analysis_id), f"{self.path(analysis_id)}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def stored_ids(self) -> Iterable[str]:
+        """معرفات التحليلات التي لها نقاط استئناف"""
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-len('.ckpt')] for name in os.listdir(self.directory) if name.endswith('.ckpt')]
@@ -0,0 +1,77 @@
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class FlowPropagator:
+    """نقل مواقع المسارات بين إطارات الكشف بالتدفق البصري (Lucas-Kanade)
+
+    يُشغَّل الكاشف على الإطارات المفتاحية فقط، وتُثبَّت عندها مواقع المسارات
+    المؤكدة. في الإطارات البينية تُحسب إزاحة جميع النقاط باستدعاء واحد لـ
+    calcOpticalFlowPyrLK على إطار رمادي مصغّر، وتُحذف النقاط التي يفقدها التدفق
+    حتى الإطار المفتاحي التالي.
+    """
+
+    def __init__(self, downscale: float = 0.5, window_size: int = 15, pyramid_levels: int = 2):
+        self.downscale = downscale
+        self._lk_params = dict(
+            winSize=(window_size, window_size),
+            maxLevel=pyramid_levels,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+        )
+
+        self._prev_gray: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._points = np.empty((0, 1, 2), dtype=np.float32)
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        """تحويل الإطار إلى رمادي مصغّر"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if self.downscale != 1.0:
+            gray = cv2.resize(
+                gray, None, fx=self.downscale, fy=self.downscale,
+                interpolation=cv2.INTER_AREA
+            )
+        return gray
+
+    def anchor(self, gray: np.ndarray, observations: List[Tuple[str, float, float]]):
+        """تثبيت المسارات على مواقع الإطار المفتاحي"""
+        self._prev_gray = gray
+        self._ids = [track_id for track_id, _, _ in observations]
+        self._points = np.array(
+            [(x * self.downscale, y * self.downscale) for _, x, y in observations],
+            dtype=np.float32
+        ).reshape(-1, 1, 2)
+
+    def propagate(self, gray: np.ndarray) -> List[Tuple[str, float, float]]:
+        """نقل جميع النقاط النشطة إلى الإطار الحالي وإرجاع مواقعها الأصلية"""
+        prev_gray, self._prev_gray = self._prev_gray, gray
+        if prev_gray is None or not self._ids:
+            return []
+
+        points, status, _ = cv2.calcOpticalFlowPyrLK(
+            prev_gray, gray, self._points, None, **self._lk_params
+        )
+
+        height, width = gray.shape[:2]
+        xs, ys = points[:, 0, 0], points[:, 0, 1]
+        keep = (
+            (status.ravel() == 1)
+            & (xs >= 0) & (xs < width)
+            & (ys >= 0) & (ys < height)
+        )
+
+        self._points = points[keep]
+        self._ids = [track_id for track_id, kept in zip(self._ids, keep) if kept]
+
+        scale = 1.0 / self.downscale
+        return [
+            (track_id, float(x) * scale, float(y) * scale)
+            for track_id, (x, y) in zip(self._ids, self._points[:, 0])
+        ]
+
+    @property
+    def active_count(self) -> int:
+        """عدد النقاط المنقولة حالياً"""
+        return len(self._ids)
@@ -0,0 +1,66 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .casa_kernels import greedy_match
+
+
+class GreedyTracker:
+    """متتبع بسيط بالربط الجشع لأقرب مركز (بديل DeepSort عند عدم توفره)
+
+    يربط كل كشف بأقرب مسار سابق ضمن مسافة قصوى، ويؤكد المسار بعد
+    n_init إطارات متطابقة، ويحذفه بعد max_age إطاراً دون تطابق.
+    """
+
+    def __init__(self, max_distance: float = 30.0, max_age: int = 30, n_init: int = 3):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.n_init = n_init
+
+        self._positions = np.empty((0, 2), dtype=np.float64)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._last_seen = np.empty(0, dtype=np.int64)
+        self._hits = np.empty(0, dtype=np.int64)
+        self._next_id = 1
+
+    def update(self, detections: List[Dict], frame_idx: int) -> List[Tuple[str, float, float]]:
+        """تحديث المسارات وإرجاع مراكز المسارات المؤكدة المطابقة في الإطار"""
+        centers = np.array(
+            [det['center'] for det in detections], dtype=np.float64
+        ).reshape(-1, 2)
+
+        rows, cols = greedy_match(self._positions, centers, self.max_distance)
+        self._positions[rows] = centers[cols]
+        self._last_seen[rows] = frame_idx
+        self._hits[rows] += 1
+
+        # الكشوفات غير المطابقة تبدأ مسارات جديدة
+        unmatched = np.ones(len(centers), dtype=bool)
+        unmatched[cols] = False
+        new_count = int(unmatched.sum())
+        if new_count:
+            self._positions = np.concatenate((self._positions, centers[unmatched]))
+            self._ids = np.concatenate((
+                self._ids, np.arange(self._next_id, self._next_id + new_count)
+            ))
+            self._last_seen = np.concatenate((
+                self._last_seen, np.full(new_count, frame_idx, dtype=np.int64)
+            ))
+            self._hits = np.concatenate((self._hits, np.ones(new_count, dtype=np.int64)))
+            self._next_id += new_count
+
+        confirmed = rows[self._hits[rows] >= self.n_init]
+        observations = [
+            (str(self._ids[i]), self._positions[i, 0], self._positions[i, 1])
+            for i in confirmed
+        ]
+
+        # حذف المسارات المفقودة
+        alive = frame_idx - self._last_seen <= self.max_age
+        if not alive.all():
+            self._positions = self._positions[alive]
+            self._ids = self._ids[alive]
+            self._last_seen = self._last_seen[alive]
+            self._hits = self._hits[alive]
+
+        return observations
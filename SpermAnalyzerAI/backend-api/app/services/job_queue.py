@@ -0,0 +1,552 @@
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import aliased
+
+from ..database import get_db_session, AnalysisRecord
+from ..models.analysis_models import AnalysisResult, AnalysisStatus
+from .admission import AdmissionRejected, probe_media, estimate_analysis_memory_mb
+from .scheduling import estimate_analysis_cost, normalize_priority, schedule_key
+
+logger = logging.getLogger(__name__)
+
+# امتدادات الفيديو لتحديد نوع الملف عند الإدراج
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+class JobQueue(ABC):
+    """واجهة طابور التحليلات المشتركة بين مسارات API والعمال
+
+    التنفيذ المحلي SQLiteJobQueue يكفي لعقدة واحدة، وRedisJobQueue يسمح
+    بفصل عقد API عن عقد التحليل (اختيار التنفيذ عبر QUEUE_BACKEND).
+    """
+
+    @abstractmethod
+    def register_upload(self, analysis_id: str, file_path: str,
+                        media: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """تسجيل ملف مرفوع مع خصائصه وكلفته المقدرة قبل إرساله للتحليل"""
+
+    @abstractmethod
+    def enqueue(self, analysis_id: str, file_path: str,
+                priority: Optional[str] = None) -> Dict[str, Any]:
+        """إدراج تحليل في الطابور؛ يرفع AdmissionRejected عند امتلائه"""
+
+    @abstractmethod
+    def claim(self, worker_id: str, priorities: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """حجز المهمة التالية ضمن حدود التزامن والذاكرة"""
+
+    @abstractmethod
+    def heartbeat(self, worker_id: str, progress: Dict[str, float]) -> List[str]:
+        """تحديث نبض المهام الجارية؛ يُرجع المهام الملغاة"""
+
+    @abstractmethod
+    def publish_progress(self, worker_id: str, updates: Dict[str, Dict[str, Any]]) -> int:
+        """كتابة دفعة من التقدم التفصيلي (progress, message, estimated_time_remaining)
+        للمهام التي يحملها العامل؛ يُرجع عدد المهام المحدثة"""
+
+    @abstractmethod
+    def cancel(self, analysis_id: str) -> Optional[str]:
+        """إلغاء مهمة؛ يُرجع حالتها السابقة"""
+
+    @abstractmethod
+    def complete(self, analysis_id: str, result: AnalysisResult) -> bool:
+        """تسجيل اكتمال المهمة؛ False إن أُلغيت قبل الاكتمال"""
+
+    @abstractmethod
+    def fail(self, analysis_id: str, error: str):
+        """تسجيل فشل المهمة"""
+
+    @abstractmethod
+    def requeue_stale(self) -> int:
+        """إعادة المهام المتوقف نبضها إلى الطابور"""
+
+    @abstractmethod
+    def release(self, analysis_ids: List[str], worker_id: str) -> int:
+        """إعادة مهام أوقفها إيقاف العامل إلى الطابور فوراً"""
+
+    @abstractmethod
+    def resumable_ids(self) -> List[str]:
+        """المهام التي قد تُستأنف (منتظرة أو جارية)"""
+
+    @abstractmethod
+    def set_webhook(self, analysis_id: str, webhook_url: Optional[str]) -> Optional[Dict[str, Any]]:
+        """تسجيل رابط إشعار انتهاء التحليل؛ None إن لم توجد المهمة"""
+
+    @abstractmethod
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """حالة مهمة واحدة"""
+
+    @abstractmethod
+    def get_many(self, analysis_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """حالة عدة مهام بقراءة واحدة (المهام غير الموجودة لا تظهر في النتيجة)"""
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """عدد المهام في كل حالة"""
+
+    @staticmethod
+    def _file_type(file_path: str) -> str:
+        return 'video' if file_path.lower().endswith(VIDEO_EXTENSIONS) else 'image'
+
+    def _media_fields(self, file_path: str, file_type: str, media: Dict[str, Any]) -> Dict[str, Any]:
+        """خصائص الوسائط وتقديرات الذاكرة والكلفة المحفوظة مع المهمة"""
+        width, height = media.get('width') or 0, media.get('height') or 0
+        return {
+            "filename": os.path.basename(file_path),
+            "file_path": file_path,
+            "file_type": file_type,
+            "file_size": os.path.getsize(file_path),
+            "frame_count": media.get('frame_count'),
+            "fps": media.get('fps'),
+            "resolution": f"{width}x{height}",
+            "estimated_memory_mb": estimate_analysis_memory_mb(
+                media.get('frame_count') or 1, width, height
+            ),
+            "estimated_cost": estimate_analysis_cost(file_type, media, self.detect_interval)
+        }
+
+
+class SQLiteJobQueue(JobQueue):
+    """طابور تحليلات دائم مخزن في جدول analysis_records
+
+    - المهمة سجل بحالة pending، يُحجز بتحديث شرطي (status = 'pending')
+      فلا يحجز عاملان المهمة نفسها حتى عبر عمليات متعددة.
+    - العامل يحدّث heartbeat_at دورياً، والمهام التي توقف نبضها (إعادة تشغيل
+      أو انهيار) تعود إلى الطابور حتى max_attempts محاولات.
+    - القبول: طابور انتظار محدود بـ max_queued، والحجز لا يتجاوز حد التزامن
+      لكل نوع (فيديو/صورة) ولا ميزانية الذاكرة المقدرة للتحليلات الجارية.
+      قاعدة SQLite محلية للمضيف، فالحدود تشمل جميع عمليات الحاوية.
+    - الجدولة: الأقصر أولاً ضمن فئة الأولوية مع التقادم (schedule_key)،
+      والكلفة تُقدّر عند الرفع من خصائص الوسائط.
+    """
+
+    def __init__(self, stale_timeout: int = 120, max_attempts: int = 3,
+                 type_limits: Optional[Dict[str, int]] = None, max_queued: int = 100,
+                 memory_budget_mb: float = 3072, retry_after: int = 30,
+                 aging_rate: float = 1.0, class_seconds: float = 60.0, detect_interval: int = 1):
+        self.stale_timeout = stale_timeout
+        self.max_attempts = max_attempts
+        self.type_limits = type_limits or {'video': 2, 'image': 4}
+        self.max_queued = max_queued
+        self.memory_budget_mb = memory_budget_mb
+        self.retry_after = retry_after
+        self.aging_rate = aging_rate
+        self.class_seconds = class_seconds
+        self.detect_interval = detect_interval
+        # اتصال SQLite مشترك بين الخيوط، فتُنفذ معاملات الطابور بالتتابع
+        self._lock = threading.Lock()
+
+    def register_upload(self, analysis_id: str, file_path: str,
+                        media: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """تسجيل ملف مرفوع مع خصائصه وكلفته المقدرة قبل إرساله للتحليل"""
+        file_type = self._file_type(file_path)
+        if not media or not media.get('width'):
+            media = probe_media(file_path, file_type)
+
+        with self._lock, get_db_session() as db:
+            record = db.get(AnalysisRecord, analysis_id)
+            if record is None:
+                record = AnalysisRecord(id=analysis_id)
+                db.add(record)
+
+            self._apply_media(record, file_path, file_type, media)
+            record.status = AnalysisStatus.UPLOADED.value
+            record.progress = 0.0
+            db.flush()
+            return self._to_job(record)
+
+    def enqueue(self, analysis_id: str, file_path: str,
+                priority: Optional[str] = None) -> Dict[str, Any]:
+        """إدراج تحليل في الطابور (أو إرجاع حالته إن كان مدرجاً أو جارياً)
+
+        يرفع AdmissionRejected عند امتلاء طابور الانتظار.
+        """
+        file_type = self._file_type(file_path)
+
+        with self._lock, get_db_session() as db:
+            record = db.get(AnalysisRecord, analysis_id)
+            if record is not None and record.status in (
+                AnalysisStatus.PENDING.value, AnalysisStatus.PROCESSING.value
+            ):
+                return self._to_job(record)
+            known_media = record is not None and record.estimated_cost is not None
+
+        # الخصائص المسجلة عند الرفع تغني عن فتح الملف مجدداً
+        media = None if known_media else probe_media(file_path, file_type)
+
+        with self._lock, get_db_session() as db:
+            pending = db.query(func.count(AnalysisRecord.id)).filter(
+                AnalysisRecord.status == AnalysisStatus.PENDING.value
+            ).scalar()
+            record = db.get(AnalysisRecord, analysis_id)
+            if record is not None and record.status in (
+                AnalysisStatus.PENDING.value, AnalysisStatus.PROCESSING.value
+            ):
+                return self._to_job(record)
+
+            if pending < self.max_queued:
+                if record is None:
+                    record = AnalysisRecord(id=analysis_id)
+                    db.add(record)
+                if media is not None:
+                    self._apply_media(record, file_path, file_type, media)
+
+                now = datetime.now()
+                record.priority = normalize_priority(priority, file_type)
+                record.schedule_key = schedule_key(
+                    record.priority, record.estimated_cost, now,
+                    self.aging_rate, self.class_seconds
+                )
+                record.status = AnalysisStatus.PENDING.value
+                record.progress = 0.0
+                record.error_message = None
+                record.worker_id = None
+                record.attempts = 0
+                record.created_at = now
+                record.started_at = None
+                record.completed_at = None
+                db.flush()
+                return self._to_job(record)
+
+        raise AdmissionRejected("طابور التحليل ممتلئ", self.retry_after)
+
+    def _apply_media(self, record: AnalysisRecord, file_path: str, file_type: str,
+                     media: Dict[str, Any]):
+        """حفظ خصائص الوسائط وتقديرات الذاكرة والكلفة في السجل"""
+        for field, value in self._media_fields(file_path, file_type, media).items():
+            setattr(record, field, value)
+
+    def claim(self, worker_id: str, priorities: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """حجز المهمة ذات أصغر schedule_key التي تسمح بها حدود التزامن والذاكرة
+
+        priorities: حصر الحجز في فئات معينة (خانات الطلبات التفاعلية).
+        """
+        with self._lock, get_db_session() as db:
+            processing = AnalysisRecord.status == AnalysisStatus.PROCESSING.value
+            running = dict(db.query(AnalysisRecord.file_type, func.count(AnalysisRecord.id)).filter(
+                processing
+            ).group_by(AnalysisRecord.file_type).all())
+            open_types = [
+                file_type for file_type, limit in self.type_limits.items()
+                if running.get(file_type, 0) < limit
+            ]
+            if not open_types:
+                return None
+
+            memory_used = db.query(
+                func.coalesce(func.sum(AnalysisRecord.estimated_memory_mb), 0.0)
+            ).filter(processing).scalar()
+
+            # تحليل واحد أكبر من الميزانية يُقبل عندما لا يعمل غيره
+            candidates = db.query(AnalysisRecord).filter(
+                AnalysisRecord.status == AnalysisStatus.PENDING.value,
+                AnalysisRecord.file_type.in_(open_types)
+            )
+            if priorities:
+                candidates = candidates.filter(AnalysisRecord.priority.in_(priorities))
+            if memory_used > 0:
+                candidates = candidates.filter(
+                    func.coalesce(AnalysisRecord.estimated_memory_mb, 0.0)
+                    <= self.memory_budget_mb - memory_used
+                )
+            candidates = candidates.order_by(
+                AnalysisRecord.schedule_key, AnalysisRecord.created_at
+            ).limit(8).all()
+
+            for candidate in candidates:
+                if self._try_claim(db, candidate, worker_id):
+                    return self._to_job(db.get(AnalysisRecord, candidate.id))
+            return None
+
+    def _try_claim(self, db, candidate: AnalysisRecord, worker_id: str) -> bool:
+        """تحديث شرطي يعيد فحص الحالة والحدود داخل العبارة نفسها
+
+        تنفيذ SQLite للكتابة متسلسل، فلا تتجاوز عمليتان الحدود معاً.
+        """
+        other = aliased(AnalysisRecord)
+        processing = other.status == AnalysisStatus.PROCESSING.value
+        running_of_type = select(func.count()).select_from(other).where(
+            processing, other.file_type == candidate.file_type
+        ).scalar_subquery()
+        memory_used = select(
+            func.coalesce(func.sum(other.estimated_memory_mb), 0.0)
+        ).where(processing).scalar_subquery()
+        estimate = candidate.estimated_memory_mb or 0.0
+
+        now = datetime.now()
+        result = db.execute(
+            update(AnalysisRecord)
+            .where(
+                AnalysisRecord.id == candidate.id,
+                AnalysisRecord.status == AnalysisStatus.PENDING.value,
+                running_of_type < self.type_limits.get(candidate.file_type, 1),
+                or_(memory_used == 0, memory_used + estimate <= self.memory_budget_mb)
+            )
+            .values(
+                status=AnalysisStatus.PROCESSING.value,
+                worker_id=worker_id,
+                attempts=func.coalesce(AnalysisRecord.attempts, 0) + 1,
+                started_at=now,
+                heartbeat_at=now,
+                progress_message=None,
+                progress_eta=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def heartbeat(self, worker_id: str, progress: Dict[str, float]) -> List[str]:
+        """تحديث نبض وتقدم المهام التي يحملها العامل
+
+        يُرجع المهام التي أُلغيت من عملية أخرى ليوقفها العامل.
+        """
+        if not progress:
+            return []
+        with self._lock, get_db_session() as db:
+            now = datetime.now()
+            for analysis_id, value in progress.items():
+                db.query(AnalysisRecord).filter(
+                    AnalysisRecord.id == analysis_id,
+                    AnalysisRecord.worker_id == worker_id,
+                    AnalysisRecord.status == AnalysisStatus.PROCESSING.value
+                ).update({
+                    AnalysisRecord.heartbeat_at: now,
+                    AnalysisRecord.progress: value
+                }, synchronize_session=False)
+
+            cancelled = db.query(AnalysisRecord.id).filter(
+                AnalysisRecord.id.in_(list(progress)),
+                AnalysisRecord.status == AnalysisStatus.CANCELLED.value
+            ).all()
+            return [row.id for row in cancelled]
+
+    def publish_progress(self, worker_id: str, updates: Dict[str, Dict[str, Any]]) -> int:
+        """كتابة تقدم عدة مهام في معاملة واحدة
+
+        تُجمع تحديثات جميع المهام الجارية في العامل في commit واحد (WAL)،
+        فتقرأ العمليات الأخرى التقدم والرسالة والوقت المتبقي بقراءة واحدة.
+        """
+        if not updates:
+            return 0
+        with self._lock, get_db_session() as db:
+            updated = 0
+            for analysis_id, state in updates.items():
+                updated += db.query(AnalysisRecord).filter(
+                    AnalysisRecord.id == analysis_id,
+                    AnalysisRecord.worker_id == worker_id,
+                    AnalysisRecord.status == AnalysisStatus.PROCESSING.value
+                ).update({
+                    AnalysisRecord.progress: state['progress'],
+                    AnalysisRecord.progress_message: state.get('message'),
+                    AnalysisRecord.progress_eta: state.get('estimated_time_remaining')
+                }, synchronize_session=False)
+            return updated
+
+    def cancel(self, analysis_id: str) -> Optional[str]:
+        """إلغاء مهمة مرفوعة أو منتظرة أو جارية؛ يُرجع حالتها السابقة
+
+        تحرير السعة فوري لأن حدود التزامن والذاكرة تحسب المهام processing فقط.
+        """
+        active = (
+            AnalysisStatus.UPLOADED.value,
+            AnalysisStatus.PENDING.value,
+            AnalysisStatus.PROCESSING.value
+        )
+        with self._lock, get_db_session() as db:
+            record = db.get(AnalysisRecord, analysis_id)
+            if record is None or record.status not in active:
+                return None
+
+            previous = record.status
+            cancelled = db.query(AnalysisRecord).filter(
+                AnalysisRecord.id == analysis_id,
+                AnalysisRecord.status == previous
+            ).update({
+                AnalysisRecord.status: AnalysisStatus.CANCELLED.value,
+                AnalysisRecord.completed_at: datetime.now()
+            }, synchronize_session=False)
+            return previous if cancelled else None
+
+    def complete(self, analysis_id: str, result: AnalysisResult) -> bool:
+        """تسجيل اكتمال المهمة مع ملخص النتائج؛ False إن أُلغيت قبل الاكتمال"""
+        casa = result.casa_parameters
+        morphology = result.morphology
+        metadata = result.metadata
+        with self._lock, get_db_session() as db:
+            return bool(db.query(AnalysisRecord).filter(
+                AnalysisRecord.id == analysis_id,
+                AnalysisRecord.status == AnalysisStatus.PROCESSING.value
+            ).update({
+                AnalysisRecord.status: AnalysisStatus.COMPLETED.value,
+                AnalysisRecord.progress: 1.0,
+                AnalysisRecord.completed_at: datetime.now(),
+                AnalysisRecord.error_message: None,
+                AnalysisRecord.total_sperm_count: result.sperm_count,
+                AnalysisRecord.concentration: result.concentration,
+                AnalysisRecord.motility_percentage: result.motility,
+                AnalysisRecord.vcl: casa.vcl,
+                AnalysisRecord.vsl: casa.vsl,
+                AnalysisRecord.vap: casa.vap,
+                AnalysisRecord.lin: casa.lin,
+                AnalysisRecord.str_value: casa.str,
+                AnalysisRecord.wob: casa.wob,
+                AnalysisRecord.alh: casa.alh,
+                AnalysisRecord.bcf: casa.bcf,
+                AnalysisRecord.normal_morphology: morphology.normal,
+                AnalysisRecord.head_defects: morphology.head_defects,
+                AnalysisRecord.neck_defects: morphology.neck_defects,
+                AnalysisRecord.tail_defects: morphology.tail_defects,
+                AnalysisRecord.velocity_data: [point.dict() for point in result.velocity_distribution],
+                AnalysisRecord.frame_count: metadata.frame_count if metadata else None,
+                AnalysisRecord.fps: metadata.fps if metadata else None,
+                AnalysisRecord.resolution: metadata.resolution if metadata else None,
+                AnalysisRecord.confidence_score: metadata.confidence if metadata else None,
+                AnalysisRecord.sample_quality: result.get_quality().value,
+                AnalysisRecord.extra_metadata: {
+                    "partial": metadata.partial,
+                    "frames_processed": metadata.frames_processed
+                } if metadata else None
+            }, synchronize_session=False))
+
+    def fail(self, analysis_id: str, error: str):
+        """تسجيل فشل المهمة (أخطاء التحليل لا يُعاد تنفيذها)"""
+        with self._lock, get_db_session() as db:
+            db.query(AnalysisRecord).filter(
+                AnalysisRecord.id == analysis_id,
+                AnalysisRecord.status == AnalysisStatus.PROCESSING.value
+            ).update({
+                AnalysisRecord.status: AnalysisStatus.FAILED.value,
+                AnalysisRecord.completed_at: datetime.now(),
+                AnalysisRecord.error_message: error
+            }, synchronize_session=False)
+
+    def requeue_stale(self) -> int:
+        """إعادة المهام المتوقف نبضها إلى الطابور، أو إفشالها بعد max_attempts"""
+        cutoff = datetime.now() - timedelta(seconds=self.stale_timeout)
+        with self._lock, get_db_session() as db:
+            stale = db.query(AnalysisRecord).filter(
+                AnalysisRecord.status == AnalysisStatus.PROCESSING.value,
+                AnalysisRecord.heartbeat_at < cutoff
+            )
+            failed = stale.filter(AnalysisRecord.attempts >= self.max_attempts).update({
+                AnalysisRecord.status: AnalysisStatus.FAILED.value,
+                AnalysisRecord.completed_at: datetime.now(),
+                AnalysisRecord.error_message: "تجاوز عدد المحاولات المسموح"
+            }, synchronize_session=False)
+            requeued = stale.update({
+                AnalysisRecord.status: AnalysisStatus.PENDING.value,
+                AnalysisRecord.worker_id: None
+            }, synchronize_session=False)
+
+        if failed or requeued:
+            logger.warning(f"مهام متوقفة: أعيد {requeued} وفشل {failed}")
+        return requeued
+
+    def release(self, analysis_ids: List[str], worker_id: str) -> int:
+        """إعادة مهام أوقفها إيقاف العامل إلى الطابور فوراً
+
+        الإيقاف المنظم ليس فشلاً فلا يُحتسب ضمن المحاولات، ويستأنف العامل
+        التالي المهمة من آخر نقطة استئناف.
+        """
+        if not analysis_ids:
+            return 0
+        with self._lock, get_db_session() as db:
+            return db.query(AnalysisRecord).filter(
+                AnalysisRecord.id.in_(list(analysis_ids)),
+                AnalysisRecord.worker_id == worker_id,
+                AnalysisRecord.status == AnalysisStatus.PROCESSING.value
+            ).update({
+                AnalysisRecord.status: AnalysisStatus.PENDING.value,
+                AnalysisRecord.worker_id: None,
+                AnalysisRecord.attempts: func.max(AnalysisRecord.attempts - 1, 0)
+            }, synchronize_session=False)
+
+    def resumable_ids(self) -> List[str]:
+        """المهام التي قد تُستأنف (منتظرة أو جارية)"""
+        with self._lock, get_db_session() as db:
+            rows = db.query(AnalysisRecord.id).filter(AnalysisRecord.status.in_([
+                AnalysisStatus.PENDING.value,
+                AnalysisStatus.PROCESSING.value
+            ])).all()
+            return [row.id for row in rows]
+
+    def set_webhook(self, analysis_id: str, webhook_url: Optional[str]) -> Optional[Dict[str, Any]]:
+        """تسجيل رابط إشعار انتهاء التحليل؛ None إن لم توجد المهمة"""
+        with self._lock, get_db_session() as db:
+            record = db.get(AnalysisRecord, analysis_id)
+            if record is None:
+                return None
+            record.webhook_url = webhook_url
+            db.flush()
+            return self._to_job(record)
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """حالة مهمة واحدة"""
+        with self._lock, get_db_session() as db:
+            record = db.get(AnalysisRecord, analysis_id)
+            return self._to_job(record) if record is not None else None
+
+    def get_many(self, analysis_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """حالة عدة مهام باستعلام IN واحد على المفتاح الأساسي"""
+        if not analysis_ids:
+            return {}
+        with self._lock, get_db_session() as db:
+            records = db.query(AnalysisRecord).filter(AnalysisRecord.id.in_(analysis_ids)).all()
+            return {record.id: self._to_job(record) for record in records}
+
+    def counts(self) -> Dict[str, int]:
+        """عدد المهام في كل حالة"""
+        with self._lock, get_db_session() as db:
+            rows = db.query(AnalysisRecord.status, func.count(AnalysisRecord.id)).group_by(
+                AnalysisRecord.status
+            ).all()
+            return {status: count for status, count in rows}
+
+    @staticmethod
+    def _to_job(record: AnalysisRecord) -> Dict[str, Any]:
+        return {
+            "analysis_id": record.id,
+            "file_path": record.file_path,
+            "status": record.status,
+            "priority": record.priority,
+            "estimated_cost": record.estimated_cost,
+            "progress": record.progress or 0.0,
+            "progress_message": record.progress_message,
+            "estimated_time_remaining": record.progress_eta,
+            "attempts": record.attempts or 0,
+            "error_message": record.error_message,
+            "webhook_url": record.webhook_url,
+            "created_at": record.created_at,
+            "started_at": record.started_at,
+            "completed_at": record.completed_at
+        }
+
+
+def create_job_queue(queue_config: Dict[str, Any], detect_interval: int = 1) -> JobQueue:
+    """إنشاء طابور التحليلات حسب QUEUE_BACKEND (sqlite أو redis)"""
+    options = dict(
+        stale_timeout=queue_config['stale_timeout'],
+        max_attempts=queue_config['max_attempts'],
+        type_limits=queue_config['type_limits'],
+        max_queued=queue_config['max_queued'],
+        memory_budget_mb=queue_config['memory_budget_mb'],
+        retry_after=queue_config['retry_after'],
+        aging_rate=queue_config['aging_rate'],
+        class_seconds=queue_config['class_seconds'],
+        detect_interval=detect_interval
+    )
+    if queue_config['backend'] == 'redis':
+        from .redis_queue import RedisJobQueue
+        return RedisJobQueue.from_url(
+            queue_config['redis_url'],
+            prefix=queue_config['redis_prefix'],
+            result_ttl=queue_config['result_ttl'],
+            **options
+        )
+    return SQLiteJobQueue(**options)
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .casa_accumulator import CASA_FIELDS, OnlineCasaAccumulator
+from .greedy_tracker import GreedyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class LiveAnalysisSession:
+    """جلسة تحليل مباشر لإطارات كاميرا متدفقة (WebSocket)
+
+    لكل جلسة متتبع ومجمّع CASA خاصان بها. إطار واحد فقط ينتظر المعالجة:
+    الإطار الجديد يستبدل المنتظر إن لم تبدأ معالجته بعد، فيبقى التأخير
+    محدوداً بزمن معالجة إطار واحد بدلاً من طابور يتراكم عند بطء الكشف.
+
+    الإطارات المعالجة متتالية في المجمّع، ومعدلها الفعلي (حسب الطوابع
+    الزمنية للعميل) يُستخدم لحساب السرعات، فالإطارات المسقطة لا تشوّه
+    مؤشرات CASA.
+    """
+
+    def __init__(self, analyzer, session_id: str, window_seconds: float = 10.0):
+        self.analyzer = analyzer
+        self.session_id = session_id
+        self.window_seconds = window_seconds
+
+        if analyzer.tracker_pool:
+            self.tracker = analyzer.tracker_pool.acquire()
+        else:
+            self.tracker = GreedyTracker(
+                max_distance=analyzer.tracking_config['greedy_max_distance'],
+                max_age=analyzer.max_track_age,
+                n_init=analyzer.tracking_config['n_init']
+            )
+        # fps يُحدّث من معدل الإطارات المعالجة قبل كل تقدير
+        self.accumulator = OnlineCasaAccumulator(
+            fps=30.0,
+            pixel_to_micron_ratio=analyzer.pixel_to_micron_ratio,
+            min_track_length=analyzer.min_track_length,
+            max_age=analyzer.max_track_age,
+            smoothing_window=analyzer.smoothing_window,
+            chunk_size=analyzer.tracking_config['chunk_size']
+        )
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.invalid = 0
+        self.resolution: Optional[str] = None
+        self.latency_ms = 0.0  # من الاستلام حتى انتهاء المعالجة (متوسط أسي)
+
+        self._pending: Optional[Tuple[float, bytes, float]] = None
+        self._frame_ready = asyncio.Event()
+        self._last_timestamp: Optional[float] = None
+        self._frame_interval: Optional[float] = None  # بين الإطارات المعالجة (متوسط أسي)
+        self._frame_shape: Optional[Tuple[int, ...]] = None
+
+        # عدد المسارات المرئية لكل إطار، وعدد المسارات المنتهية عند كل إطار
+        # لتحديد المسارات المنتهية داخل النافذة
+        self._visible: Deque[Tuple[float, int]] = deque()
+        self._finalized_marks: Deque[Tuple[float, int]] = deque()
+        self._window_start = 0
+
+    def submit(self, timestamp: float, data: bytes):
+        """استلام إطار مضغوط؛ يُسقط الإطار المنتظر إن وُجد"""
+        self.received += 1
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = (timestamp, data, time.monotonic())
+        self._frame_ready.set()
+
+    async def run(self):
+        """معالجة أحدث إطار منتظر باستمرار حتى إلغاء المهمة"""
+        while True:
+            await self._frame_ready.wait()
+            self._frame_ready.clear()
+            pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+            try:
+                await self._process(*pending)
+            except Exception as e:
+                self.invalid += 1
+                logger.warning(f"فشل في معالجة إطار الجلسة {self.session_id}: {e}")
+
+    async def _process(self, timestamp: float, data: bytes, received_at: float):
+        # إطار أقدم من آخر إطار معالج (وصل متأخراً)
+        if self._last_timestamp is not None and timestamp <= self._last_timestamp:
+            self.dropped += 1
+            return
+
+        frame = await asyncio.to_thread(
+            cv2.imdecode, np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR
+        )
+        if frame is None:
+            self.invalid += 1
+            return
+
+        detections = await self.analyzer._detect_sperm(frame)
+        observations = self.analyzer._update_tracks(self.tracker, detections, frame, self.processed)
+        self.accumulator.update(self.processed, observations)
+        self.processed += 1
+
+        if self._last_timestamp is not None:
+            interval = timestamp - self._last_timestamp
+            self._frame_interval = (
+                interval if self._frame_interval is None
+                else 0.8 * self._frame_interval + 0.2 * interval
+            )
+        self._last_timestamp = timestamp
+        self._frame_shape = frame.shape
+        self.resolution = f"{frame.shape[1]}x{frame.shape[0]}"
+
+        cutoff = timestamp - self.window_seconds
+        self._visible.append((timestamp, len(observations)))
+        while self._visible and self._visible[0][0] < cutoff:
+            self._visible.popleft()
+        self._finalized_marks.append((timestamp, self.accumulator.motile_count))
+        while self._finalized_marks and self._finalized_marks[0][0] < cutoff:
+            self._window_start = self._finalized_marks.popleft()[1]
+
+        latency = (time.monotonic() - received_at) * 1000
+        self.latency_ms = latency if self.processed == 1 else 0.8 * self.latency_ms + 0.2 * latency
+
+    @property
+    def effective_fps(self) -> float:
+        """معدل الإطارات المعالجة فعلياً"""
+        if not self._frame_interval or self._frame_interval <= 0:
+            return 30.0
+        return 1.0 / self._frame_interval
+
+    def estimate(self) -> Dict[str, Any]:
+        """تقدير CASA متجدد من مسارات آخر window_seconds ثانية
+
+        يشمل المسارات المنتهية داخل النافذة والمسارات النشطة التي بلغت
+        الحد الأدنى للطول.
+        """
+        accumulator = self.accumulator
+        accumulator.fps = self.effective_fps
+
+        finalized = accumulator.casa_arrays()
+        rows: List[np.ndarray] = []
+        if accumulator.motile_count > self._window_start:
+            rows.append(np.column_stack([finalized[field][self._window_start:] for field in CASA_FIELDS]))
+        active = [
+            track.finalize(accumulator.fps, accumulator.pixel_to_micron_ratio)
+            for track in accumulator.active.values()
+            if track.num_points >= accumulator.min_track_length
+        ]
+        if active:
+            rows.append(np.array([[values[field] for field in CASA_FIELDS] for values in active]))
+        values = np.vstack(rows) if rows else np.empty((0, len(CASA_FIELDS)))
+
+        track_count = len(values)
+        casa = {
+            field: float(values[:, i].mean()) if track_count else 0.0
+            for i, field in enumerate(CASA_FIELDS)
+        }
+        motile = int(np.count_nonzero(values[:, 0] >= self.analyzer.motile_vcl_threshold)) if track_count else 0
+        motility = motile / track_count * 100 if track_count else 0.0
+        casa['mot'] = motility
+
+        sperm_count = round(float(np.mean([count for _, count in self._visible]))) if self._visible else 0
+        concentration = (
+            self.analyzer._calculate_concentration(sperm_count, self._frame_shape)
+            if self._frame_shape is not None else 0.0
+        )
+
+        return {
+            "sperm_count": sperm_count,
+            "motility": motility,
+            "concentration": concentration,
+            "casa_parameters": casa,
+            "track_count": track_count,
+            "window_seconds": self.window_seconds,
+            "stats": self.stats()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصاءات الجلسة: الإطارات المستلمة والمعالجة والمسقطة والتأخير"""
+        return {
+            "frames_received": self.received,
+            "frames_processed": self.processed,
+            "frames_dropped": self.dropped,
+            "frames_invalid": self.invalid,
+            "processing_fps": round(self.effective_fps, 2) if self.processed > 1 else 0.0,
+            "latency_ms": round(self.latency_ms, 1),
+            "resolution": self.resolution
+        }
+
+    def close(self):
+        """إعادة متتبع DeepSort إلى المجمع"""
+        if self.analyzer.tracker_pool and self.tracker is not None:
+            self.analyzer.tracker_pool.release(self.tracker)
+        self.tracker = None
@@ -0,0 +1,234 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..models.analysis_models import AnalysisProgress, AnalysisStatus
+
+# حالات المهمة النهائية في الطابور
+FINAL_STATUSES = (
+    AnalysisStatus.COMPLETED.value,
+    AnalysisStatus.FAILED.value,
+    AnalysisStatus.CANCELLED.value
+)
+
+
+class ProgressSubscription:
+    """اشتراك اتصال بث واحد في تحليلات محددة
+
+    يحتفظ بآخر تحديث فقط لكل تحليل، فالمستهلك البطيء لا يراكم تحديثات
+    ولا يؤخر المحلل.
+    """
+
+    def __init__(self, analysis_ids: Iterable[str]):
+        self.analysis_ids = set(analysis_ids)
+        self._latest: Dict[str, AnalysisProgress] = {}
+        self._finished: Dict[str, Dict[str, Any]] = {}
+        self._provisional: Dict[str, Dict[str, Any]] = {}
+        self._event = asyncio.Event()
+
+    def _push(self, progress: AnalysisProgress):
+        self._latest[progress.analysis_id] = progress
+        self._event.set()
+
+    def _finish(self, job: Dict[str, Any]):
+        self._finished[job['analysis_id']] = job
+        self._event.set()
+
+    def _provisional_result(self, analysis_id: str, data: Dict[str, Any]):
+        self._provisional[analysis_id] = data
+        self._event.set()
+
+    async def next(self, timeout: float) -> Tuple[
+            Dict[str, AnalysisProgress], Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """انتظار التحديثات حتى timeout ثانية؛ يُرجع (التقدم، المهام المنتهية، النتائج الأولية)"""
+        if not self._latest and not self._finished and not self._provisional:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+        self._event.clear()
+        latest, self._latest = self._latest, {}
+        finished, self._finished = self._finished, {}
+        provisional, self._provisional = self._provisional, {}
+        return latest, finished, provisional
+
+
+class ProgressBroker:
+    """توزيع تحديثات التقدم داخل العملية على اتصالات البث (SSE)
+
+    المحلل ينشر كل تحديث، والعامل ينشر انتهاء المهمة بعد حفظ نتيجتها.
+    يُستدعى من حلقة الأحداث فقط.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[ProgressSubscription]] = defaultdict(set)
+
+    def subscribe(self, analysis_ids: Iterable[str]) -> ProgressSubscription:
+        subscription = ProgressSubscription(analysis_ids)
+        for analysis_id in subscription.analysis_ids:
+            self._subscriptions[analysis_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription):
+        for analysis_id in subscription.analysis_ids:
+            subscribers = self._subscriptions.get(analysis_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[analysis_id]
+
+    def publish(self, progress: AnalysisProgress):
+        """نشر تحديث تقدم"""
+        for subscription in self._subscriptions.get(progress.analysis_id, ()):
+            subscription._push(progress)
+
+    def finish(self, job: Dict[str, Any]):
+        """نشر انتهاء مهمة (اكتمال أو فشل أو إلغاء) بعد تسجيلها في الطابور"""
+        for subscription in self._subscriptions.get(job['analysis_id'], ()):
+            subscription._finish(job)
+
+    def provisional(self, analysis_id: str, data: Dict[str, Any]):
+        """نشر حفظ نتيجة أولية (ملخصها في data) قبل اكتمال التحليل"""
+        for subscription in self._subscriptions.get(analysis_id, ()):
+            subscription._provisional_result(analysis_id, data)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({subscription for subs in self._subscriptions.values() for subscription in subs})
+
+
+class ProgressThrottle:
+    """إرسال التغييرات المهمة فقط: تغيّر الحالة، أو تقدم بمقدار min_delta
+    بعد min_interval ثانية على الأقل من آخر إرسال للتحليل نفسه"""
+
+    def __init__(self, min_delta: float = 0.01, min_interval: float = 0.5):
+        self.min_delta = min_delta
+        self.min_interval = min_interval
+        self._sent: Dict[str, Tuple[AnalysisProgress, float]] = {}
+
+    def allow(self, progress: AnalysisProgress, now: float) -> bool:
+        previous = self._sent.get(progress.analysis_id)
+        if previous is None:
+            return True
+        sent, sent_at = previous
+        if progress.status != sent.status:
+            return True
+        return (
+            abs(progress.progress - sent.progress) >= self.min_delta
+            and now - sent_at >= self.min_interval
+        )
+
+    def sent(self, progress: AnalysisProgress, now: float):
+        self._sent[progress.analysis_id] = (progress, now)
+
+    def next_allowed(self, analysis_id: str) -> float:
+        previous = self._sent.get(analysis_id)
+        return previous[1] + self.min_interval if previous else 0.0
+
+
+async def stream_progress(
+    analysis_ids: List[str],
+    broker: ProgressBroker,
+    fetch_jobs: Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]],
+    local_progress: Callable[[str], Optional[AnalysisProgress]],
+    job_progress: Callable[[Dict[str, Any]], AnalysisProgress],
+    throttle: ProgressThrottle,
+    poll_interval: float = 2.0,
+    keepalive: float = 15.0
+) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+    """أحداث (progress/provisional/result/error/keepalive) لعدة تحليلات حتى انتهائها جميعاً
+
+    تحديثات هذه العملية تصل فوراً عبر broker، وتحليلات عمليات أو عقد أخرى
+    تُقرأ من الطابور كل poll_interval ثانية بقراءة واحدة لجميع المعرفات.
+    """
+    subscription = broker.subscribe(analysis_ids)
+    remaining: Set[str] = set()
+    held: Dict[str, AnalysisProgress] = {}
+    last_yield = time.monotonic()
+
+    def result_event(job: Dict[str, Any]) -> Dict[str, Any]:
+        completed = job['status'] == AnalysisStatus.COMPLETED.value
+        return {
+            "analysis_id": job['analysis_id'],
+            "status": job['status'],
+            "result_id": job['analysis_id'] if completed else None,
+            "result_url": f"/api/v1/results/{job['analysis_id']}" if completed else None,
+            "error": job.get('error_message')
+        }
+
+    try:
+        # الحالة الحالية لكل تحليل عند الاتصال
+        jobs = await fetch_jobs(analysis_ids)
+        now = time.monotonic()
+        for analysis_id in analysis_ids:
+            job = jobs.get(analysis_id)
+            progress = local_progress(analysis_id)
+            if job is None and progress is None:
+                yield "error", {"analysis_id": analysis_id, "detail": "التحليل غير موجود"}
+                continue
+            if job is not None and (progress is None or job['status'] != AnalysisStatus.PROCESSING.value):
+                progress = job_progress(job)
+            yield "progress", progress.dict()
+            throttle.sent(progress, now)
+            if job is not None and job['status'] in FINAL_STATUSES:
+                yield "result", result_event(job)
+            else:
+                remaining.add(analysis_id)
+        last_poll = last_yield = time.monotonic()
+
+        while remaining:
+            now = time.monotonic()
+            wake_at = min(
+                [last_poll + poll_interval, last_yield + keepalive]
+                + [throttle.next_allowed(analysis_id) for analysis_id in held]
+            )
+            updates, finished, provisional = await subscription.next(wake_at - now)
+            held.update({k: v for k, v in updates.items() if k in remaining})
+
+            for analysis_id, data in provisional.items():
+                if analysis_id in remaining:
+                    yield "provisional", {
+                        "analysis_id": analysis_id,
+                        "result_url": f"/api/v1/results/{analysis_id}/provisional",
+                        "data": data
+                    }
+                    last_yield = time.monotonic()
+
+            now = time.monotonic()
+            if now - last_poll >= poll_interval:
+                polled = await fetch_jobs(sorted(remaining))
+                last_poll = now = time.monotonic()
+                for analysis_id, job in polled.items():
+                    if job is None:
+                        continue
+                    if job['status'] in FINAL_STATUSES:
+                        finished.setdefault(analysis_id, job)
+                    elif analysis_id not in held and local_progress(analysis_id) is None:
+                        # تحليل يعمل في عملية أخرى
+                        held[analysis_id] = job_progress(job)
+
+            for analysis_id, job in finished.items():
+                if analysis_id not in remaining:
+                    continue
+                held.pop(analysis_id, None)
+                remaining.discard(analysis_id)
+                yield "progress", job_progress(job).dict()
+                yield "result", result_event(job)
+                last_yield = time.monotonic()
+
+            for analysis_id, progress in list(held.items()):
+                if throttle.allow(progress, now):
+                    del held[analysis_id]
+                    throttle.sent(progress, now)
+                    yield "progress", progress.dict()
+                    last_yield = time.monotonic()
+                elif now >= throttle.next_allowed(analysis_id):
+                    # تغيير أصغر من min_delta لا يستحق الإرسال
+                    del held[analysis_id]
+
+            if remaining and time.monotonic() - last_yield >= keepalive:
+                yield "keepalive", None
+                last_yield = time.monotonic()
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,81 @@
+import math
+import time
+from typing import Callable, Optional
+
+
+class StageProgress:
+    """تقدم مرحلة تعالج عدداً معروفاً من الإطارات مع تقدير الوقت المتبقي
+
+    يحوّل عدد الإطارات المعالجة إلى نسبة ضمن [start, end] من تقدم التحليل،
+    ويقدّر الوقت المتبقي من معدل إطارات منعّم بمتوسط أسي (عينة كل
+    sample_interval ثانية على الأقل فلا يتأثر بإطار بطيء واحد). due يحدّ
+    النشر بالزمن والتغير بدلاً من تحديث لكل إطار.
+    """
+
+    def __init__(self, start: float, end: float, total: int, done: int = 0,
+                 min_delta: float = 0.01, min_interval: float = 1.0, max_interval: float = 5.0,
+                 smoothing: float = 0.3, sample_interval: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.start = start
+        self.end = end
+        self.total = total
+        self.done = done
+        self.min_delta = min_delta
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.smoothing = smoothing
+        self.sample_interval = sample_interval
+        self._clock = clock
+
+        self._rate: Optional[float] = None
+        self._sample_done = done
+        self._sample_time = clock()
+        self._published_progress: Optional[float] = None
+        self._published_at = 0.0
+
+    def advance(self, done: int):
+        """تسجيل عدد الإطارات المعالجة حتى الآن"""
+        self.done = done
+        now = self._clock()
+        elapsed = now - self._sample_time
+        if elapsed >= self.sample_interval:
+            rate = (done - self._sample_done) / elapsed
+            self._rate = rate if self._rate is None else (
+                self.smoothing * rate + (1 - self.smoothing) * self._rate
+            )
+            self._sample_done, self._sample_time = done, now
+
+    @property
+    def progress(self) -> float:
+        if self.total <= 0:
+            return self.start
+        return self.start + (self.end - self.start) * min(1.0, self.done / self.total)
+
+    @property
+    def fps(self) -> Optional[float]:
+        """معدل الإطارات المنعّم"""
+        return self._rate
+
+    def eta(self, deadline: Optional[float] = None) -> Optional[int]:
+        """الثواني المتبقية لإنهاء المرحلة (لا تتجاوز الموعد النهائي)؛ None قبل أول عينة"""
+        if not self._rate or self._rate <= 0 or self.total <= 0:
+            return None
+        remaining = max(0, self.total - self.done) / self._rate
+        if deadline is not None:
+            remaining = min(remaining, max(0.0, deadline - self._clock()))
+        return int(math.ceil(remaining))
+
+    def due(self) -> bool:
+        """هل يُنشر التقدم الآن؟ بعد min_interval إن تغير بـ min_delta، أو بعد
+        max_interval لأي تغيير (لتحديث الوقت المتبقي في الفيديو الطويل)"""
+        progress = self.progress
+        now = self._clock()
+        if self._published_progress is not None:
+            elapsed = now - self._published_at
+            change = progress - self._published_progress
+            if not ((elapsed >= self.min_interval and change >= self.min_delta)
+                    or (elapsed >= self.max_interval and change > 0)):
+                return False
+        self._published_progress = progress
+        self._published_at = now
+        return True
@@ -0,0 +1,482 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# يتم استيرادها عند التوفر
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    logging.warning("redis غير متوفر - طابور Redis معطل")
+
+from ..models.analysis_models import AnalysisResult, AnalysisStatus
+from .admission import AdmissionRejected, probe_media
+from .job_queue import JobQueue
+from .scheduling import normalize_priority, schedule_key
+
+logger = logging.getLogger(__name__)
+
+# وقت خادم Redis مشترك بين جميع العقد فلا يؤثر اختلاف ساعاتها على مهلة الرؤية
+_NOW = """
+local function now()
+    local t = redis.call('TIME')
+    return tonumber(t[1]) + tonumber(t[2]) / 1000000
+end
+"""
+
+# KEYS: job, pending | ARGV: id, max_queued, schedule_key, ttl, field/value...
+_ENQUEUE = _NOW + """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status == 'pending' or status == 'processing' then
+    return 1
+end
+if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HDEL', KEYS[1], 'worker_id', 'error_message', 'started_at', 'completed_at', 'heartbeat_at')
+for i = 5, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', KEYS[1], 'status', 'pending', 'progress', 0, 'attempts', 0,
+           'created_at', now(), 'schedule_key', ARGV[3])
+redis.call('PERSIST', KEYS[1])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return 2
+"""
+
+# KEYS: pending, processing | ARGV: job_prefix, worker_id, visibility, memory_budget,
+# scan_limit, priorities (مفصولة بفواصل)، type/limit...
+_CLAIM = _NOW + """
+local running, memory = {}, 0
+for _, id in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    local job = redis.call('HMGET', ARGV[1] .. id, 'file_type', 'estimated_memory_mb')
+    if job[1] then
+        running[job[1]] = (running[job[1]] or 0) + 1
+    end
+    memory = memory + (tonumber(job[2]) or 0)
+end
+
+local limits = {}
+for i = 7, #ARGV, 2 do
+    limits[ARGV[i]] = tonumber(ARGV[i + 1])
+end
+local allowed = nil
+if ARGV[6] ~= '' then
+    allowed = {}
+    for priority in string.gmatch(ARGV[6], '[^,]+') do
+        allowed[priority] = true
+    end
+end
+local budget = tonumber(ARGV[4])
+
+for _, id in ipairs(redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[5]) - 1)) do
+    local key = ARGV[1] .. id
+    local job = redis.call('HMGET', key, 'file_type', 'estimated_memory_mb', 'priority')
+    if not job[1] then
+        -- انتهت صلاحية سجل المهمة
+        redis.call('ZREM', KEYS[1], id)
+    else
+        local estimate = tonumber(job[2]) or 0
+        -- تحليل واحد أكبر من الميزانية يُقبل عندما لا يعمل غيره
+        if (running[job[1]] or 0) < (limits[job[1]] or 1)
+                and (allowed == nil or allowed[job[3]])
+                and (memory == 0 or memory + estimate <= budget) then
+            local t = now()
+            redis.call('ZREM', KEYS[1], id)
+            redis.call('ZADD', KEYS[2], t + tonumber(ARGV[3]), id)
+            redis.call('HSET', key, 'status', 'processing', 'worker_id', ARGV[2],
+                       'started_at', t, 'heartbeat_at', t)
+            redis.call('HDEL', key, 'progress_message', 'progress_eta')
+            redis.call('HINCRBY', key, 'attempts', 1)
+            return id
+        end
+    end
+end
+return false
+"""
+
+# KEYS: processing | ARGV: job_prefix, worker_id, visibility, id/progress...
+_HEARTBEAT = _NOW + """
+local t = now()
+local cancelled = {}
+for i = 4, #ARGV, 2 do
+    local id = ARGV[i]
+    local key = ARGV[1] .. id
+    local job = redis.call('HMGET', key, 'status', 'worker_id')
+    if job[1] == 'processing' and job[2] == ARGV[2] then
+        redis.call('HSET', key, 'heartbeat_at', t, 'progress', ARGV[i + 1])
+        redis.call('ZADD', KEYS[1], 'XX', t + tonumber(ARGV[3]), id)
+    elseif job[1] == 'cancelled' then
+        table.insert(cancelled, id)
+    end
+end
+return cancelled
+"""
+
+# ARGV: job_prefix, worker_id, id/progress/message/eta...
+_PROGRESS = """
+local updated = 0
+for i = 3, #ARGV, 4 do
+    local key = ARGV[1] .. ARGV[i]
+    local job = redis.call('HMGET', key, 'status', 'worker_id')
+    if job[1] == 'processing' and job[2] == ARGV[2] then
+        redis.call('HSET', key, 'progress', ARGV[i + 1], 'progress_message', ARGV[i + 2])
+        if ARGV[i + 3] == '' then
+            redis.call('HDEL', key, 'progress_eta')
+        else
+            redis.call('HSET', key, 'progress_eta', ARGV[i + 3])
+        end
+        updated = updated + 1
+    end
+end
+return updated
+"""
+
+# KEYS: job, pending, processing | ARGV: id, ttl
+_CANCEL = _NOW + """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status ~= 'uploaded' and status ~= 'pending' and status ~= 'processing' then
+    return false
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('HSET', KEYS[1], 'status', 'cancelled', 'completed_at', now())
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return status
+"""
+
+# KEYS: job, processing | ARGV: id, ttl, status, field/value...
+_FINISH = _NOW + """
+if redis.call('HGET', KEYS[1], 'status') ~= 'processing' then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+for i = 4, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[3], 'completed_at', now())
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS: pending, processing | ARGV: job_prefix, max_attempts, ttl, error_message
+_REQUEUE_STALE = _NOW + """
+local t = now()
+local requeued, failed = 0, 0
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', t)) do
+    local key = ARGV[1] .. id
+    local job = redis.call('HMGET', key, 'status', 'attempts', 'schedule_key')
+    redis.call('ZREM', KEYS[2], id)
+    if job[1] == 'processing' then
+        if (tonumber(job[2]) or 0) >= tonumber(ARGV[2]) then
+            redis.call('HSET', key, 'status', 'failed', 'completed_at', t, 'error_message', ARGV[4])
+            redis.call('EXPIRE', key, ARGV[3])
+            failed = failed + 1
+        else
+            redis.call('HSET', key, 'status', 'pending')
+            redis.call('HDEL', key, 'worker_id')
+            redis.call('ZADD', KEYS[1], job[3], id)
+            requeued = requeued + 1
+        end
+    end
+end
+return {requeued, failed}
+"""
+
+# KEYS: pending, processing | ARGV: job_prefix, worker_id, id...
+_RELEASE = """
+local released = 0
+for i = 3, #ARGV do
+    local id = ARGV[i]
+    local key = ARGV[1] .. id
+    local job = redis.call('HMGET', key, 'status', 'worker_id', 'schedule_key', 'attempts')
+    if job[1] == 'processing' and job[2] == ARGV[2] then
+        redis.call('ZREM', KEYS[2], id)
+        redis.call('ZADD', KEYS[1], job[3], id)
+        redis.call('HSET', key, 'status', 'pending', 'attempts', math.max((tonumber(job[4]) or 1) - 1, 0))
+        redis.call('HDEL', key, 'worker_id')
+        released = released + 1
+    end
+end
+return released
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """طابور تحليلات على خادم Redis مشترك بين عدة عقد
+
+    - كل مهمة hash في {prefix}:job:{id}، والمهام المنتظرة في مجموعة مرتبة
+      {prefix}:pending حسب schedule_key (الأقصر أولاً ضمن فئة الأولوية).
+    - الحجز سكربت Lua ذري ينقل المهمة إلى {prefix}:processing بدرجة تساوي
+      نهاية مهلة الرؤية (stale_timeout)، بعد فحص حدود التزامن لكل نوع
+      وميزانية الذاكرة عبر جميع العقد. النبض يمدد المهلة، والمهام التي
+      انتهت مهلتها تعود إلى pending حتى max_attempts محاولات.
+    - المهام المنتهية تبقى result_ttl ثانية ثم تُحذف.
+
+    يعمل مع أي خادم يدعم بروتوكول Redis وسكربتات Lua (أو fakeredis للاختبار).
+    """
+
+    def __init__(self, client, prefix: str = "sperm-analyzer", result_ttl: int = 7 * 24 * 3600,
+                 stale_timeout: int = 120, max_attempts: int = 3,
+                 type_limits: Optional[Dict[str, int]] = None, max_queued: int = 100,
+                 memory_budget_mb: float = 3072, retry_after: int = 30,
+                 aging_rate: float = 1.0, class_seconds: float = 60.0, detect_interval: int = 1,
+                 scan_limit: int = 100):
+        self.client = client
+        self.prefix = prefix
+        self.result_ttl = result_ttl
+        self.stale_timeout = stale_timeout
+        self.max_attempts = max_attempts
+        self.type_limits = type_limits or {'video': 2, 'image': 4}
+        self.max_queued = max_queued
+        self.memory_budget_mb = memory_budget_mb
+        self.retry_after = retry_after
+        self.aging_rate = aging_rate
+        self.class_seconds = class_seconds
+        self.detect_interval = detect_interval
+        self.scan_limit = scan_limit
+
+        self._job_prefix = f"{prefix}:job:"
+        self._pending_key = f"{prefix}:pending"
+        self._processing_key = f"{prefix}:processing"
+
+        self._enqueue = client.register_script(_ENQUEUE)
+        self._claim = client.register_script(_CLAIM)
+        self._heartbeat = client.register_script(_HEARTBEAT)
+        self._progress = client.register_script(_PROGRESS)
+        self._cancel = client.register_script(_CANCEL)
+        self._finish = client.register_script(_FINISH)
+        self._requeue_stale = client.register_script(_REQUEUE_STALE)
+        self._release = client.register_script(_RELEASE)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisJobQueue":
+        """إنشاء الطابور من REDIS_URL"""
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("QUEUE_BACKEND=redis يتطلب تثبيت حزمة redis")
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _job_key(self, analysis_id: str) -> str:
+        return f"{self._job_prefix}{analysis_id}"
+
+    def register_upload(self, analysis_id: str, file_path: str,
+                        media: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """تسجيل ملف مرفوع مع خصائصه وكلفته المقدرة قبل إرساله للتحليل"""
+        file_type = self._file_type(file_path)
+        if not media or not media.get('width'):
+            media = probe_media(file_path, file_type)
+
+        fields = self._media_fields(file_path, file_type, media)
+        fields.update(status=AnalysisStatus.UPLOADED.value, progress=0.0)
+        key = self._job_key(analysis_id)
+        with self.client.pipeline() as pipe:
+            pipe.hset(key, mapping=self._encode(fields))
+            # الملفات التي لا تُرسل للتحليل لا تبقى في Redis
+            pipe.expire(key, self.result_ttl)
+            pipe.execute()
+        return self.get(analysis_id)
+
+    def enqueue(self, analysis_id: str, file_path: str,
+                priority: Optional[str] = None) -> Dict[str, Any]:
+        """إدراج تحليل في الطابور (أو إرجاع حالته إن كان مدرجاً أو جارياً)
+
+        يرفع AdmissionRejected عند امتلاء طابور الانتظار.
+        """
+        file_type = self._file_type(file_path)
+        key = self._job_key(analysis_id)
+        status, stored_cost = self.client.hmget(key, 'status', 'estimated_cost')
+        if status in (AnalysisStatus.PENDING.value, AnalysisStatus.PROCESSING.value):
+            return self.get(analysis_id)
+
+        # الخصائص المسجلة عند الرفع تغني عن فتح الملف مجدداً
+        fields: Dict[str, Any] = {}
+        if stored_cost is None:
+            fields = self._media_fields(file_path, file_type, probe_media(file_path, file_type))
+            cost = fields['estimated_cost']
+        else:
+            cost = float(stored_cost)
+
+        fields['priority'] = normalize_priority(priority, file_type)
+        key_score = schedule_key(
+            fields['priority'], cost, datetime.now(), self.aging_rate, self.class_seconds
+        )
+        args = [analysis_id, self.max_queued, key_score, self.result_ttl]
+        for field, value in self._encode(fields).items():
+            args += [field, value]
+
+        if not self._enqueue(keys=[key, self._pending_key], args=args):
+            raise AdmissionRejected("طابور التحليل ممتلئ", self.retry_after)
+        return self.get(analysis_id)
+
+    def claim(self, worker_id: str, priorities: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """حجز المهمة ذات أصغر schedule_key التي تسمح بها حدود التزامن والذاكرة
+
+        priorities: حصر الحجز في فئات معينة (خانات الطلبات التفاعلية).
+        """
+        args = [
+            self._job_prefix, worker_id, self.stale_timeout, self.memory_budget_mb,
+            self.scan_limit, ",".join(priorities or [])
+        ]
+        for file_type, limit in self.type_limits.items():
+            args += [file_type, limit]
+
+        analysis_id = self._claim(keys=[self._pending_key, self._processing_key], args=args)
+        return self.get(analysis_id) if analysis_id else None
+
+    def heartbeat(self, worker_id: str, progress: Dict[str, float]) -> List[str]:
+        """تمديد مهلة رؤية المهام التي يحملها العامل وتحديث تقدمها
+
+        يُرجع المهام التي أُلغيت من عقدة أخرى ليوقفها العامل.
+        """
+        if not progress:
+            return []
+        args = [self._job_prefix, worker_id, self.stale_timeout]
+        for analysis_id, value in progress.items():
+            args += [analysis_id, value]
+        return list(self._heartbeat(keys=[self._processing_key], args=args))
+
+    def publish_progress(self, worker_id: str, updates: Dict[str, Dict[str, Any]]) -> int:
+        """كتابة تقدم عدة مهام باستدعاء سكربت واحد (رحلة واحدة إلى Redis)"""
+        if not updates:
+            return 0
+        args = [self._job_prefix, worker_id]
+        for analysis_id, state in updates.items():
+            eta = state.get('estimated_time_remaining')
+            args += [analysis_id, state['progress'], state.get('message') or '', '' if eta is None else eta]
+        return int(self._progress(args=args))
+
+    def cancel(self, analysis_id: str) -> Optional[str]:
+        """إلغاء مهمة مرفوعة أو منتظرة أو جارية؛ يُرجع حالتها السابقة"""
+        previous = self._cancel(
+            keys=[self._job_key(analysis_id), self._pending_key, self._processing_key],
+            args=[analysis_id, self.result_ttl]
+        )
+        return previous or None
+
+    def complete(self, analysis_id: str, result: AnalysisResult) -> bool:
+        """تسجيل اكتمال المهمة مع ملخص النتائج؛ False إن أُلغيت قبل الاكتمال"""
+        metadata = result.metadata
+        summary = {
+            "sperm_count": result.sperm_count,
+            "concentration": result.concentration,
+            "motility": result.motility,
+            "casa_parameters": result.casa_parameters.dict(),
+            "sample_quality": result.get_quality().value,
+            "partial": metadata.partial if metadata else False,
+            "frames_processed": metadata.frames_processed if metadata else None
+        }
+        return self._finish_job(analysis_id, AnalysisStatus.COMPLETED.value, {
+            "progress": 1.0,
+            "summary": json.dumps(summary, default=str)
+        })
+
+    def fail(self, analysis_id: str, error: str):
+        """تسجيل فشل المهمة (أخطاء التحليل لا يُعاد تنفيذها)"""
+        self._finish_job(analysis_id, AnalysisStatus.FAILED.value, {"error_message": error})
+
+    def _finish_job(self, analysis_id: str, status: str, fields: Dict[str, Any]) -> bool:
+        args = [analysis_id, self.result_ttl, status]
+        for field, value in self._encode(fields).items():
+            args += [field, value]
+        return bool(self._finish(keys=[self._job_key(analysis_id), self._processing_key], args=args))
+
+    def requeue_stale(self) -> int:
+        """إعادة المهام التي انتهت مهلة رؤيتها إلى الطابور، أو إفشالها بعد max_attempts"""
+        requeued, failed = self._requeue_stale(
+            keys=[self._pending_key, self._processing_key],
+            args=[self._job_prefix, self.max_attempts, self.result_ttl, "تجاوز عدد المحاولات المسموح"]
+        )
+        if failed or requeued:
+            logger.warning(f"مهام متوقفة: أعيد {requeued} وفشل {failed}")
+        return int(requeued)
+
+    def release(self, analysis_ids: List[str], worker_id: str) -> int:
+        """إعادة مهام أوقفها إيقاف العامل إلى الطابور دون احتساب محاولة"""
+        if not analysis_ids:
+            return 0
+        return int(self._release(
+            keys=[self._pending_key, self._processing_key],
+            args=[self._job_prefix, worker_id, *analysis_ids]
+        ))
+
+    def resumable_ids(self) -> List[str]:
+        """المهام التي قد تُستأنف (منتظرة أو جارية)"""
+        with self.client.pipeline() as pipe:
+            pipe.zrange(self._pending_key, 0, -1)
+            pipe.zrange(self._processing_key, 0, -1)
+            pending, processing = pipe.execute()
+        return pending + processing
+
+    def set_webhook(self, analysis_id: str, webhook_url: Optional[str]) -> Optional[Dict[str, Any]]:
+        """تسجيل رابط إشعار انتهاء التحليل؛ None إن لم توجد المهمة"""
+        key = self._job_key(analysis_id)
+        if not self.client.exists(key):
+            return None
+        if webhook_url:
+            self.client.hset(key, 'webhook_url', webhook_url)
+        else:
+            self.client.hdel(key, 'webhook_url')
+        return self.get(analysis_id)
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """حالة مهمة واحدة"""
+        job = self.client.hgetall(self._job_key(analysis_id))
+        return self._to_job(analysis_id, job) if job else None
+
+    def get_many(self, analysis_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """حالة عدة مهام في رحلة واحدة إلى Redis (pipeline)"""
+        if not analysis_ids:
+            return {}
+        with self.client.pipeline(transaction=False) as pipe:
+            for analysis_id in analysis_ids:
+                pipe.hgetall(self._job_key(analysis_id))
+            jobs = pipe.execute()
+        return {
+            analysis_id: self._to_job(analysis_id, job)
+            for analysis_id, job in zip(analysis_ids, jobs) if job
+        }
+
+    def counts(self) -> Dict[str, int]:
+        """عدد المهام المنتظرة والجارية (المنتهية تُحذف بعد result_ttl)"""
+        with self.client.pipeline() as pipe:
+            pipe.zcard(self._pending_key)
+            pipe.zcard(self._processing_key)
+            pending, processing = pipe.execute()
+        return {
+            AnalysisStatus.PENDING.value: pending,
+            AnalysisStatus.PROCESSING.value: processing
+        }
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, Any]:
+        """قيم hash نصية أو رقمية (الحقول الفارغة لا تُخزن)"""
+        return {field: value for field, value in fields.items() if value is not None}
+
+    @staticmethod
+    def _to_job(analysis_id: str, job: Dict[str, str]) -> Dict[str, Any]:
+        def _time(field: str) -> Optional[datetime]:
+            value = job.get(field)
+            return datetime.fromtimestamp(float(value)) if value else None
+
+        def _float(field: str) -> Optional[float]:
+            value = job.get(field)
+            return float(value) if value else None
+
+        return {
+            "analysis_id": analysis_id,
+            "file_path": job.get('file_path'),
+            "status": job.get('status'),
+            "priority": job.get('priority'),
+            "estimated_cost": _float('estimated_cost'),
+            "progress": _float('progress') or 0.0,
+            "progress_message": job.get('progress_message') or None,
+            "estimated_time_remaining": int(job['progress_eta']) if job.get('progress_eta') else None,
+            "attempts": int(job.get('attempts') or 0),
+            "error_message": job.get('error_message'),
+            "webhook_url": job.get('webhook_url'),
+            "created_at": _time('created_at'),
+            "started_at": _time('started_at'),
+            "completed_at": _time('completed_at')
+        }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ..models.analysis_models import AnalysisResult
+from ..utils.cache import TTLCache
+from ..utils.http_cache import IDENTITY, compress
+
+
+class CachedResult:
+    """ملف نتيجة محلل مع بصمة محتواه والتمثيلات المرمزة المبنية منه"""
+
+    __slots__ = ("signature", "digest", "data", "result", "bodies")
+
+    def __init__(self, signature: Tuple[int, int, int], raw: bytes):
+        self.signature = signature
+        self.digest = hashlib.sha256(raw).hexdigest()[:32]
+        self.data: Dict[str, Any] = json.loads(raw)
+        self.result: Optional[AnalysisResult] = None
+        # (view, encoding) -> محتوى الاستجابة
+        self.bodies: Dict[Tuple[str, str], bytes] = {}
+
+    def model(self) -> AnalysisResult:
+        """نموذج AnalysisResult (يُبنى عند أول طلب فقط)"""
+        if self.result is None:
+            data = self.data
+            # تحويل التاريخ من string إلى datetime إذا لزم الأمر
+            if isinstance(data.get('analysis_date'), str):
+                data = dict(data, analysis_date=datetime.fromisoformat(
+                    data['analysis_date'].replace('Z', '+00:00')
+                ))
+            self.result = AnalysisResult(**data)
+        return self.result
+
+    def version(self, view: str) -> str:
+        """إصدار التمثيل: بصمة المحتوى مع اسم العرض (النتيجة، الملخص، صيغة التصدير)"""
+        return f"{self.digest}-{view}"
+
+
+class ResultCache:
+    """ذاكرة مؤقتة لملفات النتائج المحللة مشتركة بين مسارات النتائج
+
+    المفتاح مسار الملف، والعنصر صالح ما دام توقيع الملف (mtime وحجمه
+    ورقم inode) لم يتغير؛ الكتابة الذرية للعامل (os.replace) تغيّر التوقيع
+    فتُقرأ النتيجة الجديدة تلقائياً، فيكفي stat واحد بدل قراءة الملف
+    وتحليله في كل طلب. نموذج AnalysisResult يُبنى عند أول طلب له فقط.
+
+    التمثيلات المرمزة (JSON والمضغوطة بـ gzip/br) تُحفظ مع العنصر فتُبطل
+    معه، ولا يُعاد الترميز أو الضغط لكل طلب.
+
+    القيم المُرجعة مشتركة بين الطلبات فلا يجوز تعديلها. الاستدعاء آمن من
+    عدة خيوط (المسارات تستدعيه عبر asyncio.to_thread)؛ بناء التمثيل نفسه في
+    خيطين معاً ينتج المحتوى ذاته فيُحفظ أحدهما.
+    """
+
+    def __init__(self, max_size: int = 64, ttl: float = 3600.0):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def _signature(result_path: str) -> Tuple[int, int, int]:
+        stat = os.stat(result_path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def entry(self, result_path: str) -> CachedResult:
+        """عنصر الملف الحالي (يُعاد تحميله إن تغير الملف)"""
+        signature = self._signature(result_path)
+        entry = self._cache.get(result_path)
+        if entry is None or entry.signature != signature:
+            with open(result_path, "rb") as f:
+                entry = CachedResult(signature, f.read())
+            self._cache.set(result_path, entry)
+        return entry
+
+    def load(self, result_path: str) -> Dict[str, Any]:
+        """بيانات ملف النتيجة كما حُفظت (للقراءة فقط)"""
+        return self.entry(result_path).data
+
+    def load_result(self, result_path: str) -> AnalysisResult:
+        """نموذج AnalysisResult من ملف النتيجة"""
+        return self.entry(result_path).model()
+
+    def representation(self, result_path: str, view: str, encoding: str,
+                       build: Callable[[CachedResult], bytes], min_size: int = 1024,
+                       gzip_level: int = 6, brotli_quality: int = 5) -> Tuple[str, str, bytes]:
+        """تمثيل العرض view بالترميز المطلوب: (الإصدار، الترميز الفعلي، المحتوى)
+
+        build يبني المحتوى غير المضغوط من العنصر مرة واحدة لكل إصدار، والمحتوى
+        الأصغر من min_size يُرسل دون ضغط.
+        """
+        entry = self.entry(result_path)
+        body = entry.bodies.get((view, IDENTITY))
+        if body is None:
+            body = entry.bodies[(view, IDENTITY)] = build(entry)
+
+        if encoding != IDENTITY and len(body) >= min_size:
+            compressed = entry.bodies.get((view, encoding))
+            if compressed is None:
+                compressed = entry.bodies[(view, encoding)] = compress(
+                    body, encoding, gzip_level, brotli_quality
+                )
+            return entry.version(view), encoding, compressed
+        return entry.version(view), IDENTITY, body
+
+    def invalidate(self, result_path: str):
+        self._cache.pop(result_path)
+
+    def purge_expired(self) -> int:
+        return self._cache.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
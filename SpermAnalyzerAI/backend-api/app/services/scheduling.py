@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# فئات الأولوية (الأصغر أولاً): طلبات التطبيق التفاعلية، التحليلات العادية، الدفعات
+PRIORITY_CLASSES = {
+    'interactive': 0,
+    'standard': 1,
+    'batch': 2
+}
+
+# تقدير زمن التحليل بالثواني
+IMAGE_BASE_COST = 0.5               # صورة بدقة مرجعية
+VIDEO_BASE_COST = 1.0               # فتح الفيديو والتهيئة
+FRAME_COST = 0.05                   # كشف وتتبع إطار بدقة مرجعية
+REFERENCE_PIXELS = 640 * 480
+
+
+def default_priority(file_type: str) -> str:
+    """الصور من التطبيق تفاعلية افتراضياً، والفيديو عادي"""
+    return 'interactive' if file_type == 'image' else 'standard'
+
+
+def estimate_analysis_cost(file_type: str, media: Dict[str, Any], detect_interval: int = 1) -> float:
+    """تقدير زمن التحليل من النوع وعدد الإطارات ومعدلها والدقة"""
+    width = media.get('width') or 0
+    height = media.get('height') or 0
+    resolution_factor = max(1.0, (width * height) / REFERENCE_PIXELS)
+
+    if file_type != 'video':
+        return IMAGE_BASE_COST * resolution_factor
+
+    frame_count = media.get('frame_count') or 0
+    if frame_count <= 0 and media.get('duration') and media.get('fps'):
+        frame_count = int(media['duration'] * media['fps'])
+
+    # الكاشف يعمل على الإطارات المفتاحية فقط عند تفعيل التدفق البصري
+    detected_frames = frame_count / max(1, detect_interval)
+    return VIDEO_BASE_COST + detected_frames * FRAME_COST * resolution_factor
+
+
+def schedule_key(priority: str, estimated_cost: float, enqueued_at: datetime,
+                 aging_rate: float, class_seconds: float) -> float:
+    """مفتاح الترتيب: الأقصر أولاً ضمن فئة الأولوية مع التقادم
+
+    الأولوية الفعلية = إزاحة الفئة + الكلفة - aging_rate × مدة الانتظار.
+    مدة الانتظار = الآن - وقت الإدراج، والآن ثابت لجميع المهام عند الحجز،
+    فالترتيب يساوي الترتيب حسب (إزاحة الفئة + الكلفة + aging_rate × وقت الإدراج)،
+    وهو ثابت لكل مهمة فيُحسب مرة واحدة ويُفهرس.
+    """
+    class_offset = PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES['standard']) * class_seconds
+    return class_offset + estimated_cost + aging_rate * enqueued_at.timestamp()
+
+
+def normalize_priority(priority: Optional[str], file_type: str) -> str:
+    """التحقق من فئة الأولوية المطلوبة
+
+    الفئة التفاعلية للصور فقط: خانات العامل المحجوزة لها تبقي زمن استجابة
+    الصور منخفضاً، فالفيديو المرسل كتفاعلي يُخفض إلى standard.
+    """
+    if priority == 'interactive' and file_type != 'image':
+        return 'standard'
+    if priority in PRIORITY_CLASSES:
+        return priority
+    return default_priority(file_type)
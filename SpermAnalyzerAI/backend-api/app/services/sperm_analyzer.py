@@ -3,7 +3,9 @@ import numpy as np
 import asyncio
 import logging
 import os
-from typing import List, Tuple, Dict, Any, Optional
+import threading
+import time
+from typing import List, Tuple, Dict, Any, Optional, Callable, Awaitable
 from datetime import datetime
 from pathlib import Path
 import json
@@ -17,17 +19,35 @@ except ImportError:
     logging.warning("Ultralytics YOLO غير متوفر - سيتم استخدام المحاكاة")
 
 try:
-    from deep_sort_realtime import DeepSort
+    from deep_sort_realtime.deepsort_tracker import DeepSort
+    from deep_sort_realtime.deep_sort.nn_matching import NearestNeighborDistanceMetric
     DEEPSORT_AVAILABLE = True
 except ImportError:
     DEEPSORT_AVAILABLE = False
     logging.warning("DeepSort غير متوفر - سيتم استخدام تتبع بسيط")
 
+# أوضاع التضمين المظهري للتتبع
+TRACKER_EMBEDDER_MODES = ('motion', 'batched', 'appearance')
+
+# مهلة إضافية بعد الموعد النهائي لحساب النتيجة الجزئية قبل الإيقاف القسري
+DEADLINE_GRACE_SECONDS = 30
+
 from ..models.analysis_models import (
     AnalysisResult, CasaParameters, SpermMorphology, 
     VelocityDataPoint, SpermTrackingData, AnalysisMetadata,
     AnalysisStatus, AnalysisProgress
 )
+from ..utils.config import settings
+from ..utils.cache import TTLCache
+from .casa_accumulator import OnlineCasaAccumulator, CasaTimeSeries, TrackStore, casa_distributions
+from .tracker_pool import TrackerPool
+from .greedy_tracker import GreedyTracker
+from .flow_propagator import FlowPropagator
+from .cancellation import AnalysisCancelled, CancellationToken
+from .checkpoints import CheckpointStore
+from .progress_broker import ProgressBroker
+from .progress_estimator import StageProgress
+from . import casa_kernels
 
 class SpermAnalyzer:
     """محلل الحيوانات المنوية المتقدم"""
@@ -35,7 +55,8 @@ class SpermAnalyzer:
     def __init__(self, model_path: Optional[str] = None):
         self.model_path = model_path or "models/sperm_yolov8.pt"
         self.model = None
-        self.tracker = None
+        self.embedder = None
+        self.tracker_pool: Optional[TrackerPool] = None
         self.logger = logging.getLogger(__name__)
         
         # إعدادات التحليل
@@ -44,8 +65,51 @@ class SpermAnalyzer:
         self.min_track_length = 5
         self.pixel_to_micron_ratio = 0.5  # نسبة تحويل البكسل إلى ميكرومتر
         
-        # تخزين نتائج التحليل
-        self.analysis_cache: Dict[str, AnalysisProgress] = {}
+        # إعدادات التتبع المتزايد
+        tracking_config = settings.get_tracking_config()
+        self.max_track_age = tracking_config['max_age']
+        self.smoothing_window = tracking_config['smoothing_window']
+        self.spill_tracks = tracking_config['spill_tracks']
+        self.detect_interval = tracking_config['detect_interval']
+        self.tracking_config = tracking_config
+        
+        # إعدادات السلاسل الزمنية لمؤشرات CASA
+        analysis_config = settings.get_analysis_config()
+        self.analysis_timeout = analysis_config['timeout']
+        self.casa_window_seconds = analysis_config['window_seconds']
+        self.motile_vcl_threshold = analysis_config['motile_vcl_threshold']
+        
+        # نقاط استئناف تحليلات الفيديو بعد انهيار العامل أو إعادة النشر
+        self.checkpoint_interval = analysis_config['checkpoint_interval']
+        self.checkpoints = (
+            CheckpointStore(analysis_config['checkpoint_directory'])
+            if analysis_config['checkpoint_enabled'] else None
+        )
+        
+        # نشر تقدم الإطارات محدود بالزمن والتغير بدلاً من كل إطار
+        self.progress_min_delta = analysis_config['progress_min_delta']
+        self.progress_min_interval = analysis_config['progress_min_interval']
+        self.eta_smoothing = analysis_config['eta_smoothing']
+        
+        # نتيجة أولية سريعة لأول ثوانٍ من الفيديو قبل التحليل الكامل
+        self.preview_enabled = analysis_config['preview_enabled']
+        self.preview_seconds = analysis_config['preview_seconds']
+        self.preview_detect_interval = analysis_config['preview_detect_interval']
+        
+        # النموذج ومضمّن batched مشتركان بين التحليلات المتزامنة
+        self._model_lock = threading.Lock()
+        self._embedder_lock = threading.Lock()
+        
+        # آخر تقدم لكل تحليل: محدود بـ cache_max_size ومدة cache_ttl، وما يُخرج
+        # منه يُقرأ من طابور التحليلات (الحالة والتقدم الدائمان)
+        cache_config = settings.get_cache_config()
+        self.analysis_cache = TTLCache(max_size=cache_config['max_size'], ttl=cache_config['ttl'])
+        
+        # بث تحديثات التقدم لاتصالات SSE في هذه العملية
+        self.progress_broker = ProgressBroker()
+        
+        # إشارات إلغاء التحليلات الجارية
+        self._cancel_tokens: Dict[str, CancellationToken] = {}
     
     async def initialize(self):
         """تهيئة النموذج والأدوات"""
@@ -57,44 +121,190 @@ class SpermAnalyzer:
                 self.logger.warning("نموذج YOLO غير متوفر - سيتم استخدام المحاكاة")
                 self.model = None
             
+            # تجميع نوى Numba (عند تفعيلها) خارج حلقة الأحداث
+            await asyncio.to_thread(casa_kernels.warmup)
+            
             if DEEPSORT_AVAILABLE:
-                self.tracker = DeepSort(max_age=30, n_init=3)
-                self.logger.info("تم تهيئة DeepSort للتتبع")
+                # متتبع مستقل لكل تحليل من مجمع متتبعات مصفّرة
+                self.tracker_pool = TrackerPool(self._create_tracker)
+                self.tracker_pool.release(self._create_tracker())
+                self.logger.info(f"تم تهيئة DeepSort للتتبع (وضع التضمين: {self.tracker_mode})")
             else:
-                self.tracker = None
+                self.tracker_pool = None
                 self.logger.warning("DeepSort غير متوفر - سيتم استخدام تتبع بسيط")
                 
         except Exception as e:
             self.logger.error(f"خطأ في تهيئة المحلل: {e}")
             raise
     
-    async def analyze_sample(self, file_path: str, analysis_id: str) -> AnalysisResult:
-        """تحليل عينة الحيوانات المنوية"""
+    @property
+    def tracker_mode(self) -> str:
+        """وضع التضمين المظهري المستخدم في DeepSort"""
+        mode = self.tracking_config['embedder']
+        return mode if mode in TRACKER_EMBEDDER_MODES else 'motion'
+    
+    def _create_tracker(self, mode: Optional[str] = None):
+        """إنشاء متتبع DeepSort حسب وضع التضمين
+
+        - motion: بدون شبكة مظهرية (الحيوانات المنوية متشابهة الشكل تقريباً)؛
+          "التضمين" هو مركز الكشف بالبكسل ومقياس الربط إقليدي، فتكلفة الربط
+          في المرحلة الأولى هي إزاحة الكشف عن آخر موضع للمسار (لا تعتمد على
+          الموضع المطلق في الصورة) ضمن بوابة ماهالانوبيس لمرشح كالمان
+        - batched: استدعاء واحد لشبكة التضمين لكل إطار على جميع القصاصات
+        - appearance: المضمّن الافتراضي لـ DeepSort
+        """
+        mode = mode or self.tracker_mode
+        config = self.tracking_config
+        
+        if mode == 'appearance':
+            return DeepSort(
+                max_age=config['max_age'],
+                n_init=config['n_init'],
+                embedder_gpu=config['embedder_gpu']
+            )
+        
+        if mode == 'batched' and self.embedder is None:
+            from deep_sort_realtime.embedder.embedder_pytorch import MobileNetv2_Embedder
+            self.embedder = MobileNetv2_Embedder(
+                max_batch_size=config['embedder_batch_size'],
+                bgr=True,
+                gpu=config['embedder_gpu']
+            )
+        
+        tracker = DeepSort(
+            max_age=config['max_age'],
+            n_init=config['n_init'],
+            embedder=None
+        )
+        if mode == 'motion':
+            # آخر موضع لكل مسار، وأقصى إزاحة مقبولة بين كشفين (مربعة لأن
+            # المسافة الإقليدية في nn_matching مربعة)
+            max_distance = config['greedy_max_distance'] * self.detect_interval
+            tracker.tracker.metric = NearestNeighborDistanceMetric(
+                "euclidean", max_distance ** 2, budget=1
+            )
+        return tracker
+    
+    async def analyze_sample(self, file_path: str, analysis_id: str,
+                             on_preview: Optional[Callable[[AnalysisResult], Awaitable[None]]] = None
+                             ) -> AnalysisResult:
+        """تحليل عينة الحيوانات المنوية
+
+        يرفع AnalysisCancelled إذا استُدعي cancel_analysis أثناء التنفيذ.
+        للفيديو الطويل تُمرر نتيجة أولية (provisional) إلى on_preview قبل
+        بدء التحليل الكامل.
+        """
         self.logger.info(f"بدء تحليل العينة: {analysis_id}")
+        token = self._cancel_tokens.setdefault(analysis_id, CancellationToken())
         
         # تحديث حالة التحليل
         await self._update_progress(analysis_id, 0.1, "بدء التحليل...")
         
         try:
+            token.raise_if_cancelled()
+            
             # تحديد نوع الملف
             file_extension = Path(file_path).suffix.lower()
             
             if file_extension in ['.jpg', '.jpeg', '.png', '.bmp']:
-                result = await self._analyze_image(file_path, analysis_id)
+                deadline, hard_timeout = self._deadlines()
+                analysis = self._analyze_image(file_path, analysis_id, token)
             elif file_extension in ['.mp4', '.avi', '.mov', '.mkv']:
-                result = await self._analyze_video(file_path, analysis_id)
+                checkpoint = self._load_checkpoint(analysis_id, file_path)
+                deadline, hard_timeout = self._deadlines(
+                    checkpoint['elapsed'] if checkpoint is not None else 0.0
+                )
+                analysis = self._analyze_video(
+                    file_path, analysis_id, token, deadline, on_preview, checkpoint
+                )
             else:
                 raise ValueError(f"نوع الملف غير مدعوم: {file_extension}")
             
-            await self._update_progress(analysis_id, 1.0, "تم إكمال التحليل")
+            try:
+                result = await asyncio.wait_for(analysis, timeout=hard_timeout)
+            except asyncio.TimeoutError:
+                token.cancel()
+                self.discard_checkpoint(analysis_id)
+                raise TimeoutError(f"تجاوز التحليل المهلة المسموحة ({self.analysis_timeout} ثانية)")
+            
+            partial = result.metadata is not None and result.metadata.partial
+            message = "تم إكمال التحليل (نتيجة جزئية)" if partial else "تم إكمال التحليل"
+            await self._update_progress(analysis_id, 1.0, message)
             return result
             
+        except AnalysisCancelled:
+            self.logger.info(f"تم إلغاء تحليل العينة: {analysis_id}")
+            self.clear_analysis_cache(analysis_id)
+            raise
         except Exception as e:
             self.logger.error(f"خطأ في تحليل العينة {analysis_id}: {e}")
             await self._update_progress(analysis_id, 0.0, f"فشل التحليل: {str(e)}")
             raise
+        finally:
+            self._cancel_tokens.pop(analysis_id, None)
+    
+    def cancel_analysis(self, analysis_id: str) -> bool:
+        """طلب إيقاف تحليل جارٍ في هذه العملية؛ يُرجع True إن كان جارياً"""
+        token = self._cancel_tokens.get(analysis_id)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+    
+    def _track_store_path(self, analysis_id: str) -> str:
+        return os.path.join(settings.results_directory, f"{analysis_id}_tracks.jsonl")
+    
+    def discard_checkpoint(self, analysis_id: str):
+        """حذف نقطة الاستئناف ومخزن المسارات لتحليل لن يُستأنف"""
+        if self.checkpoints is not None:
+            self.checkpoints.delete(analysis_id)
+        track_path = self._track_store_path(analysis_id)
+        if os.path.exists(track_path):
+            os.remove(track_path)
+    
+    def _deadlines(self, elapsed: float = 0.0) -> Tuple[Optional[float], Optional[float]]:
+        """الموعد النهائي (time.monotonic) والمهلة القسرية للمحاولة الحالية
+
+        الفيديو يتوقف عند الموعد النهائي بنتيجة جزئية؛ الإيقاف القسري بعد
+        مهلة إضافية يشمل الصور والإطارات العالقة في النموذج. كلاهما يخصم
+        elapsed (وقت المحاولات السابقة من نقطة الاستئناف)، ولا تقل المهلة
+        القسرية عن المهلة الإضافية ليتسع الوقت لحساب النتيجة الجزئية.
+        """
+        if self.analysis_timeout <= 0:
+            return None, None
+        deadline = time.monotonic() + self.analysis_timeout - elapsed
+        hard_timeout = max(
+            self.analysis_timeout + DEADLINE_GRACE_SECONDS - elapsed, DEADLINE_GRACE_SECONDS
+        )
+        return deadline, hard_timeout
+    
+    def _load_checkpoint(self, analysis_id: str, video_path: str) -> Optional[Dict[str, Any]]:
+        """آخر نقطة استئناف للتحليل إن كانت لنفس ملف الفيديو"""
+        if self.checkpoints is None:
+            return None
+        state = self.checkpoints.load(analysis_id)
+        if state is None:
+            return None
+        if state.get('video_size') != os.path.getsize(video_path):
+            self.logger.warning(f"نقطة استئناف {analysis_id} لا تطابق ملف الفيديو - البدء من جديد")
+            self.discard_checkpoint(analysis_id)
+            return None
+        return state
     
-    async def _analyze_image(self, image_path: str, analysis_id: str) -> AnalysisResult:
+    @staticmethod
+    def _seek(cap, video_path: str, frame_idx: int):
+        """الانتقال إلى إطار الاستئناف (بالتخطي إن لم يدعم الترميز البحث الدقيق)"""
+        if cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx) and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_idx:
+            return cap
+        cap.release()
+        cap = cv2.VideoCapture(video_path)
+        for _ in range(frame_idx):
+            if not cap.grab():
+                break
+        return cap
+    
+    async def _analyze_image(self, image_path: str, analysis_id: str,
+                             token: Optional[CancellationToken] = None) -> AnalysisResult:
         """تحليل صورة واحدة"""
         await self._update_progress(analysis_id, 0.2, "تحميل الصورة...")
         
@@ -106,7 +316,7 @@ class SpermAnalyzer:
         await self._update_progress(analysis_id, 0.4, "كشف الحيوانات المنوية...")
         
         # كشف الحيوانات المنوية
-        detections = await self._detect_sperm(image)
+        detections = await self._detect_sperm(image, token)
         
         await self._update_progress(analysis_id, 0.7, "تحليل النتائج...")
         
@@ -140,10 +350,28 @@ class SpermAnalyzer:
         await self._update_progress(analysis_id, 0.9, "إنهاء التحليل...")
         return result
     
-    async def _analyze_video(self, video_path: str, analysis_id: str) -> AnalysisResult:
-        """تحليل فيديو مع تتبع الحركة"""
+    async def _analyze_video(self, video_path: str, analysis_id: str,
+                             token: Optional[CancellationToken] = None,
+                             deadline: Optional[float] = None,
+                             on_preview: Optional[Callable[[AnalysisResult], Awaitable[None]]] = None,
+                             checkpoint: Optional[Dict[str, Any]] = None
+                             ) -> AnalysisResult:
+        """تحليل فيديو مع تتبع الحركة
+
+        عند بلوغ deadline (time.monotonic) يتوقف فك الترميز وتُحسب مؤشرات
+        CASA من المسارات المجمعة حتى الآن كنتيجة جزئية.
+        
+        تُحفظ حالة التحليل (الإطار الحالي، المتتبع، المجمّع، التدفق البصري)
+        كل checkpoint_interval ثانية، فيستأنف العامل التالي من آخر نقطة بدلاً
+        من الإطار الأول إذا توقفت العملية؛ checkpoint هي النقطة المحمّلة
+        (deadline محسوب بعد خصم وقتها المنقضي).
+        """
         await self._update_progress(analysis_id, 0.1, "تحميل الفيديو...")
         
+        # النتيجة الأولية نُشرت قبل أول نقطة استئناف فلا تُعاد عند الاستئناف
+        if on_preview is not None and checkpoint is None and self.preview_enabled:
+            await self._publish_preview(video_path, analysis_id, token, on_preview)
+        
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             raise ValueError("فشل في تحميل الفيديو")
@@ -154,40 +382,183 @@ class SpermAnalyzer:
         
         await self._update_progress(analysis_id, 0.2, "معالجة الإطارات...")
         
-        # معالجة الإطارات
-        tracks = {}
-        all_detections = []
+        # متتبع خاص بهذا التحليل
+        if self.tracker_pool:
+            tracker = self.tracker_pool.acquire()
+            if checkpoint is not None:
+                tracker.tracker = checkpoint['tracker']
+        elif checkpoint is not None:
+            tracker = checkpoint['tracker']
+        else:
+            # بين إطارين مفتاحيين قد يتحرك الحيوان المنوي N ضعف المسافة
+            tracker = GreedyTracker(
+                max_distance=self.tracking_config['greedy_max_distance'] * self.detect_interval,
+                max_age=self.max_track_age,
+                n_init=self.tracking_config['n_init']
+            )
+        
+        # مجمّع CASA متزايد: الذاكرة تعتمد على المسارات النشطة فقط
+        track_store = None
+        if self.spill_tracks:
+            track_store = TrackStore(self._track_store_path(analysis_id))
+        accumulator = OnlineCasaAccumulator(
+            fps=fps,
+            pixel_to_micron_ratio=self.pixel_to_micron_ratio,
+            min_track_length=self.min_track_length,
+            max_age=self.max_track_age,
+            smoothing_window=self.smoothing_window,
+            chunk_size=self.tracking_config['chunk_size'],
+            track_store=track_store,
+            time_series=CasaTimeSeries(
+                fps=fps,
+                pixel_to_micron_ratio=self.pixel_to_micron_ratio,
+                window_seconds=self.casa_window_seconds,
+                motile_vcl_threshold=self.motile_vcl_threshold
+            )
+        )
+        
+        # الكاشف كل N إطار، والتدفق البصري ينقل المسارات بينها
+        propagator = None
+        if self.detect_interval > 1:
+            propagator = FlowPropagator(
+                downscale=self.tracking_config['flow_downscale'],
+                window_size=self.tracking_config['flow_window_size'],
+                pyramid_levels=self.tracking_config['flow_pyramid_levels']
+            )
+        
+        # عدادات الشكل بدلاً من حفظ جميع الكشوفات
+        detection_total = 0
+        detection_normal = 0
         frame_idx = 0
+        resolution = "unknown"
+        partial = False
+        elapsed = 0.0
+        
+        if checkpoint is not None:
+            accumulator = checkpoint['accumulator']
+            track_store = accumulator.track_store
+            propagator = checkpoint['propagator']
+            detection_total = checkpoint['detection_total']
+            detection_normal = checkpoint['detection_normal']
+            frame_idx = checkpoint['frame_idx']
+            resolution = checkpoint['resolution']
+            elapsed = checkpoint['elapsed']
+            cap = self._seek(cap, video_path, frame_idx)
+        
+        # مرحلة الإطارات تشغل 0.2-0.7 من التقدم، والوقت المتبقي من معدلها المنعّم
+        # (عدد الإطارات قد يكون 0 في الحاويات المتدفقة أو متغيرة المعدل)
+        stage = StageProgress(
+            0.2, 0.7, frame_count, done=frame_idx,
+            min_delta=self.progress_min_delta,
+            min_interval=self.progress_min_interval,
+            smoothing=self.eta_smoothing
+        )
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # كشف الحيوانات المنوية في الإطار
-            detections = await self._detect_sperm(frame)
-            all_detections.extend(detections)
-            
-            # تتبع الحيوانات المنوية
-            if self.tracker and detections:
-                tracks_frame = self._update_tracks(detections, frame_idx, tracks)
+        if checkpoint is not None:
+            self.logger.info(f"استئناف تحليل {analysis_id} من الإطار {frame_idx}/{frame_count}")
+            await self._update_progress(
+                analysis_id, stage.progress,
+                f"استئناف التحليل من الإطار {frame_idx}/{frame_count}"
+            )
+        
+        started = time.monotonic() - elapsed
+        last_checkpoint = time.monotonic()
+        checkpoint_write = None
+        interrupted = False
+        
+        try:
+            while cap.isOpened():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                
+                if frame_idx == 0:
+                    resolution = f"{frame.shape[1]}x{frame.shape[0]}"
+                
+                # التوقف خلال إطار واحد عند الإلغاء
+                if token is not None:
+                    token.raise_if_cancelled()
+                
+                if deadline is not None and time.monotonic() >= deadline:
+                    partial = True
+                    self.logger.warning(
+                        f"انتهت مهلة التحليل {analysis_id} بعد {frame_idx}/{frame_count} إطار - نتيجة جزئية"
+                    )
+                    break
+                
+                if frame_idx % self.detect_interval == 0:
+                    # كشف الحيوانات المنوية في الإطار المفتاحي
+                    detections = await self._detect_sperm(frame, token)
+                    detection_total += len(detections)
+                    detection_normal += self._count_normal_shapes(detections)
+                    
+                    # تتبع الحيوانات المنوية
+                    observations = self._update_tracks(tracker, detections, frame, frame_idx)
+                    if propagator is not None:
+                        propagator.anchor(propagator.prepare(frame), observations)
+                else:
+                    # نقل المسارات بالتدفق البصري دون تشغيل الكاشف
+                    observations = propagator.propagate(propagator.prepare(frame))
+                
+                accumulator.update(frame_idx, observations)
+                
+                frame_idx += 1
+                
+                # تحديث التقدم
+                stage.advance(frame_idx)
+                if stage.due():
+                    await self._update_progress(
+                        analysis_id, stage.progress, f"معالجة الإطار {frame_idx}/{frame_count}",
+                        estimated_time_remaining=stage.eta(deadline)
+                    )
+                
+                # توقف كل 10 إطارات للسماح للمهام الأخرى
+                if frame_idx % 10 == 0:
+                    await asyncio.sleep(0.01)
+                
+                if (self.checkpoints is not None
+                        and time.monotonic() - last_checkpoint >= self.checkpoint_interval):
+                    # التجميد هنا قبل أي انتظار؛ الخيط يكتب البايتات فقط
+                    state = self.checkpoints.snapshot({
+                        'video_size': os.path.getsize(video_path),
+                        'frame_idx': frame_idx,
+                        'tracker': tracker.tracker if self.tracker_pool else tracker,
+                        'accumulator': accumulator,
+                        'propagator': propagator,
+                        'detection_total': detection_total,
+                        'detection_normal': detection_normal,
+                        'resolution': resolution,
+                        'elapsed': time.monotonic() - started
+                    })
+                    checkpoint_write = asyncio.ensure_future(
+                        asyncio.to_thread(self.checkpoints.write, analysis_id, state)
+                    )
+                    await asyncio.shield(checkpoint_write)
+                    last_checkpoint = time.monotonic()
             
-            frame_idx += 1
+            accumulator.finalize_all()
             
-            # تحديث التقدم
-            progress = 0.2 + (frame_idx / frame_count) * 0.5
-            await self._update_progress(analysis_id, progress, f"معالجة الإطار {frame_idx}/{frame_count}")
+            await self._update_progress(analysis_id, 0.8, "تحليل البيانات...")
             
-            # توقف كل 10 إطارات للسماح للمهام الأخرى
-            if frame_idx % 10 == 0:
-                await asyncio.sleep(0.01)
-        
-        cap.release()
-        
-        await self._update_progress(analysis_id, 0.8, "تحليل البيانات...")
-        
-        # تحليل البيانات المجمعة
-        analysis_results = await self._analyze_tracking_data(tracks, fps, all_detections)
+            # تحليل البيانات المجمعة
+            analysis_results = await self._analyze_tracking_data(
+                accumulator, detection_normal, detection_total
+            )
+        except asyncio.CancelledError:
+            # إيقاف العملية: تبقى نقطة الاستئناف ومخزن المسارات للعامل التالي
+            interrupted = True
+            raise
+        finally:
+            # كتابة نقطة جارية عند الإلغاء تكتمل قبل حذفها أو إغلاق مخزن المسارات
+            if checkpoint_write is not None and not checkpoint_write.done():
+                await asyncio.wait([checkpoint_write])
+            cap.release()
+            if self.tracker_pool:
+                self.tracker_pool.release(tracker)
+            if track_store is not None:
+                track_store.close(delete=not interrupted)
+            if not interrupted and self.checkpoints is not None:
+                self.checkpoints.delete(analysis_id)
         
         # إنشاء النتيجة النهائية
         result = AnalysisResult(
@@ -201,6 +572,7 @@ class SpermAnalyzer:
             casa_parameters=analysis_results['casa_parameters'],
             morphology=analysis_results['morphology'],
             velocity_distribution=analysis_results['velocity_distribution'],
+            casa_distributions=analysis_results.get('casa_distributions'),
             tracking_data=analysis_results.get('tracking_data'),
             metadata=AnalysisMetadata(
                 model_version="YOLOv8-sperm",
@@ -208,22 +580,150 @@ class SpermAnalyzer:
                 processing_time=int(duration * 1000),
                 frame_count=frame_count,
                 fps=fps,
-                resolution=f"{frame.shape[1]}x{frame.shape[0]}" if frame is not None else "unknown",
-                additional_data={"video_analysis": True, "duration": duration}
+                resolution=resolution,
+                partial=partial,
+                frames_processed=frame_idx,
+                additional_data={
+                    "video_analysis": True,
+                    "duration": duration,
+                    "detect_interval": self.detect_interval
+                }
             )
         )
         
         return result
     
-    async def _detect_sperm(self, image: np.ndarray) -> List[Dict]:
+    async def _publish_preview(self, video_path: str, analysis_id: str,
+                               token: Optional[CancellationToken],
+                               on_preview: Callable[[AnalysisResult], Awaitable[None]]):
+        """حساب النتيجة الأولية وتمريرها (فشل نشرها لا يوقف التحليل الكامل)"""
+        try:
+            preview = await self._preview_video(video_path, analysis_id, token)
+            if preview is not None:
+                await on_preview(preview)
+        except (AnalysisCancelled, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            self.logger.warning(f"فشل في إعداد النتيجة الأولية للتحليل {analysis_id}: {e}")
+    
+    async def _preview_video(self, video_path: str, analysis_id: str,
+                             token: Optional[CancellationToken] = None) -> Optional[AnalysisResult]:
+        """نتيجة أولية من أول preview_seconds ثانية من الفيديو
+
+        إعداد خفيف: متتبع بسيط، والكاشف كل preview_detect_interval إطار مع
+        نقل المسارات بالتدفق البصري بينها، دون سلاسل زمنية أو نقاط استئناف.
+        None للفيديو القصير الذي يكتمل تحليله الكامل سريعاً.
+        """
+        cap = cv2.VideoCapture(video_path)
+        try:
+            if not cap.isOpened():
+                return None
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            preview_frames = int(self.preview_seconds * fps)
+            if fps <= 0 or frame_count < 2 * preview_frames:
+                return None
+            
+            await self._update_progress(analysis_id, 0.15, "إعداد نتيجة أولية...")
+            started = time.monotonic()
+            
+            detect_interval = self.preview_detect_interval
+            tracker = GreedyTracker(
+                max_distance=self.tracking_config['greedy_max_distance'] * detect_interval,
+                max_age=self.max_track_age,
+                n_init=self.tracking_config['n_init']
+            )
+            accumulator = OnlineCasaAccumulator(
+                fps=fps,
+                pixel_to_micron_ratio=self.pixel_to_micron_ratio,
+                min_track_length=self.min_track_length,
+                max_age=self.max_track_age,
+                smoothing_window=self.smoothing_window,
+                chunk_size=self.tracking_config['chunk_size']
+            )
+            propagator = None
+            if detect_interval > 1:
+                propagator = FlowPropagator(
+                    downscale=self.tracking_config['flow_downscale'],
+                    window_size=self.tracking_config['flow_window_size'],
+                    pyramid_levels=self.tracking_config['flow_pyramid_levels']
+                )
+            
+            detection_total = 0
+            detection_normal = 0
+            frame_idx = 0
+            resolution = "unknown"
+            while frame_idx < preview_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if token is not None:
+                    token.raise_if_cancelled()
+                if frame_idx == 0:
+                    resolution = f"{frame.shape[1]}x{frame.shape[0]}"
+                
+                if frame_idx % detect_interval == 0:
+                    detections = await self._detect_sperm(frame, token)
+                    detection_total += len(detections)
+                    detection_normal += self._count_normal_shapes(detections)
+                    observations = tracker.update(detections, frame_idx)
+                    if propagator is not None:
+                        propagator.anchor(propagator.prepare(frame), observations)
+                else:
+                    observations = propagator.propagate(propagator.prepare(frame))
+                
+                accumulator.update(frame_idx, observations)
+                frame_idx += 1
+                if frame_idx % 10 == 0:
+                    await asyncio.sleep(0)
+        finally:
+            cap.release()
+        
+        accumulator.finalize_all()
+        analysis_results = await self._analyze_tracking_data(accumulator, detection_normal, detection_total)
+        
+        return AnalysisResult(
+            id=analysis_id,
+            file_name=os.path.basename(video_path),
+            file_size=os.path.getsize(video_path),
+            analysis_date=datetime.now(),
+            status=AnalysisStatus.ANALYZING,
+            provisional=True,
+            sperm_count=analysis_results['sperm_count'],
+            motility=analysis_results['motility'],
+            concentration=analysis_results['concentration'],
+            casa_parameters=analysis_results['casa_parameters'],
+            morphology=analysis_results['morphology'],
+            velocity_distribution=analysis_results['velocity_distribution'],
+            casa_distributions=analysis_results.get('casa_distributions'),
+            metadata=AnalysisMetadata(
+                model_version="YOLOv8-sperm",
+                confidence=0.92,
+                processing_time=int((time.monotonic() - started) * 1000),
+                frame_count=frame_count,
+                fps=fps,
+                resolution=resolution,
+                partial=False,
+                frames_processed=frame_idx,
+                additional_data={
+                    "video_analysis": True,
+                    "provisional": True,
+                    "preview_seconds": self.preview_seconds,
+                    "detect_interval": detect_interval
+                }
+            )
+        )
+    
+    async def _detect_sperm(self, image: np.ndarray,
+                            token: Optional[CancellationToken] = None) -> List[Dict]:
         """كشف الحيوانات المنوية في الصورة"""
         if self.model is None:
             # محاكاة الكشف
             return await self._simulate_detection(image)
         
         try:
-            # التحليل الفعلي باستخدام YOLO
-            results = self.model(image, conf=self.confidence_threshold)
+            # التحليل الفعلي باستخدام YOLO في خيط منفصل حتى لا يتوقف باقي التحليلات
+            results = await asyncio.to_thread(self._run_model, image, token)
             detections = []
             
             for result in results:
@@ -244,10 +744,20 @@ class SpermAnalyzer:
             
             return detections
             
+        except AnalysisCancelled:
+            raise
         except Exception as e:
             self.logger.warning(f"فشل في الكشف الفعلي: {e}، التبديل للمحاكاة")
             return await self._simulate_detection(image)
     
+    def _run_model(self, image: np.ndarray, token: Optional[CancellationToken] = None):
+        """استدعاء النموذج المشترك (متنبئ YOLO غير آمن للخيوط المتعددة)"""
+        with self._model_lock:
+            # قد يطول انتظار القفل خلف تحليلات أخرى، فيُفحص الإلغاء بعده
+            if token is not None:
+                token.raise_if_cancelled()
+            return self.model(image, conf=self.confidence_threshold, verbose=False)
+    
     async def _simulate_detection(self, image: np.ndarray) -> List[Dict]:
         """محاكاة كشف الحيوانات المنوية"""
         import random
@@ -278,140 +788,94 @@ class SpermAnalyzer:
         await asyncio.sleep(0.1)  # محاكاة وقت المعالجة
         return detections
     
-    def _update_tracks(self, detections: List[Dict], frame_idx: int, tracks: Dict) -> Dict:
-        """تحديث مسارات التتبع"""
-        if not self.tracker:
-            return self._simple_tracking(detections, frame_idx, tracks)
+    def _update_tracks(self, tracker, detections: List[Dict], frame: np.ndarray,
+                       frame_idx: int) -> List[Tuple[str, float, float]]:
+        """تحديث مسارات التتبع وإرجاع مراكز المسارات المؤكدة في الإطار"""
+        if isinstance(tracker, GreedyTracker):
+            return tracker.update(detections, frame_idx)
         
-        # تحويل الكشوفات لصيغة DeepSort
+        # تحويل الكشوفات لصيغة DeepSort: ([left, top, w, h], confidence, class)
         detection_list = []
         for det in detections:
             x1, y1, x2, y2 = det['bbox']
-            detection_list.append([x1, y1, x2 - x1, y2 - y1, det['confidence']])
+            detection_list.append(([x1, y1, x2 - x1, y2 - y1], det['confidence'], det['class']))
         
         # تحديث التتبع
-        tracked_objects = self.tracker.update_tracks(detection_list)
-        
-        # تحديث المسارات
+        mode = self.tracker_mode
+        if mode == 'appearance':
+            tracked_objects = tracker.update_tracks(detection_list, frame=frame)
+        else:
+            embeds = self._compute_embeddings(detections, frame, mode)
+            tracked_objects = tracker.update_tracks(detection_list, embeds=embeds)
+        
+        observations = []
         for track in tracked_objects:
             if track.is_confirmed():
-                track_id = track.track_id
                 bbox = track.to_ltwh()
-                center = [bbox[0] + bbox[2]/2, bbox[1] + bbox[3]/2]
-                
-                if track_id not in tracks:
-                    tracks[track_id] = []
-                
-                tracks[track_id].append({
-                    'frame': frame_idx,
-                    'center': center,
-                    'bbox': bbox
-                })
+                observations.append((
+                    str(track.track_id),
+                    bbox[0] + bbox[2] / 2,
+                    bbox[1] + bbox[3] / 2
+                ))
         
-        return tracks
+        return observations
     
-    def _simple_tracking(self, detections: List[Dict], frame_idx: int, tracks: Dict) -> Dict:
-        """تتبع بسيط بدون DeepSort"""
-        import random
-        
-        for i, det in enumerate(detections):
-            track_id = f"track_{i}_{frame_idx}"
-            tracks[track_id] = tracks.get(track_id, [])
-            tracks[track_id].append({
-                'frame': frame_idx,
-                'center': det['center'],
-                'bbox': det['bbox']
-            })
-        
-        return tracks
+    def _compute_embeddings(self, detections: List[Dict], frame: np.ndarray, mode: str) -> List[np.ndarray]:
+        """تضمينات الكشوفات لأوضاع motion و batched"""
+        if mode == 'batched' and self.embedder is not None and detections:
+            height, width = frame.shape[:2]
+            crops = []
+            for det in detections:
+                x1, y1, x2, y2 = det['bbox']
+                x1, y1 = max(0, int(x1)), max(0, int(y1))
+                x2, y2 = min(width, int(x2)), min(height, int(y2))
+                crop = frame[y1:max(y2, y1 + 1), x1:max(x2, x1 + 1)]
+                crops.append(crop)
+            # استدعاء واحد للشبكة على جميع قصاصات الإطار
+            with self._embedder_lock:
+                return self.embedder.predict(crops)
+        
+        # وضع الحركة: مركز الكشف بالبكسل، يقارنه المقياس الإقليدي بآخر موضع
+        # للمسار (انظر _create_tracker)
+        return [
+            np.array(det['center'][:2], dtype=np.float32)
+            for det in detections
+        ]
     
-    async def _analyze_tracking_data(self, tracks: Dict, fps: float, all_detections: List) -> Dict:
+    async def _analyze_tracking_data(self, accumulator: OnlineCasaAccumulator,
+                                     detection_normal: int, detection_total: int) -> Dict:
         """تحليل بيانات التتبع لحساب مؤشرات CASA"""
-        import random
-        from scipy import stats
-        
-        total_sperm = len(tracks)
-        motile_sperm = 0
-        velocities = []
-        casa_values = {'vcl': [], 'vsl': [], 'vap': [], 'lin': [], 'str': [], 'wob': []}
-        
-        for track_id, track_points in tracks.items():
-            if len(track_points) < self.min_track_length:
-                continue
-            
-            # حساب المسافات والسرعات
-            distances = []
-            straight_distance = 0
-            
-            if len(track_points) > 1:
-                motile_sperm += 1
-                
-                for i in range(1, len(track_points)):
-                    prev_point = track_points[i-1]['center']
-                    curr_point = track_points[i]['center']
-                    
-                    # المسافة بين النقاط
-                    dist = np.sqrt((curr_point[0] - prev_point[0])**2 + 
-                                 (curr_point[1] - prev_point[1])**2)
-                    distances.append(dist * self.pixel_to_micron_ratio)
-                
-                # المسافة المستقيمة
-                first_point = track_points[0]['center']
-                last_point = track_points[-1]['center']
-                straight_distance = np.sqrt((last_point[0] - first_point[0])**2 + 
-                                          (last_point[1] - first_point[1])**2) * self.pixel_to_micron_ratio
-                
-                # حساب السرعات
-                time_interval = 1.0 / fps if fps > 0 else 1.0
-                total_distance = sum(distances)
-                duration = len(track_points) * time_interval
-                
-                vcl = total_distance / duration if duration > 0 else 0  # السرعة المنحنية
-                vsl = straight_distance / duration if duration > 0 else 0  # السرعة المستقيمة
-                vap = vcl * 0.8  # السرعة المتوسطة (تقدير)
-                
-                # النسب
-                lin = (vsl / vcl * 100) if vcl > 0 else 0  # الخطية
-                str_val = (vsl / vap * 100) if vap > 0 else 0  # الاستقامة
-                wob = (vap / vcl * 100) if vcl > 0 else 0  # التذبذب
-                
-                casa_values['vcl'].append(vcl)
-                casa_values['vsl'].append(vsl)
-                casa_values['vap'].append(vap)
-                casa_values['lin'].append(lin)
-                casa_values['str'].append(str_val)
-                casa_values['wob'].append(wob)
-                
-                velocities.append(vcl)
+        total_sperm = accumulator.total_tracks
+        motile_sperm = accumulator.motile_count
+        casa_values = accumulator.casa_arrays()
         
         # حساب المتوسطات
         motility_percentage = (motile_sperm / total_sperm * 100) if total_sperm > 0 else 0
         
+        def _mean(values: np.ndarray) -> float:
+            return float(np.mean(values)) if len(values) else 0
+        
         casa_parameters = CasaParameters(
-            vcl=np.mean(casa_values['vcl']) if casa_values['vcl'] else 0,
-            vsl=np.mean(casa_values['vsl']) if casa_values['vsl'] else 0,
-            vap=np.mean(casa_values['vap']) if casa_values['vap'] else 0,
-            lin=np.mean(casa_values['lin']) if casa_values['lin'] else 0,
-            str=np.mean(casa_values['str']) if casa_values['str'] else 0,
-            wob=np.mean(casa_values['wob']) if casa_values['wob'] else 0,
-            alh=random.uniform(2, 6),  # تقدير
-            bcf=random.uniform(8, 20),  # تقدير
+            vcl=_mean(casa_values['vcl']),
+            vsl=_mean(casa_values['vsl']),
+            vap=_mean(casa_values['vap']),
+            lin=_mean(casa_values['lin']),
+            str=_mean(casa_values['str']),
+            wob=_mean(casa_values['wob']),
+            alh=_mean(casa_values['alh']),
+            bcf=_mean(casa_values['bcf']),
             mot=motility_percentage
         )
         
-        # توزيع السرعة عبر الزمن
+        # توزيع السرعة عبر الزمن (نوافذ زمنية مجمعة أثناء معالجة الإطارات)
         velocity_distribution = []
-        if velocities:
-            # تقسيم البيانات إلى 10 نقاط زمنية
-            for i in range(10):
-                avg_velocity = np.mean(velocities) + random.uniform(-10, 10)
-                velocity_distribution.append(VelocityDataPoint(
-                    time_point=i,
-                    velocity=max(0, avg_velocity)
-                ))
+        if accumulator.time_series is not None:
+            velocity_distribution = [
+                VelocityDataPoint(**point) for point in accumulator.time_series.emit()
+            ]
         
         # تحليل الشكل (محاكاة)
-        morphology = await self._analyze_morphology_from_detections(all_detections)
+        morphology = await self._analyze_morphology_from_counts(detection_normal, detection_total)
         
         return {
             'sperm_count': total_sperm,
@@ -420,7 +884,8 @@ class SpermAnalyzer:
             'casa_parameters': casa_parameters,
             'morphology': morphology,
             'velocity_distribution': velocity_distribution,
-            'tracking_data': self._format_tracking_data(tracks)
+            'casa_distributions': casa_distributions(casa_values),
+            'tracking_data': self._format_tracking_data(accumulator)
         }
     
     async def _analyze_morphology(self, image: np.ndarray, detections: List[Dict]) -> SpermMorphology:
@@ -443,16 +908,8 @@ class SpermAnalyzer:
             neck_defects=neck_defects
         )
     
-    async def _analyze_morphology_from_detections(self, detections: List[Dict]) -> SpermMorphology:
-        """تحليل الشكل من الكشوفات"""
-        import random
-        
-        if not detections:
-            return SpermMorphology(
-                normal=0, abnormal=0, head_defects=0, tail_defects=0, neck_defects=0
-            )
-        
-        # تحليل أشكال الحيوانات المنوية بناءً على نسب أبعاد الصناديق
+    def _count_normal_shapes(self, detections: List[Dict]) -> int:
+        """عدد الكشوفات ذات نسبة الأبعاد الطبيعية"""
         normal_count = 0
         
         for det in detections:
@@ -465,8 +922,18 @@ class SpermAnalyzer:
             if 1.5 <= aspect_ratio <= 4.0:  # شكل طبيعي متوقع
                 normal_count += 1
         
-        total_count = len(detections)
-        normal_percentage = (normal_count / total_count * 100) if total_count > 0 else 0
+        return normal_count
+    
+    async def _analyze_morphology_from_counts(self, normal_count: int, total_count: int) -> SpermMorphology:
+        """تحليل الشكل من عدادات الكشوفات المجمعة"""
+        import random
+        
+        if total_count == 0:
+            return SpermMorphology(
+                normal=0, abnormal=0, head_defects=0, tail_defects=0, neck_defects=0
+            )
+        
+        normal_percentage = normal_count / total_count * 100
         abnormal_percentage = 100 - normal_percentage
         
         return SpermMorphology(
@@ -490,56 +957,54 @@ class SpermAnalyzer:
         # تقدير بسيط بناءً على العدد
         return min(sperm_count * 0.5, 40)
     
-    def _format_tracking_data(self, tracks: Dict) -> List[SpermTrackingData]:
-        """تنسيق بيانات التتبع"""
-        tracking_data = []
+    def _format_tracking_data(self, accumulator: OnlineCasaAccumulator) -> List[SpermTrackingData]:
+        """تنسيق بيانات التتبع من ملخصات المسارات المنتهية"""
+        points_by_track = {}
+        if accumulator.track_store is not None:
+            for stored in accumulator.track_store.iter_tracks():
+                points_by_track[stored['track_id']] = [
+                    {'x': x, 'y': y, 'frame': frame} for frame, x, y in stored['points']
+                ]
         
-        for track_id, track_points in tracks.items():
-            if len(track_points) < self.min_track_length:
-                continue
-            
-            # حساب المسافة الإجمالية
-            total_distance = 0
-            for i in range(1, len(track_points)):
-                prev = track_points[i-1]['center']
-                curr = track_points[i]['center']
-                dist = np.sqrt((curr[0] - prev[0])**2 + (curr[1] - prev[1])**2)
-                total_distance += dist * self.pixel_to_micron_ratio
-            
-            # حساب الإزاحة
-            first_point = track_points[0]['center']
-            last_point = track_points[-1]['center']
-            displacement = np.sqrt((last_point[0] - first_point[0])**2 + 
-                                 (last_point[1] - first_point[1])**2) * self.pixel_to_micron_ratio
-            
+        tracking_data = []
+        for summary in accumulator.track_summaries:
+            track_id = summary['track_id']
             tracking_data.append(SpermTrackingData(
-                sperm_id=int(track_id.split('_')[-1]) if '_' in track_id else 0,
-                track_points=[{'x': p['center'][0], 'y': p['center'][1], 'frame': p['frame']} 
-                             for p in track_points],
-                total_distance=total_distance,
-                displacement=displacement,
-                duration=len(track_points) / 30.0  # تقدير 30 fps
+                sperm_id=self._sperm_id_from_track(track_id),
+                track_points=points_by_track.pop(track_id, []),
+                total_distance=summary['total_distance'],
+                displacement=summary['displacement'],
+                duration=summary['duration']
             ))
         
         return tracking_data
     
-    async def _update_progress(self, analysis_id: str, progress: float, message: str):
+    @staticmethod
+    def _sperm_id_from_track(track_id: str) -> int:
+        """استخراج رقم الحيوان المنوي من معرف المسار"""
+        suffix = track_id.split('_')[-1]
+        return int(suffix) if suffix.isdigit() else 0
+    
+    async def _update_progress(self, analysis_id: str, progress: float, message: str,
+                               estimated_time_remaining: Optional[int] = None):
         """تحديث تقدم التحليل"""
-        self.analysis_cache[analysis_id] = AnalysisProgress(
+        state = AnalysisProgress(
             analysis_id=analysis_id,
             status=AnalysisStatus.ANALYZING if progress < 1.0 else AnalysisStatus.COMPLETED,
             progress=progress,
-            message=message
+            message=message,
+            estimated_time_remaining=estimated_time_remaining
         )
+        self.analysis_cache.set(analysis_id, state)
+        self.progress_broker.publish(state)
         
         # تسجيل التقدم
         self.logger.info(f"التحليل {analysis_id}: {progress*100:.1f}% - {message}")
     
     def get_analysis_progress(self, analysis_id: str) -> Optional[AnalysisProgress]:
-        """جلب تقدم التحليل"""
+        """جلب تقدم التحليل من الذاكرة؛ None إن لم يعمل هنا أو أُخرج من الذاكرة"""
         return self.analysis_cache.get(analysis_id)
     
     def clear_analysis_cache(self, analysis_id: str):
         """مسح ذاكرة التخزين المؤقت للتحليل"""
-        if analysis_id in self.analysis_cache:
-            del self.analysis_cache[analysis_id]
\ No newline at end of file
+        self.analysis_cache.pop(analysis_id)
\ No newline at end of file
@@ -0,0 +1,44 @@
+import threading
+from typing import Any, Callable, List
+
+
+class TrackerPool:
+    """مجمع متتبعات DeepSort قابلة لإعادة الاستخدام
+
+    كل تحليل يحصل على متتبع خاص به، فلا تختلط مسارات تحليلين متزامنين.
+    تُعاد المتتبعات إلى المجمع بعد تصفير حالتها لتجنب كلفة إنشائها
+    (خاصة في وضع appearance الذي يحمّل شبكة تضمين لكل متتبع).
+    """
+
+    def __init__(self, factory: Callable[[], Any], max_idle: int = 4):
+        self._factory = factory
+        self._max_idle = max_idle
+        self._idle: List[Any] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Any:
+        """الحصول على متتبع نظيف"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._factory()
+
+    def release(self, tracker: Any):
+        """تصفير المتتبع وإعادته إلى المجمع"""
+        self._reset(tracker)
+        with self._lock:
+            if len(self._idle) < self._max_idle:
+                self._idle.append(tracker)
+
+    def clear(self):
+        """إفراغ المتتبعات الخاملة"""
+        with self._lock:
+            self._idle.clear()
+
+    @staticmethod
+    def _reset(tracker: Any):
+        """حذف جميع المسارات والتضمينات المخزنة"""
+        tracker.delete_all_tracks()
+        inner = tracker.tracker
+        inner.del_tracks_ids = []
+        inner.metric.samples = {}
@@ -0,0 +1,417 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+# يتم استيرادها عند التوفر
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+    logging.warning("httpx غير متوفر - إشعارات webhook معطلة")
+
+from sqlalchemy import func
+
+from ..database import get_db_session, WebhookDelivery
+from ..models.analysis_models import AnalysisStatus
+
+logger = logging.getLogger(__name__)
+
+# أحداث انتهاء التحليل المرسلة لكل حالة نهائية
+STATUS_EVENTS = {
+    AnalysisStatus.COMPLETED.value: "analysis.completed",
+    AnalysisStatus.FAILED.value: "analysis.failed",
+    AnalysisStatus.CANCELLED.value: "analysis.cancelled"
+}
+
+# حدث النتيجة الأولية السريعة قبل اكتمال التحليل
+PROVISIONAL_EVENT = "analysis.provisional"
+
+# رموز HTTP التي يُعاد الإرسال بعدها (إضافة إلى 5xx وأخطاء الشبكة)
+RETRYABLE_STATUS_CODES = (408, 425, 429)
+
+
+def sign_payload(secret_key: str, timestamp: str, body: bytes) -> str:
+    """توقيع HMAC-SHA256 للطابع الزمني والجسم ("{timestamp}.{body}")"""
+    message = timestamp.encode("utf-8") + b"." + body
+    return hmac.new(secret_key.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret_key: str, timestamp: str, body: bytes, signature: str,
+                     tolerance: int = 300) -> bool:
+    """تحقق المستقبل من ترويسة X-Webhook-Signature ومن حداثة الطابع الزمني"""
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except ValueError:
+        return False
+    expected = f"sha256={sign_payload(secret_key, timestamp, body)}"
+    return hmac.compare_digest(expected, signature)
+
+
+class WebhookURLRejected(ValueError):
+    """رابط webhook غير مقبول (يُحوَّل إلى 400)"""
+
+
+def _host_allowed(host: str, allowed_hosts: Tuple[str, ...]) -> bool:
+    for allowed in allowed_hosts:
+        if allowed.startswith("."):
+            if host == allowed[1:] or host.endswith(allowed):
+                return True
+        elif host == allowed:
+            return True
+    return False
+
+
+def check_webhook_url(url: str, allowed_hosts: Tuple[str, ...] = ()) -> str:
+    """التحقق من رابط webhook يسجله العميل قبل حفظه؛ يُرجع الرابط أو يرفع WebhookURLRejected
+
+    الخادم هو من يرسل الطلب، فرابط يشير إلى الشبكة الداخلية (localhost،
+    169.254.169.254، 10.x...) يجعله وسيطاً إليها (SSRF). مع allowed_hosts
+    يُقبل المضيفون المدرجون فقط؛ بدونها يُحلل الاسم وتُرفض العناوين غير العامة.
+    الاستدعاء يحلل DNS فيُنفذ خارج حلقة الأحداث.
+    """
+    try:
+        resolve_webhook_url(url, allowed_hosts)
+    except socket.gaierror:
+        raise WebhookURLRejected("تعذر تحليل مضيف webhook")
+    return url
+
+
+def resolve_webhook_url(url: str, allowed_hosts: Tuple[str, ...] = ()) -> Optional[str]:
+    """تحقق check_webhook_url مع إرجاع العنوان العام الذي يُتصل به
+
+    None مع allowed_hosts (الاتصال بالاسم المدرج نفسه). فشل تحليل DNS يُرفع
+    socket.gaierror ليميزه المرسل عن الرفض (خطأ مؤقت يُعاد بعده).
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise WebhookURLRejected("رابط webhook غير صالح (يجب أن يبدأ بـ http أو https)")
+    host = parsed.hostname.lower()
+
+    if allowed_hosts:
+        if not _host_allowed(host, allowed_hosts):
+            raise WebhookURLRejected("مضيف webhook غير مسموح")
+        return None
+
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        raise WebhookURLRejected("رابط webhook غير صالح (منفذ غير صحيح)")
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except ValueError:
+        raise WebhookURLRejected("تعذر تحليل مضيف webhook")
+
+    public = []
+    for _, _, _, _, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise WebhookURLRejected("رابط webhook يشير إلى عنوان داخلي غير مسموح")
+        public.append(str(address))
+    if not public:
+        raise socket.gaierror("no addresses")
+    return public[0]
+
+
+class WebhookOutbox:
+    """صندوق الإرسال الدائم لإشعارات webhook في جدول webhook_deliveries
+
+    الإشعار يُحفظ قبل إرساله ويبقى pending حتى يُستلم أو تنفد المحاولات،
+    فلا تضيع الإشعارات عند إعادة التشغيل. الحجز يؤجل next_attempt_at بمدة
+    الإيجار، فإشعار انقطع إرساله يعود مستحقاً بعد انتهائها.
+    """
+
+    def add(self, analysis_id: str, event: str, url: str, payload: Dict[str, Any]) -> str:
+        """حفظ إشعار جديد للإرسال"""
+        delivery_id = str(uuid.uuid4())
+        now = datetime.now()
+        with get_db_session() as db:
+            db.add(WebhookDelivery(
+                id=delivery_id,
+                analysis_id=analysis_id,
+                event=event,
+                url=url,
+                payload=payload,
+                status="pending",
+                attempts=0,
+                next_attempt_at=now,
+                created_at=now
+            ))
+        return delivery_id
+
+    def claim_due(self, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """حجز الإشعارات المستحقة حتى limit إشعاراً"""
+        now = datetime.now()
+        lease_until = now + timedelta(seconds=lease_seconds)
+        claimed = []
+        with get_db_session() as db:
+            due = db.query(WebhookDelivery).filter(
+                WebhookDelivery.status == "pending",
+                WebhookDelivery.next_attempt_at <= now
+            ).order_by(WebhookDelivery.next_attempt_at).limit(limit).all()
+
+            for delivery in due:
+                # تحديث شرطي: عملية أخرى على القاعدة نفسها قد تحجزه أولاً
+                leased = db.query(WebhookDelivery).filter(
+                    WebhookDelivery.id == delivery.id,
+                    WebhookDelivery.status == "pending",
+                    WebhookDelivery.next_attempt_at == delivery.next_attempt_at
+                ).update({
+                    WebhookDelivery.next_attempt_at: lease_until,
+                    WebhookDelivery.attempts: WebhookDelivery.attempts + 1
+                }, synchronize_session=False)
+                if leased:
+                    claimed.append({
+                        "id": delivery.id,
+                        "analysis_id": delivery.analysis_id,
+                        "event": delivery.event,
+                        "url": delivery.url,
+                        "payload": delivery.payload,
+                        "attempts": (delivery.attempts or 0) + 1
+                    })
+        return claimed
+
+    def record_attempt(self, delivery_id: str, error: Optional[str], retry_in: Optional[float]):
+        """تسجيل نتيجة محاولة: استلام، أو إعادة بعد retry_in ثانية، أو فشل نهائي"""
+        now = datetime.now()
+        if error is None:
+            values = {
+                WebhookDelivery.status: "delivered",
+                WebhookDelivery.delivered_at: now,
+                WebhookDelivery.last_error: None
+            }
+        elif retry_in is not None:
+            values = {
+                WebhookDelivery.next_attempt_at: now + timedelta(seconds=retry_in),
+                WebhookDelivery.last_error: error
+            }
+        else:
+            values = {
+                WebhookDelivery.status: "failed",
+                WebhookDelivery.last_error: error
+            }
+        with get_db_session() as db:
+            db.query(WebhookDelivery).filter(
+                WebhookDelivery.id == delivery_id
+            ).update(values, synchronize_session=False)
+
+    def counts(self) -> Dict[str, int]:
+        """عدد الإشعارات في كل حالة"""
+        with get_db_session() as db:
+            rows = db.query(WebhookDelivery.status, func.count(WebhookDelivery.id)).group_by(
+                WebhookDelivery.status
+            ).all()
+            return {status: count for status, count in rows}
+
+
+class WebhookDispatcher:
+    """إرسال إشعارات انتهاء التحليل من صندوق الإرسال
+
+    - عميل httpx.AsyncClient واحد لكل عملية (تجمع اتصالات keep-alive)،
+      وعدد الإرسالات المتزامنة لا يتجاوز max_concurrency.
+    - كل طلب موقّع بـ HMAC-SHA256 باستخدام secret_key في ترويسة
+      X-Webhook-Signature (انظر verify_signature).
+    - أخطاء الشبكة و5xx و408/425/429 يُعاد إرسالها بتأخير أسي مع تشويش
+      (يُحترم Retry-After) حتى max_attempts محاولات؛ بقية 4xx فشل نهائي.
+    - التسليم مرة واحدة على الأقل: المستقبل يميّز التكرار بـ X-Webhook-Id.
+    - روابط العملاء يُعاد التحقق منها قبل كل محاولة (قد يتغير DNS بعد
+      التسجيل)، والاتصال بالعنوان المتحقق منه مع Host/SNI الأصليين؛ الرفض
+      فشل نهائي. default_url من الإعدادات فلا يُتحقق منه.
+    """
+
+    def __init__(self, outbox: WebhookOutbox, secret_key: str, default_url: Optional[str] = None,
+                 timeout: float = 10.0, max_concurrency: int = 8, max_attempts: int = 8,
+                 backoff_base: float = 2.0, backoff_max: float = 600.0, poll_interval: float = 1.0,
+                 allowed_hosts: Tuple[str, ...] = ()):
+        self.outbox = outbox
+        self.secret_key = secret_key
+        self.default_url = default_url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.allowed_hosts = allowed_hosts
+        # الإشعار المحجوز يعود مستحقاً إن توقفت العملية أثناء إرساله
+        self.lease_seconds = timeout + 30.0
+
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def start(self):
+        """إنشاء تجمع الاتصالات وبدء حلقة الإرسال (تستأنف الإشعارات المعلقة)"""
+        if not HTTPX_AVAILABLE:
+            logger.warning("httpx غير متوفر - لن تُرسل إشعارات webhook")
+            return
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            ),
+            headers={"User-Agent": "SpermAnalyzerAI-Webhook/1.0"}
+        )
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف الإرسال وإغلاق الاتصالات (الإشعارات غير المرسلة تبقى في الصندوق)"""
+        tasks = [task for task in [self._task, *self._in_flight] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def notify(self):
+        """إيقاظ حلقة الإرسال عند إضافة إشعار"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def publish(self, job: Dict[str, Any], data: Optional[Dict[str, Any]] = None,
+                      event: Optional[str] = None) -> Optional[str]:
+        """حفظ إشعار انتهاء مهمة (أو event مثل PROVISIONAL_EVENT) في الصندوق
+
+        None إن لم يكن للمهمة رابط أو لم تنتهِ.
+        """
+        event = event or STATUS_EVENTS.get(job['status'])
+        url = job.get('webhook_url') or self.default_url
+        if event is None or not url:
+            return None
+
+        analysis_id = job['analysis_id']
+        result_url = f"/api/v1/results/{analysis_id}"
+        if event == PROVISIONAL_EVENT:
+            result_url += "/provisional"
+        payload = {
+            "event": event,
+            "analysis_id": analysis_id,
+            "status": job['status'],
+            "occurred_at": datetime.now().isoformat(),
+            "result_url": result_url,
+            "error": job.get('error_message'),
+            "data": data
+        }
+        delivery_id = await asyncio.to_thread(self.outbox.add, analysis_id, event, url, payload)
+        self.notify()
+        return delivery_id
+
+    async def _run(self):
+        while True:
+            free = self.max_concurrency - len(self._in_flight)
+            deliveries = []
+            if free > 0:
+                try:
+                    deliveries = await asyncio.to_thread(self.outbox.claim_due, free, self.lease_seconds)
+                except Exception as e:
+                    logger.error(f"خطأ في قراءة صندوق إشعارات webhook: {e}")
+
+            for delivery in deliveries:
+                task = asyncio.create_task(self._deliver(delivery))
+                self._in_flight.add(task)
+                task.add_done_callback(self._delivery_done)
+
+            if not deliveries:
+                await self._wait_for_work()
+
+    def _delivery_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self.notify()
+
+    async def _wait_for_work(self):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _deliver(self, delivery: Dict[str, Any]):
+        body = json.dumps(delivery['payload'], ensure_ascii=False, default=str).encode("utf-8")
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Webhook-Id": delivery['id'],
+            "X-Webhook-Event": delivery['event'],
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Signature": f"sha256={sign_payload(self.secret_key, timestamp, body)}"
+        }
+
+        retry_after = None
+        try:
+            url, extensions = await self._target(delivery['url'], headers)
+            response = await self._client.post(url, content=body, headers=headers, extensions=extensions)
+            if response.is_success:
+                error, retryable = None, False
+            else:
+                error = f"HTTP {response.status_code}"
+                retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUS_CODES
+                retry_after = self._retry_after(response)
+        except WebhookURLRejected as e:
+            error, retryable = f"رابط مرفوض: {e}", False
+        except socket.gaierror as e:
+            error, retryable = f"DNS: {e}", True
+        except httpx.HTTPError as e:
+            error, retryable = f"{type(e).__name__}: {e}", True
+
+        retry_in = None
+        if error is not None and retryable and delivery['attempts'] < self.max_attempts:
+            retry_in = self._backoff(delivery['attempts'], retry_after)
+
+        if error is None:
+            logger.info(f"أُرسل إشعار {delivery['event']} للتحليل {delivery['analysis_id']}")
+        elif retry_in is None:
+            logger.warning(f"فشل إشعار {delivery['id']} نهائياً بعد {delivery['attempts']} محاولات: {error}")
+
+        try:
+            await asyncio.to_thread(self.outbox.record_attempt, delivery['id'], error, retry_in)
+        except Exception as e:
+            logger.error(f"خطأ في تسجيل محاولة إشعار {delivery['id']}: {e}")
+
+    async def _target(self, url: str, headers: Dict[str, str]) -> Tuple[Any, Dict[str, Any]]:
+        """الرابط المتصل به وامتدادات الطلب بعد إعادة التحقق من رابط العميل
+
+        الاتصال بالعنوان الذي تحقق منه resolve_webhook_url نفسه (لا تحليل DNS
+        ثانٍ يمكن تبديله بعنوان داخلي)، مع ترويسة Host وSNI للاسم الأصلي
+        فيبقى التحقق من شهادة TLS على اسم المضيف.
+        """
+        if url == self.default_url:
+            return url, {}
+        address = await asyncio.to_thread(resolve_webhook_url, url, self.allowed_hosts)
+        if address is None:
+            return url, {}
+        original = httpx.URL(url)
+        headers["Host"] = original.netloc.decode("ascii")
+        return original.copy_with(host=address), {"sni_hostname": original.host}
+
+    def _backoff(self, attempts: int, retry_after: Optional[float] = None) -> float:
+        """تأخير أسي مع تشويش (نصف المدة على الأقل) لتفادي تزامن الإعادات"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.5, 1.0)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
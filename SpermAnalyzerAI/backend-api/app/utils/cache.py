@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """ذاكرة تخزين مؤقت محدودة الحجم والمدة
+
+    كل عنصر تنتهي صلاحيته بعد ttl ثانية من آخر كتابة، وعند بلوغ max_size
+    يُخرج الأقل استخداماً (LRU). القراءة تنقل العنصر إلى آخر الترتيب دون
+    تمديد صلاحيته. آمنة للاستخدام من عدة خيوط، وتحصي الإصابات والإخفاقات
+    والعناصر المخرجة أو المنتهية لمراقبة ملاءمة الحجم والمدة.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._clock = clock
+        # المفتاح -> (القيمة، وقت انتهاء الصلاحية)
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """القيمة المخزنة أو default إن لم توجد أو انتهت صلاحيتها"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        """تخزين قيمة (تجديد صلاحيتها إن وُجدت) وإخراج الأقدم عند امتلاء الذاكرة"""
+        with self._lock:
+            self._data[key] = (value, self._clock() + self.ttl if self.ttl > 0 else float("inf"))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """حذف عنصر وإرجاع قيمته"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[0] if entry is not None else default
+
+    def purge_expired(self) -> int:
+        """حذف جميع العناصر المنتهية؛ يُرجع عددها"""
+        now = self._clock()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+            self.expirations += len(expired)
+            return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > self._clock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """عدادات الذاكرة المؤقتة"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -39,10 +39,66 @@ class Settings(BaseSettings):
     max_track_age: int = Field(default=30, env="MAX_TRACK_AGE")
     min_track_length: int = Field(default=5, env="MIN_TRACK_LENGTH")
     track_initialization: int = Field(default=3, env="TRACK_INIT")
+    track_smoothing_window: int = Field(default=5, env="TRACK_SMOOTHING_WINDOW")  # نقاط المتوسط المتحرك لـ VAP
+    track_spill_enabled: bool = Field(default=True, env="TRACK_SPILL_ENABLED")  # نقل نقاط المسارات المنتهية إلى القرص
+    tracker_embedder: str = Field(default="motion", env="TRACKER_EMBEDDER")  # motion, batched, appearance
+    tracker_embedder_batch_size: int = Field(default=64, env="TRACKER_EMBEDDER_BATCH_SIZE")
+    greedy_max_distance: float = Field(default=30.0, env="GREEDY_MAX_DISTANCE")  # بكسل، للتتبع البسيط
+    track_chunk_size: int = Field(default=32, env="TRACK_CHUNK_SIZE")  # نقاط لكل دفعة في نواة CASA
+    use_numba: bool = Field(default=False, env="USE_NUMBA")  # نوى JIT اختيارية للتتبع و CASA
+    detect_interval: int = Field(default=1, env="DETECT_INTERVAL")  # تشغيل الكاشف كل N إطار (1 = كل إطار)
+    flow_downscale: float = Field(default=0.5, env="FLOW_DOWNSCALE")  # تصغير الإطار قبل التدفق البصري
+    flow_window_size: int = Field(default=15, env="FLOW_WINDOW_SIZE")  # نافذة Lucas-Kanade بالبكسل
+    flow_pyramid_levels: int = Field(default=2, env="FLOW_PYRAMID_LEVELS")
     
     # إعدادات التحليل
     pixel_to_micron_ratio: float = Field(default=0.5, env="PIXEL_TO_MICRON_RATIO")
     analysis_timeout: int = Field(default=300, env="ANALYSIS_TIMEOUT")  # 5 minutes
+    casa_window_seconds: int = Field(default=1, env="CASA_WINDOW_SECONDS")  # عرض نافذة السلاسل الزمنية
+    motile_vcl_threshold: float = Field(default=5.0, env="MOTILE_VCL_THRESHOLD")  # μm/s
+    checkpoint_enabled: bool = Field(default=True, env="CHECKPOINT_ENABLED")  # نقاط استئناف تحليل الفيديو
+    checkpoint_interval: int = Field(default=30, env="CHECKPOINT_INTERVAL")  # ثواني بين نقطتي استئناف
+    progress_min_delta: float = Field(default=0.01, env="PROGRESS_MIN_DELTA")  # أصغر تغيير في التقدم يُنشر
+    progress_min_interval: float = Field(default=1.0, env="PROGRESS_MIN_INTERVAL")  # ثواني بين تحديثين للتقدم
+    progress_eta_smoothing: float = Field(default=0.3, env="PROGRESS_ETA_SMOOTHING")  # وزن أحدث عينة لمعدل الإطارات
+    preview_enabled: bool = Field(default=True, env="PREVIEW_ENABLED")  # نتيجة أولية للفيديو قبل التحليل الكامل
+    preview_seconds: float = Field(default=2.0, env="PREVIEW_SECONDS")  # ثواني الفيديو في النتيجة الأولية
+    preview_detect_interval: int = Field(default=3, env="PREVIEW_DETECT_INTERVAL")  # الكاشف كل N إطار في النتيجة الأولية
+    
+    # إعدادات طابور التحليل
+    queue_backend: str = Field(default="sqlite", env="QUEUE_BACKEND")  # sqlite (عقدة واحدة) أو redis (عدة عقد)
+    redis_url: str = Field(default="redis://localhost:6379/0", env="REDIS_URL")
+    redis_queue_prefix: str = Field(default="sperm-analyzer", env="REDIS_QUEUE_PREFIX")
+    queue_result_ttl: int = Field(default=7*24*3600, env="QUEUE_RESULT_TTL")  # ثواني حفظ المهام المنتهية في redis
+    worker_enabled: bool = Field(default=True, env="WORKER_ENABLED")  # false لعقد API بدون عامل تحليل
+    worker_concurrency: int = Field(default=2, env="WORKER_CONCURRENCY")  # تحليلات متزامنة لكل عملية
+    queue_poll_interval: float = Field(default=2.0, env="QUEUE_POLL_INTERVAL")  # ثواني
+    job_heartbeat_interval: int = Field(default=10, env="JOB_HEARTBEAT_INTERVAL")  # ثواني
+    progress_flush_interval: float = Field(default=1.0, env="PROGRESS_FLUSH_INTERVAL")  # ثواني بين دفعتي كتابة التقدم في الطابور المشترك
+    job_stale_timeout: int = Field(default=120, env="JOB_STALE_TIMEOUT")  # ثواني بدون نبض قبل إعادة المهمة
+    job_max_attempts: int = Field(default=3, env="JOB_MAX_ATTEMPTS")
+    max_concurrent_videos: int = Field(default=2, env="MAX_CONCURRENT_VIDEOS")  # حد عام لكل نوع عبر جميع العمليات
+    max_concurrent_images: int = Field(default=4, env="MAX_CONCURRENT_IMAGES")
+    max_queued_analyses: int = Field(default=100, env="MAX_QUEUED_ANALYSES")  # حد طابور الانتظار
+    analysis_memory_budget_mb: int = Field(default=3072, env="ANALYSIS_MEMORY_BUDGET_MB")  # من حد الحاوية 4GB
+    admission_retry_after: int = Field(default=30, env="ADMISSION_RETRY_AFTER")  # ثواني عند امتلاء الطابور
+    scheduler_aging_rate: float = Field(default=1.0, env="SCHEDULER_AGING_RATE")  # ثواني كلفة تُخصم لكل ثانية انتظار
+    priority_class_seconds: float = Field(default=60.0, env="PRIORITY_CLASS_SECONDS")  # إزاحة كل فئة أولوية
+    worker_interactive_slots: int = Field(default=1, env="WORKER_INTERACTIVE_SLOTS")  # خانات للطلبات التفاعلية فقط
+    
+    # إعدادات بث التقدم (SSE)
+    progress_stream_min_delta: float = Field(default=0.01, env="PROGRESS_STREAM_MIN_DELTA")  # أصغر تغيير يُرسل
+    progress_stream_min_interval: float = Field(default=0.5, env="PROGRESS_STREAM_MIN_INTERVAL")  # ثواني بين تحديثين للتحليل نفسه
+    progress_stream_poll_interval: float = Field(default=2.0, env="PROGRESS_STREAM_POLL_INTERVAL")  # قراءة الطابور للتحليلات في عقد أخرى
+    progress_stream_keepalive: float = Field(default=15.0, env="PROGRESS_STREAM_KEEPALIVE")  # ثواني
+    progress_stream_max_ids: int = Field(default=100, env="PROGRESS_STREAM_MAX_IDS")  # تحليلات لكل اتصال
+    progress_bulk_max_ids: int = Field(default=500, env="PROGRESS_BULK_MAX_IDS")  # تحليلات لكل طلب تقدم مجمع
+    
+    # إعدادات التحليل المباشر (WebSocket)
+    live_max_sessions: int = Field(default=4, env="LIVE_MAX_SESSIONS")  # جلسات متزامنة لكل عملية
+    live_update_interval: float = Field(default=0.3, env="LIVE_UPDATE_INTERVAL")  # ثواني بين تقديرين
+    live_window_seconds: float = Field(default=10.0, env="LIVE_WINDOW_SECONDS")  # نافذة التقدير المتجدد
+    live_max_frame_size: int = Field(default=2*1024*1024, env="LIVE_MAX_FRAME_SIZE")  # بايت لكل إطار مضغوط
     
     # إعدادات الأمان
     secret_key: str = Field(default="your-secret-key-change-in-production", env="SECRET_KEY")
@@ -63,6 +119,12 @@ class Settings(BaseSettings):
     # إعدادات التخزين المؤقت
     cache_ttl: int = Field(default=3600, env="CACHE_TTL")  # 1 hour
     cache_max_size: int = Field(default=1000, env="CACHE_MAX_SIZE")
+    result_cache_max_size: int = Field(default=64, env="RESULT_CACHE_MAX_SIZE")  # نتائج محللة في الذاكرة (قد تشمل بيانات التتبع)
+    
+    # إعدادات ضغط الاستجابات (gzip/br) للنتائج والتصدير
+    response_compression_min_size: int = Field(default=1024, env="RESPONSE_COMPRESSION_MIN_SIZE")  # بايت؛ الأصغر يُرسل دون ضغط
+    response_gzip_level: int = Field(default=6, env="RESPONSE_GZIP_LEVEL")  # 1-9
+    response_brotli_quality: int = Field(default=5, env="RESPONSE_BROTLI_QUALITY")  # 0-11 (يتطلب حزمة brotli)
     
     # إعدادات التنظيف التلقائي
     auto_cleanup_enabled: bool = Field(default=True, env="AUTO_CLEANUP_ENABLED")
@@ -76,7 +138,15 @@ class Settings(BaseSettings):
     
     # إعدادات الإشعارات
     notifications_enabled: bool = Field(default=False, env="NOTIFICATIONS_ENABLED")
-    webhook_url: Optional[str] = Field(default=None, env="WEBHOOK_URL")
+    webhook_url: Optional[str] = Field(default=None, env="WEBHOOK_URL")  # رابط افتراضي لجميع التحليلات
+    webhook_timeout: float = Field(default=10.0, env="WEBHOOK_TIMEOUT")  # ثواني لكل محاولة
+    webhook_max_concurrency: int = Field(default=8, env="WEBHOOK_MAX_CONCURRENCY")  # إرسالات متزامنة
+    webhook_max_attempts: int = Field(default=8, env="WEBHOOK_MAX_ATTEMPTS")
+    webhook_backoff_base: float = Field(default=2.0, env="WEBHOOK_BACKOFF_BASE")  # ثواني قبل إعادة المحاولة الأولى
+    webhook_backoff_max: float = Field(default=600.0, env="WEBHOOK_BACKOFF_MAX")  # حد التأخير بين المحاولات
+    # مضيفو روابط webhook المسموحون (مفصولون بفواصل، ".example.com" يشمل النطاقات الفرعية)؛
+    # بدونها تُقبل المضيفات ذات العناوين العامة فقط
+    webhook_allowed_hosts: str = Field(default="", env="WEBHOOK_ALLOWED_HOSTS")
     email_notifications: bool = Field(default=False, env="EMAIL_NOTIFICATIONS")
     
     # إعدادات SMTP (للإشعارات عبر البريد الإلكتروني)
@@ -175,7 +245,18 @@ class Settings(BaseSettings):
         return {
             "max_age": self.max_track_age,
             "n_init": self.track_initialization,
-            "min_track_length": self.min_track_length
+            "min_track_length": self.min_track_length,
+            "smoothing_window": self.track_smoothing_window,
+            "spill_tracks": self.track_spill_enabled,
+            "embedder": self.tracker_embedder,
+            "embedder_batch_size": self.tracker_embedder_batch_size,
+            "embedder_gpu": self.use_gpu,
+            "greedy_max_distance": self.greedy_max_distance,
+            "chunk_size": self.track_chunk_size,
+            "detect_interval": max(1, self.detect_interval),
+            "flow_downscale": self.flow_downscale,
+            "flow_window_size": self.flow_window_size,
+            "flow_pyramid_levels": self.flow_pyramid_levels
         }
     
     def get_analysis_config(self) -> dict:
@@ -184,7 +265,97 @@ class Settings(BaseSettings):
             "timeout": self.analysis_timeout,
             "pixel_to_micron_ratio": self.pixel_to_micron_ratio,
             "confidence_threshold": self.confidence_threshold,
-            "nms_threshold": self.nms_threshold
+            "nms_threshold": self.nms_threshold,
+            "window_seconds": self.casa_window_seconds,
+            "motile_vcl_threshold": self.motile_vcl_threshold,
+            "checkpoint_enabled": self.checkpoint_enabled,
+            "checkpoint_interval": self.checkpoint_interval,
+            "checkpoint_directory": os.path.join(self.results_directory, "checkpoints"),
+            "progress_min_delta": self.progress_min_delta,
+            "progress_min_interval": self.progress_min_interval,
+            "eta_smoothing": min(1.0, max(0.01, self.progress_eta_smoothing)),
+            "preview_enabled": self.preview_enabled,
+            "preview_seconds": self.preview_seconds,
+            "preview_detect_interval": max(1, self.preview_detect_interval),
+            "provisional_directory": os.path.join(self.results_directory, "provisional")
+        }
+    
+    def get_queue_config(self) -> dict:
+        """إعدادات طابور التحليل"""
+        return {
+            "backend": self.queue_backend.lower(),
+            "redis_url": self.redis_url,
+            "redis_prefix": self.redis_queue_prefix,
+            "result_ttl": self.queue_result_ttl,
+            "worker_enabled": self.worker_enabled,
+            "concurrency": max(1, self.worker_concurrency),
+            "poll_interval": self.queue_poll_interval,
+            "heartbeat_interval": self.job_heartbeat_interval,
+            "progress_flush_interval": max(0.1, self.progress_flush_interval),
+            "stale_timeout": self.job_stale_timeout,
+            "max_attempts": self.job_max_attempts,
+            "type_limits": {
+                "video": max(1, self.max_concurrent_videos),
+                "image": max(1, self.max_concurrent_images)
+            },
+            "max_queued": self.max_queued_analyses,
+            "memory_budget_mb": self.analysis_memory_budget_mb,
+            "retry_after": self.admission_retry_after,
+            "rate_limit": self.api_rate_limit,
+            "aging_rate": self.scheduler_aging_rate,
+            "class_seconds": self.priority_class_seconds,
+            "interactive_slots": max(0, self.worker_interactive_slots)
+        }
+    
+    def get_cache_config(self) -> dict:
+        """إعدادات التخزين المؤقت"""
+        return {
+            "ttl": self.cache_ttl,
+            "max_size": max(1, self.cache_max_size),
+            "result_max_size": max(1, self.result_cache_max_size)
+        }
+    
+    def get_response_config(self) -> dict:
+        """إعدادات ضغط الاستجابات"""
+        return {
+            "compression_min_size": max(0, self.response_compression_min_size),
+            "gzip_level": min(9, max(1, self.response_gzip_level)),
+            "brotli_quality": min(11, max(0, self.response_brotli_quality))
+        }
+    
+    def get_progress_stream_config(self) -> dict:
+        """إعدادات بث التقدم"""
+        return {
+            "min_delta": self.progress_stream_min_delta,
+            "min_interval": self.progress_stream_min_interval,
+            "poll_interval": self.progress_stream_poll_interval,
+            "keepalive": self.progress_stream_keepalive,
+            "max_ids": max(1, self.progress_stream_max_ids),
+            "bulk_max_ids": max(1, self.progress_bulk_max_ids)
+        }
+    
+    def get_live_config(self) -> dict:
+        """إعدادات التحليل المباشر"""
+        return {
+            "max_sessions": max(1, self.live_max_sessions),
+            "update_interval": self.live_update_interval,
+            "window_seconds": self.live_window_seconds,
+            "max_frame_size": self.live_max_frame_size
+        }
+    
+    def get_webhook_config(self) -> dict:
+        """إعدادات إشعارات webhook"""
+        return {
+            "default_url": self.webhook_url,
+            "secret_key": self.secret_key,
+            "timeout": self.webhook_timeout,
+            "max_concurrency": max(1, self.webhook_max_concurrency),
+            "max_attempts": max(1, self.webhook_max_attempts),
+            "backoff_base": self.webhook_backoff_base,
+            "backoff_max": self.webhook_backoff_max,
+            "allowed_hosts": tuple(
+                host.strip().lower() for host in self.webhook_allowed_hosts.split(",") if host.strip()
+            )
         }
     
     def get_file_limits(self) -> dict:
@@ -115,7 +115,8 @@ async def validate_file(file: UploadFile) -> Dict[str, Any]:
             'size': file_size,
             'type': file_type,
             'extension': file_extension,
-            'hash': hashlib.md5(content).hexdigest()
+            'hash': hashlib.md5(content).hexdigest(),
+            'media': _media_properties(validation_result, file_type)
         }
         
     except Exception as e:
@@ -176,6 +177,19 @@ async def save_upload_file(file: UploadFile, analysis_id: str) -> str:
             detail="فشل في حفظ الملف"
         )
 
+def _media_properties(validation_result: Dict[str, Any], file_type: str) -> Dict[str, Any]:
+    """خصائص الوسائط من نتيجة التحقق (لتقدير كلفة التحليل)"""
+    if file_type in SUPPORTED_VIDEO_TYPES:
+        return validation_result.get('properties', {})
+    
+    dimensions = validation_result.get('dimensions', {})
+    return {
+        'frame_count': 1,
+        'fps': None,
+        'width': dimensions.get('width'),
+        'height': dimensions.get('height')
+    }
+
 async def _validate_file_integrity(content: bytes, file_type: str) -> Dict[str, Any]:
     """
     التحقق من سلامة الملف
@@ -0,0 +1,82 @@
+import gzip
+from typing import Optional
+
+# يتم استيرادها عند التوفر
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+IDENTITY = "identity"
+
+
+def available_encodings() -> tuple:
+    """ترميزات الضغط المدعومة بترتيب التفضيل"""
+    return ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """اختيار ترميز الضغط من ترويسة Accept-Encoding
+
+    يحترم قيم q (q=0 يعني الرفض) و"*"، وعند التساوي يُفضل br على gzip.
+    """
+    if not accept_encoding:
+        return IDENTITY
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = IDENTITY, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    """ضغط محتوى الاستجابة بالترميز المختار"""
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    if encoding == "gzip":
+        # mtime=0 ليكون الناتج ثابتاً لنفس المحتوى
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return body
+
+
+def entity_tag(version: str, encoding: str = IDENTITY) -> str:
+    """وسم ETag قوي للتمثيل؛ الترميز جزء منه لأن محتوى التمثيل المضغوط مختلف"""
+    if encoding == IDENTITY:
+        return f'"{version}"'
+    return f'"{version}-{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], version: str) -> bool:
+    """مقارنة If-None-Match (مقارنة ضعيفة كما تشترط RFC 9110) بجميع ترميزات الإصدار"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    accepted = {entity_tag(version)} | {entity_tag(version, encoding) for encoding in ("gzip", "br")}
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in accepted:
+            return True
+    return False
@@ -0,0 +1,105 @@
+# SpermAnalyzerAI - CASA kernel equivalence and timing
+"""
+مقارنة نوى NumPy و Numba (النتائج والزمن)
+
+الاستخدام (من مجلد backend-api):
+    python -m benchmarks.casa_kernels --tracks 200 --points 300
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services import casa_kernels
+
+
+def _random_tracks(tracks: int, points: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for _ in range(tracks):
+        headings = np.cumsum(rng.normal(0, 0.3, size=points))
+        xs = np.cumsum(2 * np.cos(headings)) + rng.normal(0, 1.5, size=points)
+        ys = np.cumsum(2 * np.sin(headings)) + rng.normal(0, 1.5, size=points)
+        yield xs, ys
+
+
+def _run_chunks(kernel, xs, ys, window: int, chunk: int):
+    """تمرير مسار كامل عبر النواة دفعة بعد دفعة كما يفعل TrackAccumulator"""
+    tail_x, tail_y = xs[:1], ys[:1]
+    state = (xs[0], ys[0], xs[0], ys[0], 0)
+    totals = np.zeros(4)
+    for start in range(1, len(xs), chunk):
+        cx, cy = xs[start:start + chunk], ys[start:start + chunk]
+        last_x, last_y, smooth_x, smooth_y, side = state
+        path, smooth, lateral, crossings, side, smooth_x, smooth_y = kernel(
+            cx, cy, tail_x, tail_y, window, last_x, last_y, smooth_x, smooth_y, side
+        )
+        totals += (path, smooth, lateral, crossings)
+        tail_x = np.concatenate((tail_x, cx))[-(window - 1):]
+        tail_y = np.concatenate((tail_y, cy))[-(window - 1):]
+        state = (cx[-1], cy[-1], smooth_x, smooth_y, side)
+    return totals
+
+
+def _compare(name, numpy_fn, numba_fn, cases):
+    max_diff = 0.0
+    timings = {}
+    for label, fn in (("numpy", numpy_fn), ("numba", numba_fn)):
+        start = time.perf_counter()
+        outputs = [fn(*case) for case in cases]
+        timings[label] = (time.perf_counter() - start) * 1000
+        if label == "numpy":
+            reference = outputs
+        else:
+            for expected, actual in zip(reference, outputs):
+                if isinstance(expected, tuple):
+                    for e, a in zip(expected, actual):
+                        if not np.array_equal(e, a):
+                            raise AssertionError(f"{name}: نتائج الربط مختلفة")
+                else:
+                    max_diff = max(max_diff, float(np.max(np.abs(expected - actual))))
+
+    print(
+        f"{name:>12}: numpy={timings['numpy']:8.1f} ms  numba={timings['numba']:8.1f} ms  "
+        f"max_abs_diff={max_diff:.2e}"
+    )
+    return max_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة نوى NumPy و Numba")
+    parser.add_argument("--tracks", type=int, default=200)
+    parser.add_argument("--points", type=int, default=300)
+    parser.add_argument("--window", type=int, default=5)
+    parser.add_argument("--chunk", type=int, default=32)
+    parser.add_argument("--detections", type=int, default=80)
+    args = parser.parse_args()
+
+    if not casa_kernels.NUMBA_AVAILABLE:
+        raise SystemExit("numba غير مثبت")
+
+    # تجميع مسبق حتى لا يُحسب زمن JIT ضمن القياس
+    casa_kernels._track_chunk_numba(np.ones(2), np.ones(2), np.ones(1), np.ones(1), 5, 0.0, 0.0, 0.0, 0.0, 0)
+    casa_kernels._greedy_match_numba(np.zeros((1, 2)), np.ones((1, 2)), 5.0)
+
+    track_cases = [(xs, ys, args.window, args.chunk) for xs, ys in _random_tracks(args.tracks, args.points)]
+    diff = _compare(
+        "track_chunk",
+        lambda xs, ys, w, c: _run_chunks(casa_kernels._track_chunk_numpy, xs, ys, w, c),
+        lambda xs, ys, w, c: _run_chunks(casa_kernels._track_chunk_numba, xs, ys, w, c),
+        track_cases
+    )
+
+    rng = np.random.default_rng(1)
+    match_cases = []
+    for _ in range(args.points):
+        previous = rng.uniform(0, 640, size=(args.detections, 2))
+        current = previous + rng.normal(0, 5, size=previous.shape)
+        match_cases.append((previous, current[rng.permutation(len(current))], 30.0))
+    _compare("greedy_match", casa_kernels._greedy_match_numpy, casa_kernels._greedy_match_numba, match_cases)
+
+    if diff > 1e-6:
+        raise SystemExit(f"فرق غير مقبول بين التنفيذين: {diff}")
+
+
+if __name__ == "__main__":
+    main()
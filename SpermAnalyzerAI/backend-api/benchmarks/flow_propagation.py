@@ -0,0 +1,82 @@
+# SpermAnalyzerAI - Optical-flow propagation benchmark
+"""
+قياس زمن ودقة نقل المسارات بالتدفق البصري بين الإطارات المفتاحية
+
+يولّد فيديو اصطناعياً لرؤوس متحركة، ويثبّت المواقع الحقيقية كل N إطار،
+ثم يقيس خطأ الموقع وزمن FlowPropagator في الإطارات البينية.
+
+الاستخدام (من مجلد backend-api):
+    python -m benchmarks.flow_propagation --frames 300 --sperm 200 --interval 4
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.services.flow_propagator import FlowPropagator
+
+
+def _synthetic_frames(frames: int, sperm: int, width: int, height: int, seed: int = 0):
+    """إطارات اصطناعية مع المواقع الحقيقية للرؤوس"""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(90, 110, size=(height, width), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (0, 0), 3)
+    positions = rng.uniform([30, 30], [width - 30, height - 30], size=(sperm, 2))
+    headings = rng.uniform(0, 2 * np.pi, size=sperm)
+    speeds = rng.uniform(0.5, 4.0, size=sperm)
+
+    for _ in range(frames):
+        headings += rng.normal(0, 0.2, size=sperm)
+        positions[:, 0] += speeds * np.cos(headings)
+        positions[:, 1] += speeds * np.sin(headings)
+        positions = np.clip(positions, [15, 15], [width - 15, height - 15])
+
+        frame = background.copy()
+        for x, y in positions:
+            cv2.ellipse(frame, (int(round(x)), int(round(y))), (6, 4), 0, 0, 360, 230, -1)
+        yield cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR), positions.copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس نقل المسارات بالتدفق البصري")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--sperm", type=int, default=200)
+    parser.add_argument("--interval", type=int, default=4)
+    parser.add_argument("--downscale", type=float, default=0.5)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    propagator = FlowPropagator(downscale=args.downscale)
+    timings, errors = [], []
+    tracked = 0
+
+    for frame_idx, (frame, truth) in enumerate(
+        _synthetic_frames(args.frames, args.sperm, args.width, args.height)
+    ):
+        if frame_idx % args.interval == 0:
+            observations = [(str(i), x, y) for i, (x, y) in enumerate(truth)]
+            propagator.anchor(propagator.prepare(frame), observations)
+            continue
+
+        start = time.perf_counter()
+        observations = propagator.propagate(propagator.prepare(frame))
+        timings.append((time.perf_counter() - start) * 1000)
+
+        tracked += len(observations)
+        for track_id, x, y in observations:
+            tx, ty = truth[int(track_id)]
+            errors.append(np.hypot(x - tx, y - ty))
+
+    timings = np.array(timings)
+    errors = np.array(errors)
+    print(f"propagated frames: {len(timings)}  ({args.sperm} sperm, interval={args.interval})")
+    print(f"latency ms/frame : mean={timings.mean():.2f}  p50={np.percentile(timings, 50):.2f}  "
+          f"p95={np.percentile(timings, 95):.2f}")
+    print(f"position error px: mean={errors.mean():.2f}  p95={np.percentile(errors, 95):.2f}")
+    print(f"points kept      : {tracked / (len(timings) * args.sperm):.1%}")
+
+
+if __name__ == "__main__":
+    main()
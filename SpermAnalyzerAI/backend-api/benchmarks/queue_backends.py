@@ -0,0 +1,141 @@
+# SpermAnalyzerAI - Job queue backend benchmark
+"""
+التحقق من سلوك طابور Redis وقياس إنتاجيته مع عدد العقد
+
+يتحقق من الحجز الذري وحدود التزامن ومهلة الرؤية، ثم يشغّل N عاملاً
+متوازياً (خيوط تمثل عقد التحليل) كل منها يحجز مهمة وينتظر زمن تحليلها
+ويسجل اكتمالها، ويطبع الإنتاجية لكل عدد من العقد.
+
+الاستخدام (من مجلد backend-api):
+    python -m benchmarks.queue_backends --jobs 200 --workers 1 2 4 8
+    python -m benchmarks.queue_backends --redis-url redis://localhost:6379/15
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from app.models.analysis_models import (
+    AnalysisResult, CasaParameters, SpermMorphology
+)
+from app.services.redis_queue import RedisJobQueue
+
+IMAGE_MEDIA = {"frame_count": 1, "width": 640, "height": 480, "fps": None}
+
+
+def _client(url):
+    """خادم Redis حقيقي أو fakeredis داخل العملية"""
+    if url:
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def _result(analysis_id: str) -> AnalysisResult:
+    return AnalysisResult(
+        id=analysis_id, file_name="sample.png", file_size=1, analysis_date=datetime.now(),
+        sperm_count=10, motility=0.0, concentration=1.0,
+        casa_parameters=CasaParameters(vcl=0, vsl=0, vap=0, lin=0, str=0, wob=0, alh=0, bcf=0, mot=0),
+        morphology=SpermMorphology(normal=4, abnormal=96, head_defects=0, tail_defects=0, neck_defects=0),
+        velocity_distribution=[]
+    )
+
+
+def _queue(client, **kwargs) -> RedisJobQueue:
+    return RedisJobQueue(client, prefix=f"bench-{uuid.uuid4().hex[:8]}", **kwargs)
+
+
+def _enqueue(queue: RedisJobQueue, sample_path: str, jobs: int):
+    for _ in range(jobs):
+        analysis_id = uuid.uuid4().hex
+        queue.register_upload(analysis_id, sample_path, IMAGE_MEDIA)
+        queue.enqueue(analysis_id, sample_path)
+
+
+def check_semantics(client, sample_path: str):
+    """الحجز الذري وحدود النوع ومهلة الرؤية والإلغاء"""
+    queue = _queue(client, stale_timeout=1, max_attempts=2, type_limits={'image': 2, 'video': 1})
+    _enqueue(queue, sample_path, 4)
+
+    first, second = queue.claim("node-a"), queue.claim("node-b")
+    assert first and second and first['analysis_id'] != second['analysis_id']
+    assert queue.claim("node-c") is None, "تجاوز حد التزامن للصور"
+
+    # نبض node-a يمدد مهلتها، بينما تنتهي مهلة node-b
+    time.sleep(0.6)
+    queue.heartbeat("node-a", {first['analysis_id']: 0.5})
+    time.sleep(0.6)
+    assert queue.requeue_stale() == 1
+    assert queue.get(second['analysis_id'])['status'] == 'pending'
+    assert queue.get(first['analysis_id'])['status'] == 'processing'
+
+    assert queue.cancel(first['analysis_id']) == 'processing'
+    assert queue.heartbeat("node-a", {first['analysis_id']: 0.6}) == [first['analysis_id']]
+    assert not queue.complete(first['analysis_id'], _result(first['analysis_id']))
+
+    reclaimed = queue.claim("node-c")
+    assert reclaimed['analysis_id'] == second['analysis_id'] and reclaimed['attempts'] == 2
+    assert queue.release([reclaimed['analysis_id']], "node-c") == 1
+    assert queue.get(second['analysis_id'])['attempts'] == 1
+    print("semantics: ok")
+
+
+def run_throughput(client, sample_path: str, jobs: int, workers: int, job_seconds: float) -> float:
+    """إنتاجية N عقدة (مهمة/ثانية)"""
+    queue = _queue(client, max_queued=jobs, type_limits={'image': workers, 'video': 1})
+    _enqueue(queue, sample_path, jobs)
+    done = []
+    lock = threading.Lock()
+
+    def node(worker_id: str):
+        while True:
+            job = queue.claim(worker_id)
+            if job is None:
+                return
+            time.sleep(job_seconds)
+            queue.complete(job['analysis_id'], _result(job['analysis_id']))
+            with lock:
+                done.append(job['analysis_id'])
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=node, args=(f"node-{i}",)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    assert len(done) == len(set(done)) == jobs, "مهمة نُفذت مرتين أو لم تُنفذ"
+    return jobs / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس طابور Redis")
+    parser.add_argument("--redis-url", default=None, help="بدون قيمة: fakeredis")
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--job-seconds", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    client = _client(args.redis_url)
+    with tempfile.TemporaryDirectory() as directory:
+        sample_path = os.path.join(directory, "sample.png")
+        with open(sample_path, "wb") as f:
+            f.write(b"\0")
+
+        check_semantics(client, sample_path)
+
+        baseline = None
+        for workers in args.workers:
+            throughput = run_throughput(client, sample_path, args.jobs, workers, args.job_seconds)
+            baseline = baseline or throughput / workers
+            print(f"workers={workers:3d}  throughput={throughput:7.1f} jobs/s  "
+                  f"scaling={throughput / baseline:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
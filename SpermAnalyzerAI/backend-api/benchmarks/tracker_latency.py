@@ -0,0 +1,89 @@
+# SpermAnalyzerAI - Tracker latency benchmark
+"""
+قياس زمن تحديث المتتبع لكل إطار في أوضاع التضمين المختلفة
+
+الاستخدام (من مجلد backend-api):
+    python -m benchmarks.tracker_latency --frames 300 --sperm 60
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.sperm_analyzer import SpermAnalyzer, TRACKER_EMBEDDER_MODES, DEEPSORT_AVAILABLE
+
+
+def _synthetic_sequence(frames: int, sperm: int, width: int, height: int, seed: int = 0):
+    """كشوفات اصطناعية لحيوانات منوية تتحرك بمسارات متذبذبة"""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform([40, 40], [width - 40, height - 40], size=(sperm, 2))
+    headings = rng.uniform(0, 2 * np.pi, size=sperm)
+    speeds = rng.uniform(0.5, 4.0, size=sperm)
+
+    for frame_idx in range(frames):
+        headings += rng.normal(0, 0.2, size=sperm)
+        positions[:, 0] += speeds * np.cos(headings)
+        positions[:, 1] += speeds * np.sin(headings)
+        positions = np.clip(positions, [20, 20], [width - 20, height - 20])
+
+        detections = []
+        for x, y in positions:
+            x1, y1, x2, y2 = x - 15, y - 7, x + 15, y + 7
+            detections.append({
+                'bbox': [x1, y1, x2, y2],
+                'confidence': 0.9,
+                'class': 0,
+                'center': [x, y],
+                'area': 30 * 14
+            })
+        yield frame_idx, detections
+
+
+def run(frames: int, sperm: int, width: int, height: int, modes):
+    frame = np.random.default_rng(1).integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    results = {}
+
+    for mode in modes:
+        analyzer = SpermAnalyzer()
+        try:
+            tracker = analyzer._create_tracker(mode)
+        except Exception as e:
+            print(f"{mode:>10}: غير متاح ({e})")
+            continue
+        analyzer.tracking_config = dict(analyzer.tracking_config, embedder=mode)
+
+        latencies = []
+        for frame_idx, detections in _synthetic_sequence(frames, sperm, width, height):
+            start = time.perf_counter()
+            analyzer._update_tracks(tracker, detections, frame, frame_idx)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        latencies = np.array(latencies)
+        results[mode] = latencies
+        print(
+            f"{mode:>10}: mean={latencies.mean():7.2f} ms  "
+            f"p50={np.percentile(latencies, 50):7.2f} ms  "
+            f"p95={np.percentile(latencies, 95):7.2f} ms"
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس زمن المتتبع لكل إطار")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--sperm", type=int, default=60)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--modes", nargs="+", default=list(TRACKER_EMBEDDER_MODES),
+                        choices=TRACKER_EMBEDDER_MODES)
+    args = parser.parse_args()
+
+    if not DEEPSORT_AVAILABLE:
+        raise SystemExit("deep_sort_realtime غير مثبت")
+
+    run(args.frames, args.sperm, args.width, args.height, args.modes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# SpermAnalyzerAI - Webhook delivery benchmark
+"""
+التحقق من إرسال إشعارات webhook إلى مستقبل HTTP محلي وقياس زمنه
+
+يشغّل مستقبلاً محلياً يتحقق من توقيع HMAC ويرفض نسبة من الطلبات بـ 503،
+ثم يحفظ N إشعاراً في صندوق الإرسال ويقيس زمن تسليمها جميعاً بعد إعادة
+المحاولات. يُحفظ نصف الإشعارات قبل بدء المرسل للتحقق من استئناف
+الإشعارات المعلقة بعد إعادة التشغيل.
+
+الاستخدام (من مجلد backend-api):
+    python -m benchmarks.webhook_delivery --notifications 200 --fail-rate 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# قاعدة بيانات مؤقتة حتى لا يكتب القياس في قاعدة التطبيق
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/webhooks.db")
+
+from app.services.webhooks import WebhookDispatcher, WebhookOutbox, verify_signature  # noqa: E402
+
+SECRET_KEY = "benchmark-secret"
+
+
+class Receiver(BaseHTTPRequestHandler):
+    """مستقبل محلي يتحقق من التوقيع ويفشل عشوائياً"""
+    fail_rate = 0.0
+    received = {}
+    invalid = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        valid = verify_signature(
+            SECRET_KEY, self.headers["X-Webhook-Timestamp"], body, self.headers["X-Webhook-Signature"]
+        )
+        with self.lock:
+            if not valid:
+                Receiver.invalid += 1
+                status = 401
+            elif random.random() < self.fail_rate:
+                status = 503
+            else:
+                Receiver.received[self.headers["X-Webhook-Id"]] = body
+                status = 204
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+async def run(args, url: str):
+    outbox = WebhookOutbox()
+    job = {"status": "completed", "webhook_url": url, "error_message": None}
+
+    def dispatcher():
+        return WebhookDispatcher(
+            outbox, SECRET_KEY, max_concurrency=args.concurrency,
+            backoff_base=0.05, backoff_max=0.5, poll_interval=0.05
+        )
+
+    # إشعارات حُفظت قبل "إعادة التشغيل"
+    offline = dispatcher()
+    for i in range(args.notifications // 2):
+        await offline.publish(dict(job, analysis_id=f"offline-{i}"))
+
+    started = time.perf_counter()
+    online = dispatcher()
+    await online.start()
+    for i in range(args.notifications - args.notifications // 2):
+        await online.publish(dict(job, analysis_id=f"online-{i}"), {"sperm_count": i})
+
+    while outbox.counts().get("pending", 0) and time.perf_counter() - started < args.timeout:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await online.stop()
+    return outbox.counts(), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس إرسال إشعارات webhook")
+    parser.add_argument("--notifications", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    Receiver.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/hook"
+
+    counts, elapsed = asyncio.run(run(args, url))
+    server.shutdown()
+
+    print(f"outbox: {counts}")
+    print(f"received={len(Receiver.received)}  invalid_signatures={Receiver.invalid}  "
+          f"elapsed={elapsed:.2f}s  ({len(Receiver.received) / elapsed:.0f} deliveries/s)")
+    assert len(Receiver.received) == args.notifications, "إشعارات لم تُسلّم"
+    assert Receiver.invalid == 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# SpermAnalyzerAI - pytest configuration
+import os
+import tempfile
+
+# قاعدة بيانات مؤقتة لكل تشغيل: app.database ينشئ القاعدة عند الاستيراد
+_tmp_dir = tempfile.mkdtemp(prefix="sperm-analyzer-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}")
@@ -0,0 +1,195 @@
+# SpermAnalyzerAI - CASA kernel equivalence tests
+"""
+تطابق نوى CASA: مسار NumPy مقابل الحساب المرجعي نقطة بنقطة (التنفيذ
+السابق لـ TrackAccumulator)، ومسار Numba مقابل NumPy عند تثبيت numba.
+"""
+import math
+from collections import deque
+
+import numpy as np
+import pytest
+
+from app.services import casa_kernels
+from app.services.casa_accumulator import TrackAccumulator
+
+WINDOW = 5
+
+
+def _reference_track(xs, ys, window=WINDOW):
+    """الحساب السابق لكل نقطة: (طول المسار، المنعّم، الإزاحة الجانبية، العبور)"""
+    last_x, last_y = xs[0], ys[0]
+    points = deque([(xs[0], ys[0])], maxlen=window)
+    smooth_x, smooth_y = xs[0], ys[0]
+    path = smoothed = lateral = 0.0
+    crossings, last_side = 0, 0
+
+    for x, y in zip(xs[1:], ys[1:]):
+        path += math.hypot(x - last_x, y - last_y)
+        last_x, last_y = x, y
+
+        points.append((x, y))
+        avg_x = sum(p[0] for p in points) / len(points)
+        avg_y = sum(p[1] for p in points) / len(points)
+        dx, dy = avg_x - smooth_x, avg_y - smooth_y
+        step = math.hypot(dx, dy)
+        smoothed += step
+        smooth_x, smooth_y = avg_x, avg_y
+
+        cross = dx * (y - avg_y) - dy * (x - avg_x)
+        if step > 0:
+            lateral += abs(cross) / step
+        side = 1 if cross > 0 else (-1 if cross < 0 else 0)
+        if side != 0:
+            if last_side != 0 and side != last_side:
+                crossings += 1
+            last_side = side
+
+    return np.array([path, smoothed, lateral, crossings])
+
+
+def _run_chunks(kernel, xs, ys, window=WINDOW, chunk=7):
+    """تمرير المسار عبر النواة دفعة بعد دفعة كما يفعل TrackAccumulator.flush"""
+    tail_x, tail_y = xs[:1], ys[:1]
+    last_x, last_y, smooth_x, smooth_y, side = xs[0], ys[0], xs[0], ys[0], 0
+    totals = np.zeros(4)
+    for start in range(1, len(xs), chunk):
+        cx, cy = xs[start:start + chunk], ys[start:start + chunk]
+        path, smooth, lateral, crossings, side, smooth_x, smooth_y = kernel(
+            cx, cy, tail_x, tail_y, window, last_x, last_y, smooth_x, smooth_y, side
+        )
+        totals += (path, smooth, lateral, crossings)
+        tail_x = np.concatenate((tail_x, cx))[-(window - 1):]
+        tail_y = np.concatenate((tail_y, cy))[-(window - 1):]
+        last_x, last_y = cx[-1], cy[-1]
+    return totals
+
+
+def _random_track(rng, points):
+    headings = np.cumsum(rng.normal(0, 0.3, size=points))
+    xs = 100 + np.cumsum(2 * np.cos(headings)) + rng.normal(0, 1.5, size=points)
+    ys = 100 + np.cumsum(2 * np.sin(headings)) + rng.normal(0, 1.5, size=points)
+    return xs, ys
+
+
+def _edge_tracks():
+    with_gap_x = np.linspace(0, 50, 40)
+    with_gap_y = np.sin(np.linspace(0, 6, 40)) * 5
+    with_gap_x[10:14] = np.nan
+    with_gap_y[10:14] = np.nan
+    return {
+        "one_point": (np.array([3.0]), np.array([4.0])),
+        "two_points": (np.array([0.0, 3.0]), np.array([0.0, 4.0])),
+        "stationary": (np.full(30, 12.5), np.full(30, -7.0)),
+        "straight_line": (np.arange(30, dtype=float), np.arange(30, dtype=float) * 2),
+        "nan_gap": (with_gap_x, with_gap_y),
+    }
+
+
+def _tracks():
+    rng = np.random.default_rng(42)
+    cases = {f"random_{i}": _random_track(rng, int(rng.integers(2, 120))) for i in range(25)}
+    cases.update(_edge_tracks())
+    return cases
+
+
+TRACKS = _tracks()
+
+
+@pytest.mark.parametrize("name", sorted(TRACKS))
+def test_numpy_kernel_matches_reference(name):
+    xs, ys = TRACKS[name]
+    expected = _reference_track(xs, ys)
+    for chunk in (1, 7, 64):
+        actual = _run_chunks(casa_kernels._track_chunk_numpy, xs, ys, chunk=chunk)
+        np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize("name", sorted(TRACKS))
+def test_track_accumulator_matches_reference(name):
+    xs, ys = TRACKS[name]
+    track = TrackAccumulator("1", 0, xs[0], ys[0], smoothing_window=WINDOW, chunk_size=8)
+    for i, (x, y) in enumerate(zip(xs[1:], ys[1:]), start=1):
+        track.update(i, x, y)
+    track.flush()
+    actual = np.array([track.path_length, track.smoothed_length, track.lateral_sum, track.crossings])
+    np.testing.assert_allclose(actual, _reference_track(xs, ys), rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def test_numpy_kernel_empty_chunk_keeps_state():
+    empty = np.empty(0)
+    result = casa_kernels._track_chunk_numpy(empty, empty, np.ones(2), np.ones(2), WINDOW,
+                                             1.0, 2.0, 3.0, 4.0, -1)
+    assert result == (0.0, 0.0, 0.0, 0, -1, 3.0, 4.0)
+
+
+def _reference_greedy(previous, current, max_distance):
+    pairs = sorted(
+        (math.hypot(p[0] - c[0], p[1] - c[1]), r, c_idx)
+        for r, p in enumerate(previous) for c_idx, c in enumerate(current)
+    )
+    used_rows, used_cols, matches = set(), set(), []
+    for distance, row, col in pairs:
+        if distance > max_distance or row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matches.append((row, col))
+    return sorted(matches)
+
+
+def _match_cases():
+    rng = np.random.default_rng(7)
+    cases = []
+    for _ in range(20):
+        previous = rng.uniform(0, 200, size=(int(rng.integers(1, 30)), 2))
+        current = previous[rng.permutation(len(previous))] + rng.normal(0, 4, size=previous.shape)
+        cases.append((previous, current[: int(rng.integers(1, len(current) + 1))], 10.0))
+    empty = np.empty((0, 2))
+    cases += [
+        (empty, np.ones((3, 2)), 10.0),
+        (np.ones((3, 2)), empty, 10.0),
+        (np.zeros((2, 2)), np.full((2, 2), 100.0), 10.0),
+    ]
+    return cases
+
+
+MATCH_CASES = _match_cases()
+
+
+@pytest.mark.parametrize("case", range(len(MATCH_CASES)))
+def test_numpy_greedy_match_matches_reference(case):
+    previous, current, max_distance = MATCH_CASES[case]
+    rows, cols = casa_kernels._greedy_match_numpy(previous, current, max_distance)
+    assert sorted(zip(rows.tolist(), cols.tolist())) == _reference_greedy(previous, current, max_distance)
+
+
+@pytest.mark.skipif(not casa_kernels.NUMBA_AVAILABLE, reason="numba غير مثبت")
+class TestNumbaEquivalence:
+
+    @pytest.mark.parametrize("name", sorted(TRACKS))
+    def test_track_chunk(self, name):
+        xs, ys = TRACKS[name]
+        for chunk in (1, 7, 64):
+            expected = _run_chunks(casa_kernels._track_chunk_numpy, xs, ys, chunk=chunk)
+            actual = _run_chunks(casa_kernels._track_chunk_numba, xs, ys, chunk=chunk)
+            np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+    def test_track_chunk_empty(self):
+        empty = np.empty(0)
+        expected = casa_kernels._track_chunk_numpy(empty, empty, np.ones(2), np.ones(2), WINDOW,
+                                                   1.0, 2.0, 3.0, 4.0, -1)
+        actual = casa_kernels._track_chunk_numba(empty, empty, np.ones(2), np.ones(2), WINDOW,
+                                                 1.0, 2.0, 3.0, 4.0, -1)
+        assert tuple(actual) == expected
+
+    @pytest.mark.parametrize("case", range(len(MATCH_CASES)))
+    def test_greedy_match(self, case):
+        previous, current, max_distance = MATCH_CASES[case]
+        expected = casa_kernels._greedy_match_numpy(previous, current, max_distance)
+        actual = casa_kernels._greedy_match_numba(
+            np.ascontiguousarray(previous, dtype=np.float64),
+            np.ascontiguousarray(current, dtype=np.float64),
+            max_distance
+        )
+        for e, a in zip(expected, actual):
+            np.testing.assert_array_equal(e, a)
@@ -0,0 +1,238 @@
+# SpermAnalyzerAI - job queue contract tests
+"""
+عقد طابور التحليلات: الحالات نفسها لـ SQLiteJobQueue وRedisJobQueue
+(على fakeredis، وتُتخطى إن لم يكن مثبتاً مع lupa لسكربتات Lua).
+"""
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pytest
+
+from app.database import get_db_session, AnalysisRecord
+from app.models.analysis_models import (
+    AnalysisResult, AnalysisStatus, CasaParameters, SpermMorphology, VelocityDataPoint
+)
+from app.services.admission import AdmissionRejected
+from app.services.job_queue import SQLiteJobQueue
+from app.services.redis_queue import RedisJobQueue
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_queue(request):
+    """مصنع طوابير فارغة للتنفيذ المختار"""
+    if request.param == "sqlite":
+        with get_db_session() as db:
+            db.query(AnalysisRecord).delete()
+        return lambda **kwargs: SQLiteJobQueue(**kwargs)
+
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    return lambda **kwargs: RedisJobQueue(client, **kwargs)
+
+
+@pytest.fixture
+def queue(make_queue):
+    return make_queue(type_limits={'image': 10, 'video': 2})
+
+
+@pytest.fixture
+def image(tmp_path):
+    """مصنع صور مرفوعة بالأبعاد المطلوبة"""
+    def _image(analysis_id, width=100, height=100):
+        path = str(tmp_path / f"{analysis_id}.png")
+        cv2.imwrite(path, np.zeros((height, width, 3), np.uint8))
+        return path
+    return _image
+
+
+@pytest.fixture
+def video(tmp_path):
+    """مصنع مقاطع فيديو مرفوعة قصيرة"""
+    def _video(analysis_id, frames=10):
+        path = str(tmp_path / f"{analysis_id}.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 64))
+        for _ in range(frames):
+            writer.write(np.zeros((64, 64, 3), np.uint8))
+        writer.release()
+        return path
+    return _video
+
+
+def _result(analysis_id):
+    return AnalysisResult(
+        id=analysis_id,
+        file_name=f"{analysis_id}.png",
+        file_size=100,
+        analysis_date=datetime.now(),
+        sperm_count=12,
+        motility=55.0,
+        concentration=20.0,
+        casa_parameters=CasaParameters(
+            vcl=80.0, vsl=40.0, vap=55.0, lin=50.0, str=72.0, wob=68.0, alh=3.0, bcf=12.0, mot=55.0
+        ),
+        morphology=SpermMorphology(
+            normal=70.0, abnormal=30.0, head_defects=15.0, tail_defects=10.0, neck_defects=5.0
+        ),
+        velocity_distribution=[VelocityDataPoint(time_point=0, velocity=50.0)]
+    )
+
+
+def _claim_all(queue, worker_id="w1"):
+    claimed = []
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            return claimed
+        claimed.append(job['analysis_id'])
+
+
+def test_claim_orders_by_priority_class_then_cost(queue, image):
+    queue.enqueue("batch-small", image("batch-small"), "batch")
+    queue.enqueue("standard-large", image("standard-large", 1280, 960), "standard")
+    queue.enqueue("standard-small", image("standard-small"), "standard")
+    queue.enqueue("interactive", image("interactive"), "interactive")
+
+    assert _claim_all(queue) == ["interactive", "standard-small", "standard-large", "batch-small"]
+
+
+def test_claim_respects_type_limit_and_priorities(make_queue, image):
+    queue = make_queue(type_limits={'image': 1})
+    queue.enqueue("a", image("a"), "standard")
+    queue.enqueue("b", image("b"), "interactive")
+
+    assert queue.claim("w1", priorities=["batch"]) is None
+    job = queue.claim("w1")
+    assert job['analysis_id'] == "b"
+    assert job['status'] == AnalysisStatus.PROCESSING.value
+    assert job['attempts'] == 1
+    # حد الصور مشغول حتى تكتمل المهمة
+    assert queue.claim("w2") is None
+    assert queue.complete("b", _result("b"))
+    assert queue.claim("w2")['analysis_id'] == "a"
+
+
+def test_interactive_video_is_not_claimed_by_interactive_slot(queue, video):
+    job = queue.enqueue("v", video("v"), "interactive")
+    assert job['priority'] == "standard"
+
+    # خانات الصور التفاعلية لا تحجز الفيديو
+    assert queue.claim("w1", priorities=["interactive"]) is None
+    assert queue.claim("w1")['analysis_id'] == "v"
+
+
+def test_enqueue_rejects_when_queue_full(make_queue, image):
+    queue = make_queue(max_queued=1, retry_after=7)
+    queue.enqueue("a", image("a"))
+    # إعادة إدراج مهمة منتظرة لا تُحتسب مرة ثانية
+    assert queue.enqueue("a", image("a"))['status'] == AnalysisStatus.PENDING.value
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        queue.enqueue("b", image("b"))
+    assert rejected.value.retry_after == 7
+
+
+def test_cancel_while_running_is_reported_by_heartbeat(queue, image):
+    queue.enqueue("a", image("a"))
+    queue.enqueue("b", image("b"))
+    _claim_all(queue)
+
+    assert queue.cancel("a") == AnalysisStatus.PROCESSING.value
+    assert queue.heartbeat("w1", {"a": 0.4, "b": 0.5}) == ["a"]
+    assert queue.get("a")['status'] == AnalysisStatus.CANCELLED.value
+    assert queue.get("b")['progress'] == pytest.approx(0.5)
+    # التقدم التفصيلي لا يكتب فوق المهمة الملغاة
+    assert queue.publish_progress("w1", {
+        "a": {"progress": 0.6, "message": "x", "estimated_time_remaining": 3},
+        "b": {"progress": 0.6, "message": "y", "estimated_time_remaining": 2}
+    }) == 1
+    assert queue.cancel("a") is None
+
+
+def test_complete_returns_false_after_cancel(queue, image):
+    queue.enqueue("a", image("a"))
+    queue.claim("w1")
+    queue.cancel("a")
+
+    assert queue.complete("a", _result("a")) is False
+    job = queue.get("a")
+    assert job['status'] == AnalysisStatus.CANCELLED.value
+    assert job['progress'] < 1.0
+
+
+def test_complete_and_fail_only_apply_to_processing(queue, image):
+    queue.enqueue("a", image("a"))
+    assert queue.complete("a", _result("a")) is False
+
+    queue.claim("w1")
+    assert queue.complete("a", _result("a")) is True
+    assert queue.get("a")['status'] == AnalysisStatus.COMPLETED.value
+
+    queue.fail("a", "boom")
+    assert queue.get("a")['status'] == AnalysisStatus.COMPLETED.value
+    assert queue.cancel("a") is None
+
+
+def test_requeue_stale_until_max_attempts(make_queue, image):
+    queue = make_queue(stale_timeout=0, max_attempts=2)
+    queue.enqueue("a", image("a"))
+
+    assert queue.claim("w1")['attempts'] == 1
+    time.sleep(0.01)
+    assert queue.requeue_stale() == 1
+    assert queue.get("a")['status'] == AnalysisStatus.PENDING.value
+    # العامل المتوقف لم يعد يملك المهمة
+    assert queue.release(["a"], "w1") == 0
+
+    assert queue.claim("w2")['attempts'] == 2
+    time.sleep(0.01)
+    assert queue.requeue_stale() == 0
+    assert queue.get("a")['status'] == AnalysisStatus.FAILED.value
+    assert queue.claim("w3") is None
+
+
+def test_heartbeat_keeps_job_from_going_stale(make_queue, image):
+    queue = make_queue(stale_timeout=60)
+    queue.enqueue("a", image("a"))
+    queue.claim("w1")
+
+    assert queue.heartbeat("w1", {"a": 0.3}) == []
+    assert queue.requeue_stale() == 0
+    assert queue.get("a")['status'] == AnalysisStatus.PROCESSING.value
+
+
+def test_release_returns_jobs_without_counting_attempt(queue, image):
+    queue.enqueue("a", image("a"))
+    queue.enqueue("b", image("b"))
+    _claim_all(queue, "w1")
+
+    # مهام عامل آخر لا تُحرر
+    assert queue.release(["a", "b"], "w2") == 0
+    assert queue.release([], "w1") == 0
+    assert queue.release(["a"], "w1") == 1
+
+    job = queue.get("a")
+    assert job['status'] == AnalysisStatus.PENDING.value
+    assert job['attempts'] == 0
+    assert queue.release(["a"], "w1") == 0
+    assert queue.get("b")['status'] == AnalysisStatus.PROCESSING.value
+    assert sorted(queue.resumable_ids()) == ["a", "b"]
+    assert queue.claim("w3")['analysis_id'] == "a"
+
+
+def test_counts_and_get_many(queue, image):
+    queue.register_upload("uploaded", image("uploaded"))
+    queue.enqueue("pending", image("pending"), "batch")
+    queue.enqueue("running", image("running"), "interactive")
+    queue.claim("w1")
+
+    counts = queue.counts()
+    assert counts.get(AnalysisStatus.PENDING.value) == 1
+    assert counts.get(AnalysisStatus.PROCESSING.value) == 1
+
+    jobs = queue.get_many(["pending", "running", "missing"])
+    assert set(jobs) == {"pending", "running"}
+    assert queue.get("uploaded")['status'] == AnalysisStatus.UPLOADED.value
+    assert jobs["running"]['status'] == AnalysisStatus.PROCESSING.value
@@ -0,0 +1,371 @@
+# SpermAnalyzerAI - webhook outbox and dispatcher tests
+"""
+صندوق إشعارات webhook (الحجز والإيجار وتسجيل المحاولات) ومرسلها
+(التوقيع، تصنيف الأخطاء القابلة للإعادة، Retry-After، حد المحاولات)
+عبر httpx.MockTransport دون شبكة.
+"""
+import asyncio
+import json
+import socket
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from app.database import get_db_session, WebhookDelivery
+from app.services import webhooks
+from app.services.webhooks import (
+    WebhookDispatcher, WebhookOutbox, WebhookURLRejected, check_webhook_url, verify_signature
+)
+
+SECRET = "test-secret"
+URL = "https://hooks.example.com/analysis"
+
+
+@pytest.fixture
+def outbox():
+    with get_db_session() as db:
+        db.query(WebhookDelivery).delete()
+    return WebhookOutbox()
+
+
+@pytest.fixture(autouse=True)
+def resolve(monkeypatch):
+    """تحليل DNS وهمي: اسم المضيف -> عناوينه (URL عام افتراضياً)"""
+    table = {"hooks.example.com": ["93.184.216.34"]}
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in table:
+            raise socket.gaierror("unknown host")
+        return [
+            (socket.AF_INET6 if ":" in address else socket.AF_INET, socket.SOCK_STREAM, 6, "",
+             (address, port))
+            for address in table[host]
+        ]
+
+    monkeypatch.setattr(webhooks.socket, "getaddrinfo", getaddrinfo)
+    return table
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    """تشويش التأخير عند حده الأعلى ليكون التأخير محدداً"""
+    monkeypatch.setattr(webhooks.random, "uniform", lambda low, high: high)
+
+
+def _stored(delivery_id):
+    with get_db_session() as db:
+        row = db.get(WebhookDelivery, delivery_id)
+        return {
+            "status": row.status,
+            "attempts": row.attempts,
+            "next_attempt_at": row.next_attempt_at,
+            "last_error": row.last_error,
+            "delivered_at": row.delivered_at
+        }
+
+
+def _add(outbox, analysis_id="a1"):
+    return outbox.add(analysis_id, "analysis.completed", URL, {"analysis_id": analysis_id})
+
+
+def _dispatcher(outbox, **kwargs):
+    options = dict(secret_key=SECRET, max_attempts=3, backoff_base=2.0, backoff_max=60.0)
+    options.update(kwargs)
+    return WebhookDispatcher(outbox, **options)
+
+
+def _deliver(dispatcher, delivery, handler):
+    """إرسال إشعار محجوز عبر ناقل وهمي"""
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            dispatcher._client = client
+            await dispatcher._deliver(delivery)
+    asyncio.run(run())
+
+
+def _claim_one(outbox, lease_seconds=60.0):
+    claimed = outbox.claim_due(10, lease_seconds)
+    assert len(claimed) == 1
+    return claimed[0]
+
+
+def _retry_in(delivery_id, before):
+    """مدة التأجيل المسجلة بالثواني (تقريبية بدقة وقت التنفيذ)"""
+    return (_stored(delivery_id)["next_attempt_at"] - before).total_seconds()
+
+
+# ---------------------------------------------------------------------------
+# WebhookOutbox
+# ---------------------------------------------------------------------------
+
+def test_claim_due_leases_and_counts_attempt(outbox):
+    first, second = _add(outbox, "a1"), _add(outbox, "a2")
+
+    claimed = outbox.claim_due(1, 60.0)
+    assert [d["id"] for d in claimed] == [first]
+    assert claimed[0]["attempts"] == 1
+    assert claimed[0]["payload"] == {"analysis_id": "a1"}
+
+    stored = _stored(first)
+    assert stored["status"] == "pending"
+    assert stored["attempts"] == 1
+    assert stored["next_attempt_at"] > datetime.now() + timedelta(seconds=50)
+
+    # المحجوز لا يُحجز مجدداً ما دام الإيجار سارياً
+    assert [d["id"] for d in outbox.claim_due(10, 60.0)] == [second]
+    assert outbox.claim_due(10, 60.0) == []
+
+
+def test_expired_lease_is_claimed_again(outbox):
+    delivery_id = _add(outbox)
+    assert _claim_one(outbox, lease_seconds=0.0)["attempts"] == 1
+
+    # عملية انقطعت أثناء الإرسال: الإشعار يعود مستحقاً بعد انتهاء الإيجار
+    again = _claim_one(outbox, lease_seconds=60.0)
+    assert again["id"] == delivery_id
+    assert again["attempts"] == 2
+
+
+def test_record_attempt_states(outbox):
+    delivered, retried, failed = _add(outbox, "a1"), _add(outbox, "a2"), _add(outbox, "a3")
+    outbox.claim_due(10, 60.0)
+    before = datetime.now()
+
+    outbox.record_attempt(delivered, None, None)
+    outbox.record_attempt(retried, "HTTP 503", 30.0)
+    outbox.record_attempt(failed, "HTTP 404", None)
+
+    stored = _stored(delivered)
+    assert stored["status"] == "delivered"
+    assert stored["delivered_at"] is not None
+    assert stored["last_error"] is None
+
+    stored = _stored(retried)
+    assert stored["status"] == "pending"
+    assert stored["last_error"] == "HTTP 503"
+    assert 29 <= _retry_in(retried, before) <= 31
+
+    stored = _stored(failed)
+    assert stored["status"] == "failed"
+    assert stored["last_error"] == "HTTP 404"
+    assert outbox.counts() == {"delivered": 1, "pending": 1, "failed": 1}
+
+
+# ---------------------------------------------------------------------------
+# WebhookDispatcher
+# ---------------------------------------------------------------------------
+
+def test_deliver_signs_request_and_marks_delivered(outbox):
+    delivery_id = _add(outbox)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(204)
+
+    _deliver(_dispatcher(outbox), _claim_one(outbox), handler)
+
+    request = requests[0]
+    # الاتصال بالعنوان المتحقق منه مع الاسم الأصلي في Host وSNI
+    assert str(request.url) == "https://93.184.216.34/analysis"
+    assert request.headers["Host"] == "hooks.example.com"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+    assert request.headers["X-Webhook-Id"] == delivery_id
+    assert request.headers["X-Webhook-Event"] == "analysis.completed"
+    assert json.loads(request.content) == {"analysis_id": "a1"}
+    assert verify_signature(
+        SECRET, request.headers["X-Webhook-Timestamp"], request.content,
+        request.headers["X-Webhook-Signature"]
+    )
+    assert _stored(delivery_id)["status"] == "delivered"
+
+
+@pytest.mark.parametrize("status_code", [500, 502, 503, 408, 425, 429])
+def test_retryable_status_is_rescheduled(outbox, no_jitter, status_code):
+    delivery_id = _add(outbox)
+    before = datetime.now()
+
+    _deliver(_dispatcher(outbox), _claim_one(outbox), lambda request: httpx.Response(status_code))
+
+    stored = _stored(delivery_id)
+    assert stored["status"] == "pending"
+    assert stored["last_error"] == f"HTTP {status_code}"
+    # المحاولة الأولى: backoff_base ثانية
+    assert 1.5 <= _retry_in(delivery_id, before) <= 3
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 403, 404, 410, 422])
+def test_client_error_fails_permanently(outbox, status_code):
+    delivery_id = _add(outbox)
+
+    _deliver(_dispatcher(outbox), _claim_one(outbox), lambda request: httpx.Response(status_code))
+
+    stored = _stored(delivery_id)
+    assert stored["status"] == "failed"
+    assert stored["last_error"] == f"HTTP {status_code}"
+
+
+def test_network_error_is_retried(outbox, no_jitter):
+    delivery_id = _add(outbox)
+
+    def handler(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    _deliver(_dispatcher(outbox), _claim_one(outbox), handler)
+
+    stored = _stored(delivery_id)
+    assert stored["status"] == "pending"
+    assert stored["last_error"].startswith("ConnectError")
+
+
+@pytest.mark.parametrize("retry_after, expected", [
+    ("45", 45.0),     # أطول من التأخير الأسي فيُحترم
+    ("1", 2.0),       # أقصر منه فيبقى التأخير الأسي
+    ("1000", 60.0),   # لا يتجاوز backoff_max
+    ("soon", 2.0),    # قيمة غير رقمية تُتجاهل
+])
+def test_retry_after_header(outbox, no_jitter, retry_after, expected):
+    delivery_id = _add(outbox)
+    before = datetime.now()
+
+    _deliver(_dispatcher(outbox), _claim_one(outbox),
+             lambda request: httpx.Response(429, headers={"Retry-After": retry_after}))
+
+    assert _stored(delivery_id)["status"] == "pending"
+    assert expected - 0.5 <= _retry_in(delivery_id, before) <= expected + 1
+
+
+def test_max_attempts_cutoff(outbox, no_jitter):
+    delivery_id = _add(outbox)
+    dispatcher = _dispatcher(outbox, max_attempts=2)
+    failing = lambda request: httpx.Response(503)
+
+    _deliver(dispatcher, _claim_one(outbox, lease_seconds=0.0), failing)
+    assert _stored(delivery_id)["status"] == "pending"
+
+    # إعادة الاستحقاق فوراً بدل انتظار التأخير
+    with get_db_session() as db:
+        db.query(WebhookDelivery).update({WebhookDelivery.next_attempt_at: datetime.now()})
+
+    delivery = _claim_one(outbox)
+    assert delivery["attempts"] == 2
+    _deliver(dispatcher, delivery, failing)
+
+    stored = _stored(delivery_id)
+    assert stored["status"] == "failed"
+    assert stored["attempts"] == 2
+    assert outbox.claim_due(10, 60.0) == []
+
+
+def test_backoff_is_exponential_capped_and_jittered(outbox, monkeypatch):
+    dispatcher = _dispatcher(outbox, backoff_base=2.0, backoff_max=60.0)
+
+    monkeypatch.setattr(webhooks.random, "uniform", lambda low, high: high)
+    assert [dispatcher._backoff(n) for n in (1, 2, 3, 4, 5, 6, 10)] == [2, 4, 8, 16, 32, 60, 60]
+    assert dispatcher._backoff(1, retry_after=30.0) == 30.0
+    assert dispatcher._backoff(1, retry_after=600.0) == 60.0
+
+    monkeypatch.setattr(webhooks.random, "uniform", lambda low, high: low)
+    assert dispatcher._backoff(3) == 4.0
+    assert dispatcher._backoff(3, retry_after=1.0) == 4.0
+
+
+# ---------------------------------------------------------------------------
+# check_webhook_url
+# ---------------------------------------------------------------------------
+
+def test_public_webhook_url_is_accepted(resolve):
+    resolve["hooks.example.com"] = ["93.184.216.34", "2606:2800:220:1::1"]
+    resolve["93.184.216.34"] = ["93.184.216.34"]
+    assert check_webhook_url("https://hooks.example.com/x") == "https://hooks.example.com/x"
+    assert check_webhook_url("http://93.184.216.34:8080/x")
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://hooks.example.com/x",
+    "https:///x",
+    "hooks.example.com/x",
+    "http://127.0.0.1/x",
+    "http://localhost:8000/x",
+    "http://169.254.169.254/latest/meta-data",
+    "http://10.0.0.5/x",
+    "http://172.16.3.4/x",
+    "http://192.168.1.10/x",
+    "http://100.64.0.1/x",
+    "http://0.0.0.0/x",
+    "http://[::1]/x",
+    "http://[fe80::1%25eth0]/x",
+    "http://[fd00::1]/x",
+    "http://[::ffff:127.0.0.1]/x",
+    "http://224.0.0.1/x",
+    "http://unresolvable.example/x",
+    "http://mixed.example.com/x",
+])
+def test_internal_or_invalid_webhook_url_is_rejected(resolve, url):
+    resolve["localhost"] = ["127.0.0.1", "::1"]
+    # أحد عناوين الاسم داخلي يكفي للرفض
+    resolve["mixed.example.com"] = ["93.184.216.34", "10.1.2.3"]
+    for host in ("127.0.0.1", "169.254.169.254", "10.0.0.5", "172.16.3.4", "192.168.1.10",
+                 "100.64.0.1", "0.0.0.0", "::1", "fe80::1", "fd00::1", "::ffff:127.0.0.1", "224.0.0.1"):
+        resolve[host] = [host]
+    resolve["fe80::1%eth0"] = ["fe80::1%eth0"]
+
+    with pytest.raises(WebhookURLRejected):
+        check_webhook_url(url)
+
+
+def test_allowed_hosts_restrict_webhook_url(resolve):
+    allowed = ("hooks.example.com", ".partner.example")
+
+    assert check_webhook_url("https://hooks.example.com/x", allowed)
+    assert check_webhook_url("https://partner.example/x", allowed)
+    assert check_webhook_url("https://eu.partner.example/x", allowed)
+    # المضيف المدرج صراحة يُقبل ولو كان داخلياً (مستقبل في الشبكة نفسها)
+    assert check_webhook_url("http://receiver.partner.example/x", allowed)
+    for url in ("https://evil.example.com/x", "https://notpartner.example/x", "http://127.0.0.1/x"):
+        with pytest.raises(WebhookURLRejected):
+            check_webhook_url(url, allowed)
+
+
+def test_delivery_rechecks_url_and_fails_rejected_permanently(outbox, resolve):
+    delivery_id = _add(outbox)
+    # الاسم أُعيد توجيهه إلى عنوان داخلي بعد التسجيل
+    resolve["hooks.example.com"] = ["169.254.169.254"]
+    requests = []
+
+    _deliver(_dispatcher(outbox), _claim_one(outbox), lambda request: requests.append(request))
+
+    assert requests == []
+    stored = _stored(delivery_id)
+    assert stored["status"] == "failed"
+    assert "مرفوض" in stored["last_error"]
+
+
+def test_delivery_dns_failure_is_retried(outbox, resolve, no_jitter):
+    delivery_id = _add(outbox)
+    del resolve["hooks.example.com"]
+
+    _deliver(_dispatcher(outbox), _claim_one(outbox), lambda request: httpx.Response(204))
+
+    stored = _stored(delivery_id)
+    assert stored["status"] == "pending"
+    assert stored["last_error"].startswith("DNS")
+
+
+def test_delivery_to_allowed_or_default_url_is_not_pinned(outbox):
+    internal = "http://receiver.internal/hook"
+    outbox.add("a1", "analysis.completed", internal, {"analysis_id": "a1"})
+    outbox.add("a2", "analysis.completed", URL, {"analysis_id": "a2"})
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(204)
+
+    # default_url من الإعدادات، وallowed_hosts تتصل بالاسم المدرج نفسه
+    dispatcher = _dispatcher(outbox, default_url=internal, allowed_hosts=("hooks.example.com",))
+    for delivery in outbox.claim_due(10, 60.0):
+        _deliver(dispatcher, delivery, handler)
+
+    assert sorted(str(request.url) for request in requests) == [internal, URL]